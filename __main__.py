@@ -0,0 +1,122 @@
+import argparse
+import random
+import sys
+
+from .corpus_export import COMPRESSIONS, FORMATS, ExportJob, export_corpus
+
+def parse_params(pairs: list[str]) -> dict[str, str]:
+    params = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"parameter {pair!r} is not of the form name=value")
+        params[name] = value
+    return params
+
+def command_generate(args: argparse.Namespace) -> int:
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    job = ExportJob(
+        grammar_path    = args.grammar,
+        nt_name         = args.nt,
+        params          = parse_params(args.param),
+        count           = args.count,
+        seed            = seed,
+        start           = args.start,
+        out_dir         = args.out,
+        shard_size      = args.shard_size,
+        output_format   = args.format,
+        compression     = args.compress,
+        workers         = args.workers,
+    )
+    print(f">> Generating sentences {job.start} to {job.start + job.count - 1} of {job.nt_name!r} with seed {seed}", file=sys.stderr)
+    export_corpus(job)
+    return 0
+
+def command_difftest(args: argparse.Namespace) -> int:
+    from tempfile import TemporaryDirectory
+    from .differential_testing import ENGINES, file_case, run_differential, synthetic_cases
+    with TemporaryDirectory() as directory:
+        cases = [file_case(path, args.nt, parse_params(args.param)) for path in args.grammar]
+        if not cases:
+            cases = synthetic_cases(directory)
+        candidates = {name: ENGINES[name] for name in args.engine}
+        report = run_differential(cases, candidates, count=args.count, seed=args.seed, alpha=args.alpha)
+    print(report)
+    return 0 if report.passed else 1
+
+def command_bench(args: argparse.Namespace) -> int:
+    from .gram_parser import benchmark_parse, parse_file
+    from .threaded_generation import benchmark_threads
+    with open(args.grammar, "r", encoding="utf-8") as file:
+        if args.parse:
+            print(benchmark_parse(file.read()))
+            return 0
+        grammar = parse_file(file)
+    print(benchmark_threads(grammar, args.nt, parse_params(args.param), args.count, args.threads))
+    return 0
+
+def command_compile(args: argparse.Namespace) -> int:
+    from os import path
+    from .code_generation import write_module
+    from .gram_parser import parse_file
+    with open(args.grammar, "r", encoding="utf-8") as file:
+        grammar = parse_file(file)
+    out = args.out or path.splitext(args.grammar)[0] + "_gen.py"
+    write_module(grammar, out, path.basename(args.grammar))
+    print(f">> Wrote {out!r}", file=sys.stderr)
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m py_ggra", description="Tools for GGRA grammars")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="generate a sharded corpus of sentences")
+    generate.add_argument("grammar", help="path of the .ggra file")
+    generate.add_argument("--nt", default="S", help="Nonterminal to resolve (default: S)")
+    generate.add_argument("--param", action="append", default=[], metavar="NAME=VALUE", help="parameter of the Nonterminal, repeatable")
+    generate.add_argument("--count", type=int, required=True, help="number of sentences")
+    generate.add_argument("--seed", type=int, default=None, help="seed; sentence i only depends on the seed and i")
+    generate.add_argument("--start", type=int, default=0, help="index of the first sentence, a multiple of --shard-size, e.g. to resume a job")
+    generate.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    generate.add_argument("--out", required=True, help="output directory")
+    generate.add_argument("--shard-size", type=int, default=100_000, help="sentences per shard file")
+    generate.add_argument("--format", choices=list(FORMATS), default="jsonl", help="jsonl: JSON list of terminals per line; txt: terminals joined by spaces")
+    generate.add_argument("--compress", choices=list(COMPRESSIONS), default="none")
+    generate.set_defaults(run=command_generate)
+
+    difftest = commands.add_parser("difftest", help="compare the output distribution and speed of generation engines with resolve_nt")
+    difftest.add_argument("grammar", nargs="*", help="paths of .ggra files (default: the synthetic grammar library)")
+    difftest.add_argument("--nt", default="S", help="Nonterminal to resolve (default: S)")
+    difftest.add_argument("--param", action="append", default=[], metavar="NAME=VALUE", help="parameter of the Nonterminal, repeatable")
+    difftest.add_argument("--engine", action="append", choices=["tables", "optimized", "compiled", "batch"], default=None, help="candidate engine, repeatable (default: all)")
+    difftest.add_argument("--count", type=int, default=20_000, help="sentences per engine and grammar")
+    difftest.add_argument("--seed", type=int, default=0)
+    difftest.add_argument("--alpha", type=float, default=0.001, help="overall significance level")
+    difftest.set_defaults(run=command_difftest)
+
+    bench = commands.add_parser("bench", help="measure generation throughput for several numbers of threads, or parse throughput")
+    bench.add_argument("grammar", help="path of the .ggra file")
+    bench.add_argument("--nt", default="S", help="Nonterminal to resolve (default: S)")
+    bench.add_argument("--param", action="append", default=[], metavar="NAME=VALUE", help="parameter of the Nonterminal, repeatable")
+    bench.add_argument("--count", type=int, default=50_000, help="sentences per run")
+    bench.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8], help="numbers of threads to measure")
+    bench.add_argument("--parse", action="store_true", help="measure the stages of parsing the grammar instead")
+    bench.set_defaults(run=command_bench)
+
+    compile_ = commands.add_parser("compile", help="generate a standalone Python module that resolves the grammar")
+    compile_.add_argument("grammar", help="path of the .ggra file")
+    compile_.add_argument("-o", "--out", default=None, help="path of the module (default: <grammar>_gen.py)")
+    compile_.set_defaults(run=command_compile)
+    return parser
+
+def main(argv: list[str] | None = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "generate" and args.start % args.shard_size:
+        parser.error(f"--start {args.start} is not a multiple of --shard-size {args.shard_size}; resume at {args.start - args.start % args.shard_size}")
+    if args.command == "difftest" and args.engine is None:
+        args.engine = ["tables", "optimized", "compiled", "batch"]
+    return args.run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
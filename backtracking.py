@@ -0,0 +1,234 @@
+import random
+from collections import OrderedDict
+from dataclasses import dataclass
+from random import Random
+from typing import Iterator
+
+from .environments import Environment
+from .ggra_errors import GgraResolutionError, UnresolvableError
+from .helpers import separate, shuffle
+from .structures import (
+    ElementNonterminal,
+    Nt,
+    NtFile,
+    Pattern,
+    PatternBNForm,
+    PatternFrom,
+    PatternIf,
+    PatternWith,
+    SourceChoice,
+    SourceIdentifier,
+    SourceNonterminal,
+    SourceString,
+    as_grammar,
+    error_check_change_id,
+    execute_change,
+    sort_changes
+)
+
+@dataclass
+class BacktrackReport:
+    """Counts of a BacktrackingResolver, over all sentences it resolved"""
+    sentences: int = 0
+    failed_sentences: int = 0
+    backtracks: int = 0
+    """choices that were taken back because a Nonterminal below them had no derivation"""
+    dead_ends: int = 0
+    """(Nonterminal, parameters) found to have no derivation"""
+    cache_hits: int = 0
+    cache_evictions: int = 0
+    depth_cutoffs: int = 0
+    """Nonterminals not resolved because they were nested deeper than max_depth"""
+
+    def lines(self) -> list[str]:
+        return [
+            f"sentences: {self.sentences} ({self.failed_sentences} without derivation)",
+            f"backtracks: {self.backtracks} ({self.backtracks / self.sentences if self.sentences else 0:.2f} per sentence)",
+            f"dead ends: {self.dead_ends}, negative cache hits: {self.cache_hits}, evictions: {self.cache_evictions}",
+            f"depth cutoffs: {self.depth_cutoffs}",
+        ]
+
+    def __str__(self) -> str:
+        return "\n".join(self.lines())
+
+#=================================
+class BacktrackingResolver:
+    """Resolves like resolve_nt, but takes back the most recent choice when a Nonterminal below it
+    cannot be resolved, instead of failing the whole sentence.\n
+    Choices are the definition of a Nonterminal, the pattern of a 'from' block, the option of a
+    choice in 'with' (`"a" | "b" => X.p`) and the entries picked from files; each is tried in
+    random order until one works. A Nonterminal has no derivation if no definition fits its
+    parameters, no pattern fulfills its conditions or a file has no entry for them.
+    Since the parameters of a Nonterminal only depend on its parent's choices, a Nonterminal
+    without derivation for some parameters never has one: these pairs are kept in a negative
+    cache of at most cache_size entries (least recently used ones are dropped).\n
+    Recursive Nonterminals could be tried ever deeper, so derivations are at most max_depth
+    Nonterminals deep; a Nonterminal that only failed for lack of depth is not cached as a
+    dead end, but is not tried again with less depth in the same sentence.\n
+    Without dead ends the choices, and so the sentences, are those of resolve_nt with the same rng.
+    Errors in the grammar (unknown parameters or Nonterminals in 'with' and 'if') still raise."""
+    def __init__(self, nt_definitions: list[Nt], cache_size: int = 100_000, max_depth: int = 200):
+        self.grammar = as_grammar(nt_definitions)
+        self.cache_size = cache_size
+        self.max_depth = max_depth
+        self.dead: OrderedDict[tuple[str, Environment], None] = OrderedDict()
+        self.report = BacktrackReport()
+        self.depth = 0
+        self.shallow: dict[tuple[str, Environment], int] = {}
+        """per sentence: the most depth left with which a Nonterminal failed because of max_depth"""
+
+    def resolve(self, nt_name: str, params: dict[str, str], rng: Random = random) -> list[str]:
+        self.report.sentences += 1
+        self.depth = 0
+        self.shallow = {}
+        sentence = self._resolve(nt_name, params, rng)
+        if sentence is None:
+            self.report.failed_sentences += 1
+            param_names = ", ".join(sorted(params))
+            raise GgraResolutionError(
+                "Backtracking resolution",
+                [f"{nt_name}({param_names}) has no derivation for the parameters {dict(params)!r}"]
+            )
+        return sentence
+
+    #-----------------------
+    def _resolve(self, nt_name: str, params, rng) -> list[str] | None:
+        grammar = self.grammar
+        environment = grammar.environments.environment(params)
+        key = (nt_name, environment)
+        if key in self.dead:
+            self.dead.move_to_end(key)
+            self.report.cache_hits += 1
+            return None
+        depth_left = self.max_depth - self.depth
+        if depth_left <= 0 or self.shallow.get(key, -1) >= depth_left:
+            self.report.depth_cutoffs += 1
+            return None
+
+        cutoffs = self.report.depth_cutoffs
+        candidates = grammar.environments.definitions(nt_name, environment.schema)
+        self.depth += 1
+        try:
+            # the first definition is drawn like the rng.choice of resolve_nt
+            for definition in shuffle(candidates, rng):
+                if isinstance(definition, NtFile):
+                    sentence = self._resolve_file(definition, environment, rng)
+                else:
+                    sentence = self._resolve_definition(definition, environment, rng)
+                if sentence is not None:
+                    return sentence
+                self.report.backtracks += 1
+        finally:
+            self.depth -= 1
+
+        if self.report.depth_cutoffs != cutoffs:
+            # might have a deeper derivation
+            self.shallow[key] = depth_left
+            return None
+        self.report.dead_ends += 1
+        self.dead[key] = None
+        if len(self.dead) > self.cache_size:
+            self.dead.popitem(last=False)
+            self.report.cache_evictions += 1
+        return None
+
+    def _resolve_definition(self, definition: Nt, params, rng) -> list[str] | None:
+        for pattern, changes in self._patterns(definition.subpattern, params, rng):
+            for nt_config in self._configurations(pattern, changes, params, rng):
+                sentence = self._fill(pattern, nt_config, rng)
+                if sentence is not None:
+                    return sentence
+                self.report.backtracks += 1
+        return None
+
+    def _patterns(self, pattern: Pattern, params, rng) -> Iterator[tuple[list, list]]:
+        """All resolutions of the pattern, in random order; the first like pattern.resolve"""
+        if isinstance(pattern, PatternBNForm):
+            yield [element.resolve() for element in pattern.elements], []
+        elif isinstance(pattern, PatternFrom):
+            for i in shuffle(pattern.candidates(params), rng):
+                yield from self._patterns(pattern.subpatterns[i], params, rng)
+        elif isinstance(pattern, PatternIf):
+            if pattern.condition.evaluate(params):
+                yield from self._patterns(pattern.subpattern, params, rng)
+        elif isinstance(pattern, PatternWith):
+            for sub, changes in self._patterns(pattern.subpattern, params, rng):
+                yield sub, changes + pattern.changes.changes
+
+    def _configurations(self, pattern: list, changes: list, params, rng) -> Iterator[dict[str, dict[str, str]]]:
+        """All parameter configurations of the pattern's Nonterminals (see NtDefinition.configure),
+        one per combination of options of the choices in the changes"""
+        if not changes:
+            yield {}
+            return
+        nts = set(elem.name.removeprefix("~") for elem in pattern if isinstance(elem, ElementNonterminal))
+        nt_changes, constant_changes = separate(changes, lambda change: isinstance(change.source, SourceNonterminal))
+        sorted_changes = sort_changes(nt_changes)
+        nt_config = {nt_name: dict() for nt_name in nts}
+
+        def assign(i: int) -> Iterator[dict[str, dict[str, str]]]:
+            if i == len(constant_changes):
+                for change in sorted_changes:
+                    execute_change(change, nt_config)
+                yield nt_config
+                return
+            change = constant_changes[i]
+            # a choice draws its first option like Change.decided_source
+            sources = shuffle(change.source.options, rng) if isinstance(change.source, SourceChoice) else [change.source]
+            for source in sources:
+                if change.target_nt_name not in nt_config:
+                    raise UnresolvableError(f"NtDefinition.resolve # Nonterminal {change.target_nt_name} does not exist.")
+                if isinstance(source, SourceIdentifier):
+                    error_check_change_id(change, params)
+                    nt_config[change.target_nt_name][change.target_nt_param] = params[source.name]
+                elif isinstance(source, SourceString):
+                    nt_config[change.target_nt_name][change.target_nt_param] = source.content
+                yield from assign(i + 1)
+        yield from assign(0)
+
+    def _fill(self, pattern: list, nt_config: dict[str, dict[str, str]], rng) -> list[str] | None:
+        """Like fill_in_pattern; None if one of the Nonterminals has no derivation"""
+        nts_resolved = {}
+        sentence = []
+        for obj in pattern:
+            if isinstance(obj, str):
+                sentence.append(obj)
+                continue
+            resolved = nts_resolved.get(obj.name)
+            if resolved is None:
+                actual_name = obj.name.removeprefix("~")
+                resolved = self._resolve(actual_name, nt_config.get(actual_name, {}), rng)
+                if resolved is None:
+                    return None
+                if not obj.name.startswith("~"):
+                    nts_resolved[obj.name] = resolved
+            sentence.extend(resolved)
+        return sentence
+
+    def _resolve_file(self, definition: NtFile, params, rng) -> list[str] | None:
+        definition.load_once()
+        order = definition.json_content.get("order")
+        order_nochoose = [elem for elem in order if elem != "..."]
+        if set(order_nochoose) != set(params):
+            raise UnresolvableError(f"NtFile.resolve # parameters {set(params)} for NtFile {definition.name!r} do not fit parameters in file ({set(order_nochoose)})")
+        query = [specifier if specifier == "..." else params.get(specifier) for specifier in order]
+        result = next(self._query(definition.json_content.get("content"), query, rng), None)
+        if result is None:
+            return None
+        if isinstance(result, str):
+            return [result]
+        return result
+
+    def _query(self, field, query: list[str], rng) -> Iterator:
+        """All results of the query, in random order; the first like NtFile.query"""
+        if field is None:
+            return
+        if not query:
+            yield field
+            return
+        specifier, *rest = query
+        if specifier == "...":
+            for sub in shuffle(field, rng):
+                yield from self._query(sub, rest, rng)
+        else:
+            yield from self._query(field.get(specifier, None), rest, rng)
@@ -0,0 +1,206 @@
+from dataclasses import dataclass, field
+import random
+from random import Random
+
+import numpy as np
+
+from .ggra_errors import GgraResolutionError
+from .structures import (
+    ElementNonterminal,
+    ElementString,
+    Nt,
+    NtDefinition,
+    Pattern,
+    PatternBNForm,
+    PatternFrom,
+    as_grammar,
+    resolve_nt
+)
+
+# Operations of a compiled alternative, executed when rendering
+OP_TERMINAL = 0 # value: the terminal string
+OP_CHILD    = 1 # value: index of the child slot of the alternative
+OP_EXTERNAL = 2 # value: (nt_name, shared), resolved by the scalar resolve_nt
+
+#=================================
+# COMPILATION
+def plain_pattern(pattern: Pattern) -> bool:
+    """Whether the pattern only consists of choices (from) and BN patterns,
+    so that every choice is an independent uniform pick"""
+    if isinstance(pattern, PatternBNForm):
+        return True
+    if isinstance(pattern, PatternFrom):
+        return all(plain_pattern(sub) for sub in pattern.subpatterns)
+    return False
+
+def weighted_alternatives(pattern: Pattern, weight: float) -> list[tuple[float, list]]:
+    """Flattens nested PatternFroms into BN element lists with their probability"""
+    if isinstance(pattern, PatternBNForm):
+        return [(weight, pattern.elements)]
+    sub_weight = weight / len(pattern.subpatterns)
+    return [
+        alternative
+        for sub in pattern.subpatterns
+        for alternative in weighted_alternatives(sub, sub_weight)
+    ]
+
+def parameter_free_definitions(nt_definitions: list[Nt], nt_name: str) -> list[Nt]:
+    return [nt for nt in nt_definitions if nt.name == nt_name and not nt.param_names]
+
+@dataclass
+class BatchTables:
+    """Integer tables of the parameter-free region reachable from one nonterminal.\n
+    Alternative a belongs to nonterminal k iff k <= cumulative[a] - 1 < k+1,
+    so one searchsorted on `nt_id + uniform` picks alternatives for a whole frontier."""
+    nt_names: list[str]
+    cumulative: np.ndarray
+    child_start: np.ndarray
+    child_count: np.ndarray
+    child_nt: np.ndarray
+    programs: list[list[tuple[int, object]]] = field(repr=False)
+
+def compile_batch_tables(nt_definitions: list[Nt], nt_name: str) -> BatchTables | None:
+    """Compiles the parameter-free region starting at nt_name.\n
+    Returns None if nt_name itself cannot be sampled in batches."""
+    def eligible(name: str) -> bool:
+        if name not in eligibility:
+            definitions = parameter_free_definitions(nt_definitions, name)
+            eligibility[name] = bool(definitions) and all(
+                isinstance(nt, NtDefinition) and plain_pattern(nt.subpattern)
+                for nt in definitions
+            )
+        return eligibility[name]
+
+    eligibility: dict[str, bool] = {}
+    if not eligible(nt_name):
+        return None
+
+    nt_ids = {nt_name: 0}
+    nt_names = [nt_name]
+    cumulative, child_start, child_count, child_nt = [], [], [], []
+    programs = []
+
+    def nt_id(name: str) -> int:
+        if name not in nt_ids:
+            nt_ids[name] = len(nt_names)
+            nt_names.append(name)
+        return nt_ids[name]
+
+    k = 0
+    while k < len(nt_names):
+        definitions = parameter_free_definitions(nt_definitions, nt_names[k])
+        alternatives = [
+            alternative
+            for nt in definitions
+            for alternative in weighted_alternatives(nt.subpattern, 1 / len(definitions))
+        ]
+        accumulated = 0.
+        for weight, elements in alternatives:
+            accumulated += weight
+            program = []
+            slots = {} # shared (non-~) nonterminals get one slot per alternative
+            child_start.append(len(child_nt))
+            for element in elements:
+                if isinstance(element, ElementString):
+                    program.append((OP_TERMINAL, element.content))
+                    continue
+                separate = element.name.startswith("~")
+                name = element.name.removeprefix("~")
+                if not eligible(name):
+                    program.append((OP_EXTERNAL, (name, not separate)))
+                    continue
+                if separate or name not in slots:
+                    slot = len(child_nt) - child_start[-1]
+                    child_nt.append(nt_id(name))
+                    if not separate:
+                        slots[name] = slot
+                else:
+                    slot = slots[name]
+                program.append((OP_CHILD, slot))
+            child_count.append(len(child_nt) - child_start[-1])
+            cumulative.append(k + accumulated)
+            programs.append(program)
+        cumulative[-1] = k + 1. # no rounding gap to the next nonterminal
+        k += 1
+
+    return BatchTables(
+        nt_names,
+        np.array(cumulative, dtype=np.float64),
+        np.array(child_start, dtype=np.int64),
+        np.array(child_count, dtype=np.int64),
+        np.array(child_nt, dtype=np.int64),
+        programs
+    )
+
+#=================================
+# SAMPLING
+def expand_levels(tables: BatchTables, count: int, rng: np.random.Generator, max_depth: int) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Expands count derivations of nonterminal 0 level by level.\n
+    Returns the chosen alternatives of every level and where their children start in the next level."""
+    levels = []
+    frontier = np.zeros(count, dtype=np.int64)
+    while frontier.size:
+        if len(levels) == max_depth:
+            raise GgraResolutionError(
+                "Batch sampler: Expanding derivations",
+                [f"Derivations of {tables.nt_names[0]!r} exceed the maximum depth of {max_depth}", "The grammar might not terminate"]
+            )
+        alternatives = np.searchsorted(tables.cumulative, frontier + rng.random(frontier.size), side="right")
+        counts = tables.child_count[alternatives]
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        total = int(ends[-1])
+        # child i of node j sits at starts[j] + i and has the nt child_nt[child_start[alt_j] + i]
+        table_index = np.repeat(tables.child_start[alternatives] - starts, counts) + np.arange(total)
+        levels.append((alternatives, starts))
+        frontier = tables.child_nt[table_index]
+    return levels
+
+def render_levels(tables: BatchTables, levels: list[tuple[np.ndarray, np.ndarray]], nt_definitions: list[Nt], rng: Random = random) -> list[list[str]]:
+    """Turns the expanded levels into terminal lists, deepest level first.\n
+    rng makes the choices of the Nonterminals resolved by resolve_nt"""
+    below: list[list[str]] = []
+    for alternatives, starts in reversed(levels):
+        current = []
+        for alternative, start in zip(alternatives.tolist(), starts.tolist()):
+            sentence = []
+            externals = {}
+            for op, value in tables.programs[alternative]:
+                if op == OP_TERMINAL:
+                    sentence.append(value)
+                elif op == OP_CHILD:
+                    sentence.extend(below[start + value])
+                else:
+                    name, shared = value
+                    if not shared:
+                        sentence.extend(resolve_nt(nt_definitions, name, {}, rng))
+                        continue
+                    if name not in externals:
+                        externals[name] = resolve_nt(nt_definitions, name, {}, rng)
+                    sentence.extend(externals[name])
+            current.append(sentence)
+        below = current
+    return below
+
+def resolve_nt_batch(
+        nt_definitions: list[Nt],
+        nt_name: str,
+        count: int,
+        seed: int | None = None,
+        max_depth: int = 1000
+    ) -> list[list[str]]:
+    """Resolves the parameter-free Nonterminal nt_name count times at once.\n
+    All choices of a derivation level are drawn with one NumPy call; the result has the
+    same distribution as calling resolve_nt(nt_definitions, nt_name, {}) count times.
+    Nonterminals with parameters, conditions, changes or from files are resolved by resolve_nt,
+    with a random.Random seeded with seed, so the whole result is reproducible."""
+    nt_definitions = as_grammar(nt_definitions)
+    scalar_rng = Random(seed)
+    tables = compile_batch_tables(nt_definitions, nt_name)
+    if tables is None:
+        return [resolve_nt(nt_definitions, nt_name, {}, scalar_rng) for _ in range(count)]
+    if count == 0:
+        return []
+    rng = np.random.default_rng(seed)
+    levels = expand_levels(tables, count, rng, max_depth)
+    return render_levels(tables, levels, nt_definitions, scalar_rng)
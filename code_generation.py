@@ -0,0 +1,328 @@
+from os import path
+from types import ModuleType
+
+from .helpers import separate
+from .nt_files import prefetch_nt_files
+from .structures import (
+    Change,
+    Condition,
+    ConditionEq,
+    ConditionNeq,
+    ElementNonterminal,
+    ElementString,
+    ExpressionChoice,
+    ExpressionIdentifier,
+    ExpressionString,
+    Grammar,
+    Nt,
+    NtFile,
+    Pattern,
+    PatternBNForm,
+    PatternFrom,
+    PatternIf,
+    PatternWith,
+    SourceChoice,
+    SourceIdentifier,
+    SourceNonterminal,
+    SourceString,
+    as_grammar,
+    build_guard_index,
+    pattern_guard,
+    sort_changes
+)
+
+MODULE_HEADER = '''"""Generated by py_ggra from {source!r}; do not edit.\\n
+resolve_nt(nt_name, params, rng) resolves a Nonterminal of the grammar like py_ggra.resolve_nt
+and makes the same random choices with the same rng. Needs nothing but the standard library."""
+import random
+
+class UnresolvableError(Exception):
+    """No fitting definition, pattern, parameter or file entry (like py_ggra.ggra_errors.UnresolvableError)"""
+
+def _unknown_identifier(name):
+    raise UnresolvableError(f"Identifier evaluation # identifier {{name!r}} unknown!")
+
+def _unknown_parameter(name):
+    raise UnresolvableError(f"NtDefinition.resolve # Parameter {{name!r}} does not exist.")
+
+def _no_definition(nt_name, param_names):
+    raise UnresolvableError(f"resolve_nt # There exists no Nonterminal Definition that fits {{nt_name}}({{', '.join(param_names)}}).")
+
+def _query(field, query, rng):
+    for specifier in query:
+        if specifier is None:
+            field = rng.choice(field)
+        else:
+            field = field.get(specifier, None)
+        if field is None:
+            return None
+    return field
+'''
+
+MODULE_FOOTER = '''
+def resolve_nt(nt_name, params, rng=random):
+    """Resolves nt_name to a list of terminals"""
+    param_names = tuple(sorted(params))
+    candidates = _DEFINITIONS.get((nt_name, param_names))
+    if not candidates:
+        _no_definition(nt_name, param_names)
+    return rng.choice(candidates)(dict(params), rng)
+'''
+
+#=================================
+class ModuleWriter:
+    """Source code of a module with one function per Nonterminal Definition.\n
+    A definition function first picks the pattern: 'from' blocks become tuples of alternatives
+    drawn like helpers.shuffle, conditions become inline comparisons. Every pattern of the
+    definition has its own function that executes the changes into parameter dicts and calls
+    the definitions of its Nonterminals directly (their candidates are known when compiling)."""
+    def __init__(self, grammar: Grammar):
+        self.grammar = grammar
+        self.functions: list[str] = []
+        self.tables: list[str] = []
+        self.def_names = {id(nt): f"_d{i}" for i, nt in enumerate(grammar)}
+        self.candidate_tables: dict[tuple[str, tuple[str, ...]], str] = {}
+        self.count = 0
+
+    def new_name(self, prefix: str) -> str:
+        self.count += 1
+        return f"{prefix}{self.count}"
+
+    def table(self, name: str, items: list[str]):
+        self.tables.append(f"{name} = ({''.join(item + ', ' for item in items)})")
+
+    #-----------------------
+    def call(self, nt_name: str, param_names: tuple[str, ...], params_code: str) -> str:
+        """Code resolving nt_name with params of the given names, like resolve_nt"""
+        key = (nt_name, tuple(sorted(param_names)))
+        table = self.candidate_tables.get(key)
+        if table is None:
+            candidates = [self.def_names[id(nt)] for nt in self.grammar if nt.name == nt_name and nt.param_names == set(param_names)]
+            if not candidates:
+                return f"_no_definition({nt_name!r}, {key[1]!r})"
+            table = self.candidate_tables[key] = f"_C{len(self.candidate_tables)}"
+            self.table(table, candidates)
+        return f"rng.choice({table})({params_code}, rng)"
+
+    def value(self, part: Condition, param_names: set[str]) -> str:
+        """Code evaluating like part.evaluate(params)"""
+        match part:
+            case ExpressionIdentifier(name):
+                return f"params[{name!r}]" if name in param_names else f"_unknown_identifier({name!r})"
+            case ExpressionString(content):
+                return repr(content)
+            case ExpressionChoice():
+                return "True" # a generator, which is always true
+            case ConditionEq() | ConditionNeq():
+                return f"({self.condition(part, param_names)})"
+        raise TypeError(f"ModuleWriter.value # cannot compile {part!r}")
+
+    def condition(self, condition: Condition, param_names: set[str]) -> str:
+        if isinstance(condition, (ConditionEq, ConditionNeq)):
+            options = lambda part: [self.value(option, param_names) for option in part.options] if isinstance(part, ExpressionChoice) else [self.value(part, param_names)]
+            operator = "==" if isinstance(condition, ConditionEq) else "!="
+            # evaluated lazily in the order of ConditionEq.evaluate
+            pairs = [f"{first} {operator} {second}" for first in options(condition.first) for second in options(condition.second)]
+            return " or ".join(pairs) or "False"
+        return self.value(condition, param_names)
+
+    #-----------------------
+    def chooser(self, pattern: Pattern, changes: list[Change], nt: Nt) -> str:
+        """Expression giving the pattern function the pattern resolves to, or None"""
+        match pattern:
+            case PatternBNForm():
+                return self.pattern_function(pattern, changes, nt)
+            case PatternIf(subpattern, condition):
+                return f"({self.chooser(subpattern, changes, nt)} if {self.condition(condition, nt.param_names)} else None)"
+            case PatternWith(subpattern, with_changes):
+                # changes of inner patterns come first, see PatternWith.resolve
+                return self.chooser(subpattern, with_changes.changes + changes, nt)
+            case PatternFrom(subpatterns):
+                return self.from_function(subpatterns, changes, nt)
+        raise TypeError(f"ModuleWriter.chooser # cannot compile {pattern!r}")
+
+    def from_function(self, subpatterns: list[Pattern], changes: list[Change], nt: Nt) -> str:
+        name = self.new_name("_f")
+        alternatives = [self.chooser(sub, changes, nt) for sub in subpatterns]
+        count = len(alternatives)
+        if all(map(unconditional, subpatterns)):
+            # the first drawn alternative always fits
+            self.table(f"{name}_alternatives", alternatives)
+            self.functions.append(
+                f"def {name}(params, rng):\n"
+                f"    return {name}_alternatives[rng.randint(0, {count - 1})]\n"
+            )
+            return f"{name}(params, rng)"
+        self.table(f"{name}_alternatives", [f"lambda params, rng: {alternative}" for alternative in alternatives])
+        index = build_guard_index([pattern_guard(sub) for sub in subpatterns])
+        if index is not None:
+            # only the alternatives whose guard fits the value, like PatternFrom.candidates
+            by_value = {value: list(indices) for value, indices in sorted(index.by_value.items())}
+            self.tables.append(f"{name}_by_value = {by_value!r}")
+            self.functions.append(
+                f"def {name}(params, rng):\n"
+                f"    value = params.get({index.param!r})\n"
+                f"    remaining = {list(range(count))!r} if value is None else {name}_by_value.get(value, {list(index.others)!r}).copy()\n"
+                f"    for remaining_count in range(len(remaining), 0, -1):\n"
+                f"        chosen = {name}_alternatives[remaining.pop(rng.randint(0, remaining_count - 1))](params, rng)\n"
+                f"        if chosen is not None:\n"
+                f"            return chosen\n"
+                f"    return None\n"
+            )
+            return f"{name}(params, rng)"
+        self.functions.append(
+            f"def {name}(params, rng):\n"
+            f"    remaining = {list(range(count))!r}\n"
+            f"    for remaining_count in range({count}, 0, -1):\n"
+            f"        chosen = {name}_alternatives[remaining.pop(rng.randint(0, remaining_count - 1))](params, rng)\n"
+            f"        if chosen is not None:\n"
+            f"            return chosen\n"
+            f"    return None\n"
+        )
+        return f"{name}(params, rng)"
+
+    def pattern_function(self, pattern: PatternBNForm, changes: list[Change], nt: Nt) -> str:
+        """Function resolving the Nonterminals of the pattern after executing the changes"""
+        name = self.new_name("_p")
+        body = self.pattern_body(pattern, changes, nt)
+        self.functions.append(f"def {name}(params, rng):\n" + "".join(f"    {line}\n" for line in body))
+        return name
+
+    def pattern_body(self, pattern: PatternBNForm, changes: list[Change], nt: Nt) -> list[str]:
+        nts = {element.name.removeprefix("~") for element in pattern.elements if isinstance(element, ElementNonterminal)}
+        nt_params = {nt_name: f"p_{i}" for i, nt_name in enumerate(sorted(nts))}
+        assigned = {nt_name: set() for nt_name in nts}
+        body = []
+        if changes:
+            body += [f"{variable} = {{}}" for variable in nt_params.values()]
+            nt_changes, constant_changes = separate(changes, lambda change: isinstance(change.source, SourceNonterminal))
+            for change in constant_changes:
+                source = self.source(change, nt.param_names)
+                if change.target_nt_name not in nts:
+                    return body + [source, f"raise UnresolvableError({f'NtDefinition.resolve # Nonterminal {change.target_nt_name} does not exist.'!r})"]
+                body.append(f"{nt_params[change.target_nt_name]}[{change.target_nt_param!r}] = {source}")
+                assigned[change.target_nt_name].add(change.target_nt_param)
+            for change in sort_changes(nt_changes):
+                source_name, source_param = change.source.nt_name, change.source.nt_param
+                if source_name not in nts or source_param not in assigned[source_name]:
+                    return body + [f"raise KeyError({source_name if source_name not in nts else source_param!r})"]
+                if change.target_nt_name not in nts:
+                    return body + [f"raise KeyError({change.target_nt_name!r})"]
+                body.append(f"{nt_params[change.target_nt_name]}[{change.target_nt_param!r}] = {nt_params[source_name]}[{source_param!r}]")
+                assigned[change.target_nt_name].add(change.target_nt_param)
+
+        parts = []
+        resolved = {}
+        names = [element.name for element in pattern.elements if isinstance(element, ElementNonterminal)]
+        for element in pattern.elements:
+            if isinstance(element, ElementString):
+                parts.append(repr(element.content))
+                continue
+            actual_name = element.name.removeprefix("~")
+            params_code = nt_params[actual_name] if changes else "{}"
+            call = self.call(actual_name, tuple(assigned[actual_name]), params_code)
+            if element.name.startswith("~") or names.count(element.name) == 1:
+                parts.append(f"*{call}")
+            elif element.name in resolved:
+                parts.append(f"*{resolved[element.name]}")
+            else:
+                resolved[element.name] = f"r_{len(resolved)}"
+                parts.append(f"*({resolved[element.name]} := {call})")
+        return body + [f"return [{', '.join(parts)}]"]
+
+    def source(self, change: Change, param_names: set[str]) -> str:
+        """Code of the value a constant change assigns"""
+        def value(source) -> str:
+            match source:
+                case SourceString(content):
+                    return repr(content)
+                case SourceIdentifier(name):
+                    return f"params[{name!r}]" if name in param_names else f"_unknown_parameter({name!r})"
+            raise TypeError(f"ModuleWriter.source # cannot compile {source!r}")
+        if not isinstance(change.source, SourceChoice):
+            return value(change.source)
+        options = [value(option) for option in change.source.options]
+        if all(not option.startswith("_unknown") for option in options):
+            return f"rng.choice(({''.join(option + ', ' for option in options)}))"
+        # unknown parameters only fail when they are chosen
+        return f"rng.choice(({''.join(f'lambda: {option}, ' for option in options)}))()"
+
+    #-----------------------
+    def definition(self, nt: Nt):
+        name = self.def_names[id(nt)]
+        header = f"def {name}(params, rng):\n    # {nt.name}({', '.join(sorted(nt.param_names))})\n"
+        if isinstance(nt, NtFile):
+            self.functions.append(header + "".join(f"    {line}\n" for line in self.file_body(nt)))
+            return
+        if isinstance(nt.subpattern, PatternBNForm):
+            self.functions.append(header + "".join(f"    {line}\n" for line in self.pattern_body(nt.subpattern, [], nt)))
+            return
+        chooser = self.chooser(nt.subpattern, [], nt)
+        if chooser.isidentifier():
+            # always the same pattern
+            self.functions.append(header + f"    return {chooser}(params, rng)\n")
+            return
+        self.functions.append(
+            header +
+            f"    chosen = {chooser}\n"
+            f"    if chosen is None:\n"
+            f"        raise UnresolvableError({f'NtDefinition.resolve # unresolvable subpattern for Nonterminal {nt.name!r}'!r})\n"
+            f"    return chosen(params, rng)\n"
+        )
+
+    def file_body(self, nt: NtFile) -> list[str]:
+        order = nt.json_content.get("order")
+        order_nochoose = [specifier for specifier in order if specifier != "..."]
+        if set(order_nochoose) != nt.param_names:
+            message = f"NtFile.resolve # parameters {{set(params)}} for NtFile {nt.name!r} do not fit parameters in file ({set(order_nochoose)})"
+            return [f"raise UnresolvableError(f{message!r})"]
+        content = self.new_name("_file")
+        self.tables.append(f"{content} = {nt.json_content.get('content')!r}")
+        query = ", ".join("None" if specifier == "..." else f"params[{specifier!r}]" for specifier in order)
+        no_result = f"NtFile.resolve # no result for params Environment({{dict(sorted(params.items()))!r}}) in Nonterminal from file {nt.name!r}"
+        return [
+            f"result = _query({content}, ({query}{',' if len(order) == 1 else ''}), rng)",
+            f"if result is None:",
+            f"    raise UnresolvableError(f{no_result!r})",
+            f"return [result] if isinstance(result, str) else list(result)",
+        ]
+
+    def module(self, source: str) -> str:
+        for nt in self.grammar:
+            self.definition(nt)
+        definitions = {}
+        for nt in self.grammar:
+            definitions.setdefault((nt.name, tuple(sorted(nt.param_names))), []).append(self.def_names[id(nt)])
+        entries = "".join(f"    {key!r}: ({', '.join(names)},),\n" for key, names in definitions.items())
+        return "\n".join([
+            MODULE_HEADER.format(source=source),
+            "\n".join(self.functions),
+            "#=================================",
+            *self.tables,
+            f"_DEFINITIONS = {{\n{entries}}}",
+            MODULE_FOOTER,
+        ])
+
+def unconditional(pattern: Pattern) -> bool:
+    if isinstance(pattern, PatternWith):
+        return unconditional(pattern.subpattern)
+    return isinstance(pattern, PatternBNForm)
+
+#=================================
+def compile_grammar(nt_definitions: list[Nt], source: str = "") -> str:
+    """Source code of a standalone module that resolves the grammar without py_ggra (see ModuleWriter).\n
+    The contents of all NtFiles are embedded; raises GgraFileError if one of them cannot be used."""
+    grammar = as_grammar(nt_definitions)
+    prefetch_nt_files(grammar)
+    return ModuleWriter(grammar).module(source)
+
+def write_module(nt_definitions: list[Nt], filename: str, source: str = ""):
+    with open(filename, "w", encoding="utf-8") as doc:
+        doc.write(compile_grammar(nt_definitions, source or path.basename(filename)))
+
+def compiled_module(nt_definitions: list[Nt], name: str = "ggra_compiled") -> ModuleType:
+    """The module of compile_grammar, without writing it to a file"""
+    module = ModuleType(name)
+    exec(compile(compile_grammar(nt_definitions, name), f"<{name}>", "exec"), module.__dict__)
+    return module
+
@@ -0,0 +1,163 @@
+import random
+from random import Random
+
+from .ggra_errors import GgraResolutionError
+from .grammar_graph import Expansion, GrammarGraph, State
+from .structures import Nt
+
+class Unsatisfiable(Exception):
+    """The chosen expansions cannot meet the constraint anymore"""
+
+#=================================
+class TerminalIndex:
+    """Which terminals each state reachable from the roots can produce,
+    which terminals its output can start with and whether it can be empty.\n
+    Only expansions that resolve without error are taken into account."""
+    def __init__(self, graph: GrammarGraph, roots: list[State]):
+        self.graph      = graph
+        self.states     = graph.reachable(roots)
+        productive      = graph.productive(roots)
+        self.expansions: dict[State, list[Expansion]] = {
+            state: [
+                expansion for expansion in graph.expansions(state)
+                if all(child in productive for child in expansion.children)
+            ]
+            for state in self.states
+        }
+        self.terminals: dict[State, set[str]] = {state: set() for state in self.states}
+        self.first: dict[State, set[str]] = {state: set() for state in self.states}
+        self.nullable: set[State] = set()
+        graph.fixpoint(self.states, self._update_nullable)
+        graph.fixpoint(self.states, self._update_terminals)
+
+    def _update_nullable(self, state: State) -> bool:
+        if state in self.nullable:
+            return False
+        if any(self.expansion_nullable(expansion) for expansion in self.expansions[state]):
+            self.nullable.add(state)
+            return True
+        return False
+
+    def _update_terminals(self, state: State) -> bool:
+        terminals, first = set(), set()
+        for expansion in self.expansions[state]:
+            terminals.update(expansion.terminals())
+            for child in expansion.children:
+                terminals |= self.terminals[child]
+            first |= self.expansion_first(expansion)
+        changed = terminals != self.terminals[state] or first != self.first[state]
+        self.terminals[state], self.first[state] = terminals, first
+        return changed
+
+    def expansion_nullable(self, expansion: Expansion) -> bool:
+        return all(
+            not isinstance(item, str) and expansion.children[item] in self.nullable
+            for item in expansion.items
+        )
+
+    def expansion_first(self, expansion: Expansion) -> set[str]:
+        first = set()
+        for item in expansion.items:
+            if isinstance(item, str):
+                first.add(item)
+                return first
+            child = expansion.children[item]
+            first |= self.first[child]
+            if child not in self.nullable:
+                return first
+        return first
+
+    def can_contain(self, expansion: Expansion, terminal: str) -> bool:
+        return terminal in expansion.items or any(terminal in self.terminals[child] for child in expansion.children)
+
+    def can_start(self, expansion: Expansion, terminal: str) -> bool:
+        return self.expansion_nullable(expansion) or terminal in self.expansion_first(expansion)
+
+#=================================
+def match_prefix(terminals: list[str], prefix: tuple[str, ...]) -> tuple[str, ...] | None:
+    """Remaining prefix after terminals, None if they contradict it"""
+    matched = min(len(terminals), len(prefix))
+    if tuple(terminals[:matched]) != prefix[:matched]:
+        return None
+    return prefix[matched:]
+
+class ConstrainedGenerator:
+    """Resolves a Nonterminal so that the output contains a terminal and/or starts with a prefix.\n
+    Every choice is restricted to expansions that can still meet the constraints (see TerminalIndex)
+    and otherwise made with the probabilities of resolve_nt. The result is therefore not exactly
+    distributed like rejection sampling, but needs only a few attempts per sentence."""
+    def __init__(self, nt_definitions: list[Nt], nt_name: str, params: dict[str, str]):
+        self.graph  = GrammarGraph(nt_definitions)
+        self.root   = self.graph.state(nt_name, params)
+        self.index  = TerminalIndex(self.graph, [self.root])
+
+    def generate(
+            self,
+            contains: str | None = None,
+            prefix: list[str] | None = None,
+            max_attempts: int = 1000,
+            rng: Random = random
+        ) -> list[str]:
+        prefix = tuple(prefix or ())
+        for _ in range(max_attempts):
+            try:
+                sentence, remaining = self._resolve(self.root, contains, prefix, rng)
+            except Unsatisfiable:
+                continue
+            if not remaining and (contains is None or contains in sentence):
+                return sentence
+        raise GgraResolutionError(
+            "Constrained generation",
+            [f"No sentence of {self.root[0]!r} fulfilling the constraints found in {max_attempts} attempts",
+             f"contains: {contains!r}, prefix: {list(prefix)!r}"]
+        )
+
+    def _resolve(self, state: State, contains: str | None, prefix: tuple[str, ...], rng) -> tuple[list[str], tuple[str, ...]]:
+        """Resolves the state, which has to contain `contains` (if not None)
+        and continue the prefix; returns the terminals and the rest of the prefix"""
+        expansions = self.index.expansions[state]
+        if contains is not None:
+            expansions = [e for e in expansions if self.index.can_contain(e, contains)]
+        if prefix:
+            expansions = [e for e in expansions if self.index.can_start(e, prefix[0])]
+        if not expansions:
+            raise Unsatisfiable()
+        expansion = rng.choices(expansions, [e.probability for e in expansions])[0]
+
+        carrier = None
+        if contains is not None and contains not in expansion.items:
+            carrier = rng.choice([
+                slot for slot, child in enumerate(expansion.children)
+                if contains in self.index.terminals[child]
+            ])
+
+        terminals: list[str] = []
+        resolved: dict[int, list[str]] = {}
+        for item in expansion.items:
+            if isinstance(item, str):
+                part = [item]
+            elif item in resolved:
+                part = resolved[item]
+            else:
+                part, prefix = self._resolve(expansion.children[item], contains if item == carrier else None, prefix, rng)
+                resolved[item] = part
+                terminals.extend(part)
+                continue
+            prefix = match_prefix(part, prefix)
+            if prefix is None:
+                raise Unsatisfiable()
+            terminals.extend(part)
+        return terminals, prefix
+
+def generate_constrained(
+        nt_definitions: list[Nt],
+        nt_name: str,
+        params: dict[str, str],
+        contains: str | None = None,
+        prefix: list[str] | None = None,
+        max_attempts: int = 1000,
+        rng: Random = random
+    ) -> list[str]:
+    """Resolves nt_name to a sentence that contains the terminal `contains` and starts with `prefix`.\n
+    Builds the indexes on every call; use ConstrainedGenerator for many sentences."""
+    return ConstrainedGenerator(nt_definitions, nt_name, params).generate(contains, prefix, max_attempts, rng)
@@ -0,0 +1,124 @@
+import bz2
+import gzip
+import json
+import lzma
+import os
+import sys
+from dataclasses import dataclass
+from multiprocessing import Pool
+from time import perf_counter
+from typing import Callable, Iterator
+
+from .gram_parser import parse_file
+from .seeding import resolve_nt_range
+from .structures import Grammar
+
+COMPRESSIONS: dict[str, tuple[str, Callable]] = {
+    "none": ("", open),
+    "gzip": (".gz", gzip.open),
+    "bz2":  (".bz2", bz2.open),
+    "lzma": (".xz", lzma.open),
+}
+
+FORMATS: dict[str, tuple[str, Callable[[list[str]], str]]] = {
+    "jsonl": (".jsonl", lambda sentence: json.dumps(sentence, ensure_ascii=False)),
+    "txt":   (".txt", lambda sentence: " ".join(sentence)),
+}
+
+@dataclass
+class ExportJob:
+    grammar_path: str
+    nt_name: str
+    params: dict[str, str]
+    count: int
+    seed: int
+    out_dir: str
+    start: int = 0
+    """index of the first sentence in the stream of the seed; a multiple of shard_size"""
+    shard_size: int = 100_000
+    output_format: str = "jsonl"
+    compression: str = "none"
+    workers: int = 1
+    buffer_lines: int = 10_000
+
+    def __post_init__(self):
+        if self.start % self.shard_size:
+            # the shards would overlap the ones of an export with the same shard_size
+            raise ValueError(
+                f"ExportJob # start {self.start} is not a multiple of shard_size {self.shard_size}; "
+                f"resume at {self.start - self.start % self.shard_size} or use another shard_size"
+            )
+
+    def shards(self) -> Iterator[tuple[int, int]]:
+        """(shard index, sentence count) of all shards"""
+        for shard, start in enumerate(range(0, self.count, self.shard_size)):
+            yield shard, min(self.shard_size, self.count - start)
+
+    def shard_start(self, shard: int) -> int:
+        """Stream index of the first sentence of a shard"""
+        return self.start + shard * self.shard_size
+
+    def shard_path(self, shard: int) -> str:
+        """Named by the stream index of the first sentence, so shards of a resumed export
+        (another start) do not overwrite the ones already written"""
+        extension = FORMATS[self.output_format][0] + COMPRESSIONS[self.compression][0]
+        return os.path.join(self.out_dir, f"shard-{self.shard_start(shard):010d}{extension}")
+
+#=================================
+# Worker side
+_worker_grammar: Grammar | None = None
+
+def load_grammar(grammar_path: str):
+    global _worker_grammar
+    with open(grammar_path, "r", encoding="utf-8") as file:
+        _worker_grammar = parse_file(file)
+
+def export_shard(job: ExportJob, shard: int, count: int) -> tuple[int, int, str]:
+    """Writes one shard with buffered writes; returns shard index, sentence count and path"""
+    to_line = FORMATS[job.output_format][1]
+    opener  = COMPRESSIONS[job.compression][1]
+    path    = job.shard_path(shard)
+    with opener(path, "wb") as doc:
+        buffer = []
+        first = job.shard_start(shard)
+        for sentence in resolve_nt_range(_worker_grammar, job.nt_name, job.params, job.seed, first, first + count):
+            buffer.append(to_line(sentence))
+            if len(buffer) == job.buffer_lines:
+                doc.write(("\n".join(buffer) + "\n").encode("utf-8"))
+                buffer = []
+        if buffer:
+            doc.write(("\n".join(buffer) + "\n").encode("utf-8"))
+    return shard, count, path
+
+def _export_shard_task(task: tuple[ExportJob, int, int]) -> tuple[int, int, str]:
+    return export_shard(*task)
+
+#=================================
+def export_corpus(job: ExportJob, progress = sys.stderr) -> int:
+    """Generates job.count sentences into shards of job.out_dir, using job.workers processes.\n
+    Sentence i of the output only depends on the grammar, the seed and job.start + i
+    (see seeding.sentence_rng), so a part of a corpus can be generated again with start and count.
+    Returns the number of written sentences."""
+    os.makedirs(job.out_dir, exist_ok=True)
+    tasks = [(job, shard, count) for shard, count in job.shards()]
+    start = perf_counter()
+    written = 0
+
+    def report(done: int, shard: int, path: str):
+        elapsed = perf_counter() - start
+        rate = written / elapsed if elapsed > 0 else 0.
+        print(f">> [{done}/{len(tasks)}] {path}: {written} sentences, {rate:.0f} sentences/s", file=progress)
+
+    if job.workers <= 1:
+        load_grammar(job.grammar_path)
+        for done, task in enumerate(tasks, 1):
+            shard, count, path = _export_shard_task(task)
+            written += count
+            report(done, shard, path)
+        return written
+
+    with Pool(job.workers, initializer=load_grammar, initargs=(job.grammar_path,)) as pool:
+        for done, (shard, count, path) in enumerate(pool.imap_unordered(_export_shard_task, tasks), 1):
+            written += count
+            report(done, shard, path)
+    return written
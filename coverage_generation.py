@@ -0,0 +1,216 @@
+from dataclasses import dataclass, field
+from heapq import heapify, heapreplace
+from math import inf
+
+from .constrained_generation import TerminalIndex
+from .grammar_graph import Expansion, GrammarGraph, State
+from .structures import (
+    ElementNonterminal,
+    Nt,
+    NtDefinition,
+    NtFile,
+    Pattern,
+    PatternBNForm,
+    PatternFrom,
+    PatternIf,
+    PatternWith
+)
+
+#=================================
+# Coverage targets
+def pattern_summary(pattern: Pattern) -> str:
+    if isinstance(pattern, PatternBNForm):
+        return " ".join(
+            f"<{elem.name}>" if isinstance(elem, ElementNonterminal) else repr(elem.content)
+            for elem in pattern.elements
+        ) or "<>"
+    if isinstance(pattern, (PatternIf, PatternWith)):
+        return pattern_summary(pattern.subpattern)
+    return "from: ..."
+
+def coverage_targets(nt_definitions: list[Nt]) -> dict[tuple, str]:
+    """All alternatives of 'from' blocks, 'if' branches and file entries of the grammar,
+    keyed like the traces of GrammarGraph expansions, with a description"""
+    targets = {}
+    def walk(pattern: Pattern, nt_name: str):
+        if isinstance(pattern, PatternFrom):
+            for i, sub in enumerate(pattern.subpatterns):
+                targets[("from", id(pattern), i)] = f"{nt_name}: alternative {i+1} ({pattern_summary(sub)})"
+                walk(sub, nt_name)
+        elif isinstance(pattern, PatternIf):
+            targets[("if", id(pattern))] = f"{nt_name}: 'if' branch ({pattern_summary(pattern.subpattern)})"
+            walk(pattern.subpattern, nt_name)
+        elif isinstance(pattern, PatternWith):
+            walk(pattern.subpattern, nt_name)
+
+    for nt in nt_definitions:
+        if isinstance(nt, NtDefinition):
+            walk(nt.subpattern, nt.name)
+        elif isinstance(nt, NtFile):
+            nt.load_once()
+            order = nt.json_content.get("order", [])
+            for json_path, leaf in file_leaves(nt.json_content.get("content"), order):
+                targets[("file", nt.filename, json_path)] = f"{nt.filename}: entry {list(json_path)} ({leaf!r})"
+    return targets
+
+def file_leaves(field, order: list[str], json_path: tuple = ()):
+    """(path, leaf) of all entries of a file content, following the levels given by order"""
+    depth = len(json_path)
+    if depth == len(order):
+        yield json_path, field
+    elif order[depth] == "..." and isinstance(field, list):
+        for i, sub in enumerate(field):
+            yield from file_leaves(sub, order, json_path + (i,))
+    elif order[depth] != "..." and isinstance(field, dict):
+        for key, sub in field.items():
+            yield from file_leaves(sub, order, json_path + (key,))
+
+#=================================
+@dataclass
+class CoverageResult:
+    sentences: list[list[str]]
+    covered: int
+    coverable: int
+    total: int
+    uncovered: list[str] = field(default_factory=list)
+    """coverable targets no sentence used (generation got stuck or max_sentences was reached)"""
+    unreachable: list[str] = field(default_factory=list)
+    """targets that no resolution of the Nonterminal can use"""
+
+class CoverageGenerator:
+    """Generates sentences until every alternative, 'if' branch and file entry that can be used
+    is used at least once.\n
+    Every choice prefers expansions that cover the most new targets themselves, then those
+    that lead to uncovered targets (precomputed reachability), then the one with the
+    shortest completion. Targets are kept as bits of Python ints."""
+    def __init__(self, nt_definitions: list[Nt], nt_name: str, params: dict[str, str]):
+        graph       = GrammarGraph(nt_definitions)
+        self.root   = graph.state(nt_name, params)
+        self.index  = TerminalIndex(graph, [self.root])
+        self.targets = coverage_targets(graph.grammar)
+
+        self.bits: dict[tuple, int] = {}
+        for state in self.index.states:
+            for expansion in self.index.expansions[state]:
+                for key in expansion.trace:
+                    self.bits.setdefault(key, len(self.bits))
+        self.masks: dict[State, list[int]] = {
+            state: [self._mask(expansion) for expansion in self.index.expansions[state]]
+            for state in self.index.states
+        }
+        self.reach: dict[State, int] = {state: 0 for state in self.index.states}
+        self.cost: dict[State, float] = {state: inf for state in self.index.states}
+        graph.fixpoint(self.index.states, self._update_reach)
+        graph.fixpoint(self.index.states, self._update_cost)
+        self.uncovered = (1 << len(self.bits)) - 1
+
+        self.child_reach: dict[State, list[int]] = {}
+        self.expansion_costs: dict[State, list[float]] = {}
+        self.shortest: dict[State, int] = {}
+        for state in self.index.states:
+            expansions = self.index.expansions[state]
+            self.child_reach[state] = [self._child_reach(expansion) for expansion in expansions]
+            self.expansion_costs[state] = costs = [self.expansion_cost(expansion) for expansion in expansions]
+            self.shortest[state] = min(range(len(costs)), key=costs.__getitem__, default=None)
+        self.heaps: dict[State, list[tuple]] = {}
+
+    def _mask(self, expansion: Expansion) -> int:
+        mask = 0
+        for key in expansion.trace:
+            mask |= 1 << self.bits[key]
+        return mask
+
+    def _update_reach(self, state: State) -> bool:
+        reach = 0
+        for expansion, mask in zip(self.index.expansions[state], self.masks[state]):
+            reach |= mask
+            for child in expansion.children:
+                reach |= self.reach[child]
+        changed = reach != self.reach[state]
+        self.reach[state] = reach
+        return changed
+
+    def _child_reach(self, expansion: Expansion) -> int:
+        reach = 0
+        for child in expansion.children:
+            reach |= self.reach[child]
+        return reach
+
+    def expansion_cost(self, expansion: Expansion) -> float:
+        """Number of terminals and expansions of the shortest completion"""
+        return 1 + sum(isinstance(item, str) for item in expansion.items) + sum(self.cost[child] for child in expansion.children)
+
+    def _update_cost(self, state: State) -> bool:
+        cost = min((self.expansion_cost(expansion) for expansion in self.index.expansions[state]), default=inf)
+        if cost < self.cost[state]:
+            self.cost[state] = cost
+            return True
+        return False
+
+    #-----------------------
+    def _priority(self, state: State, i: int) -> tuple:
+        """Smaller is better; only gets larger while targets are covered"""
+        own_new = (self.masks[state][i] & self.uncovered).bit_count()
+        leads_to = bool(self.child_reach[state][i] & self.uncovered)
+        return -own_new, -leads_to, self.expansion_costs[state][i], i
+
+    def _choose(self, state: State, path: set[State]) -> int:
+        """Index of the expansion to take; lazy greedy: priorities in the heap
+        are bounds, only the top one gets recomputed"""
+        if state not in path:
+            heap = self.heaps.get(state)
+            if heap is None:
+                heap = [self._priority(state, i) for i in range(len(self.index.expansions[state]))]
+                heapify(heap)
+                self.heaps[state] = heap
+            while heap:
+                priority = self._priority(state, heap[0][3])
+                if priority == heap[0]:
+                    break
+                heapreplace(heap, priority)
+            if heap and heap[0][:2] != (0, 0):
+                return heap[0][3]
+        # nothing left to cover here, or a cycle: finish as fast as possible
+        return self.shortest[state]
+
+    def _resolve(self, state: State, path: set[State]) -> list[str]:
+        i = self._choose(state, path)
+        expansion = self.index.expansions[state][i]
+        self.uncovered &= ~self.masks[state][i]
+        entered = state not in path
+        path.add(state)
+        terminals, resolved = [], {}
+        for item in expansion.items:
+            if isinstance(item, str):
+                terminals.append(item)
+                continue
+            if item not in resolved:
+                resolved[item] = self._resolve(expansion.children[item], path)
+            terminals.extend(resolved[item])
+        if entered:
+            path.discard(state)
+        return terminals
+
+    def generate(self, max_sentences: int | None = None) -> CoverageResult:
+        sentences = []
+        while self.reach[self.root] & self.uncovered:
+            if max_sentences is not None and len(sentences) == max_sentences:
+                break
+            before = self.uncovered
+            sentences.append(self._resolve(self.root, set()))
+            if self.uncovered == before:
+                break # no progress possible
+        keys = list(self.bits)
+        return CoverageResult(
+            sentences,
+            covered     = len(keys) - self.uncovered.bit_count(),
+            coverable   = len(keys),
+            total       = len(self.targets),
+            uncovered   = [self.targets.get(key, repr(key)) for key in keys if self.uncovered >> self.bits[key] & 1],
+            unreachable = [description for key, description in self.targets.items() if key not in self.bits],
+        )
+
+def generate_covering(nt_definitions: list[Nt], nt_name: str, params: dict[str, str], max_sentences: int | None = None) -> CoverageResult:
+    """A small set of resolutions of nt_name that together use every reachable
+    alternative, 'if' branch and file entry of the grammar at least once"""
+    return CoverageGenerator(nt_definitions, nt_name, params).generate(max_sentences)
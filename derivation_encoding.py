@@ -0,0 +1,212 @@
+import json
+import random
+from hashlib import blake2b
+from random import Random
+from typing import Iterator, Sequence
+
+from .ggra_errors import RESOLUTION_ERRORS
+from .grammar_tables import export_tables
+from .seeding import sentence_rng
+from .structures import Nt, as_grammar, resolve_nt
+
+MAGIC = b"GGRADRV1"
+
+def grammar_fingerprint(nt_definitions: list[Nt]) -> bytes:
+    """16-byte hash of the grammar and the contents of its files (see export_tables).\n
+    Choice sequences only decode to the same sentences with a grammar of the same fingerprint."""
+    return blake2b(export_tables(nt_definitions), digest_size=16).digest()
+
+#=================================
+# CHOICES
+class RecordingRng:
+    """Random generator for resolve_nt that records the index of every choice made with it.\n
+    The engine only draws with choice(seq) and randint(0, n-1), both are an index below n.
+    Draws among a single option are not recorded. Makes the same draws as the wrapped rng
+    would, so recording does not change the generated sentence."""
+    def __init__(self, rng: Random = random):
+        self.rng = rng
+        self.choices: list[int] = []
+
+    def _index(self, count: int) -> int:
+        index = self.rng.randrange(count)
+        if count > 1:
+            self.choices.append(index)
+        return index
+
+    def choice(self, seq: Sequence):
+        return seq[self._index(len(seq))]
+
+    def randint(self, a: int, b: int) -> int:
+        return a + self._index(b - a + 1)
+
+class ReplayRng:
+    """Random generator for resolve_nt that repeats the choices of a RecordingRng"""
+    def __init__(self, choices: Sequence[int]):
+        self.choices = choices
+        self.position = 0
+
+    def _index(self, count: int) -> int:
+        if count <= 1:
+            return 0
+        if self.position >= len(self.choices):
+            raise ValueError("ReplayRng # the choice sequence ended before the derivation")
+        index = self.choices[self.position]
+        self.position += 1
+        if index >= count:
+            raise ValueError(f"ReplayRng # choice {index} out of range for {count} options (different grammar?)")
+        return index
+
+    def choice(self, seq: Sequence):
+        return seq[self._index(len(seq))]
+
+    def randint(self, a: int, b: int) -> int:
+        return a + self._index(b - a + 1)
+
+#-----------------------
+def encode_varints(values: list[int], out: bytearray):
+    """Appends the values as unsigned LEB128 varints"""
+    for value in values:
+        while value >= 0x80:
+            out.append(value & 0x7F | 0x80)
+            value >>= 7
+        out.append(value)
+
+def decode_varint(data: bytes, pos: int) -> tuple[int, int]:
+    """Value of the varint at pos and the position after it"""
+    value = shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("decode_varint # data ends inside a varint")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def encode_choices(choices: list[int]) -> bytes:
+    """The number of choices followed by the choices, as varints"""
+    out = bytearray()
+    encode_varints([len(choices)], out)
+    encode_varints(choices, out)
+    return bytes(out)
+
+def decode_choices(data: bytes, pos: int = 0) -> tuple[list[int], int]:
+    """Choices encoded at pos and the position after them"""
+    count, pos = decode_varint(data, pos)
+    choices = []
+    for _ in range(count):
+        choice, pos = decode_varint(data, pos)
+        choices.append(choice)
+    return choices, pos
+
+#=================================
+# SENTENCES
+def record_nt(nt_definitions: list[Nt], nt_name: str, params: dict[str, str], rng: Random = random) -> tuple[list[str], bytes]:
+    """Resolves nt_name like resolve_nt; returns the sentence and its encoded choices"""
+    recorder = RecordingRng(rng)
+    sentence = resolve_nt(nt_definitions, nt_name, params, recorder)
+    return sentence, encode_choices(recorder.choices)
+
+def replay_choices(nt_definitions: list[Nt], nt_name: str, params: dict[str, str], choices: Sequence[int]) -> list[str]:
+    """The sentence of resolve_nt making the recorded choices; raises ValueError unless it uses all of them"""
+    replay = ReplayRng(choices)
+    sentence = resolve_nt(nt_definitions, nt_name, params, replay)
+    if replay.position != len(choices):
+        raise ValueError("replay_choices # the derivation ended before the choice sequence (different grammar?)")
+    return sentence
+
+def decode_sentence(nt_definitions: list[Nt], nt_name: str, params: dict[str, str], data: bytes) -> list[str]:
+    """The sentence that record_nt encoded as data"""
+    choices, end = decode_choices(data)
+    if end != len(data):
+        raise ValueError("decode_sentence # data continues after the choice sequence")
+    return replay_choices(nt_definitions, nt_name, params, choices)
+
+#=================================
+# CORPORA
+def encode_corpus(
+        nt_definitions: list[Nt],
+        nt_name: str,
+        params: dict[str, str],
+        seed: int | str,
+        start: int,
+        stop: int
+    ) -> bytes:
+    """Sentences start to stop (exclusive) of the stream seed (see seeding) as choice sequences.\n
+    Sentences that fail to resolve (see RESOLUTION_ERRORS) are skipped; their stream indices are
+    listed in the header. Any other error is raised.
+    Layout: MAGIC, grammar fingerprint, a varint-prefixed JSON header (Nonterminal, parameters,
+    seed, start and failed indices), then the encoded choices of every sentence (see encode_choices)."""
+    grammar = as_grammar(nt_definitions)
+    sentences = bytearray()
+    failed = []
+    for index in range(start, stop):
+        recorder = RecordingRng(sentence_rng(seed, index))
+        try:
+            resolve_nt(grammar, nt_name, params, recorder)
+        except RESOLUTION_ERRORS:
+            failed.append(index)
+            continue
+        encode_varints([len(recorder.choices)], sentences)
+        encode_varints(recorder.choices, sentences)
+
+    out = bytearray(MAGIC + grammar_fingerprint(grammar))
+    header = json.dumps({"nt": nt_name, "params": params, "seed": seed, "start": start, "failed": failed}).encode("utf-8")
+    encode_varints([len(header)], out)
+    out += header
+    out += sentences
+    return bytes(out)
+
+class DerivationCorpus:
+    """Sentences of encode_corpus, decoded on demand.\n
+    Indexing and iterating resolve the sentences again from their choices; only the
+    start positions of the sentences are kept. Raises ValueError if the grammar does
+    not have the fingerprint the corpus was encoded with, or if a sentence does not use
+    exactly its recorded choices. Sentences that failed when encoding are not part of the
+    corpus; stream_index tells the index in the stream of seed of every sentence."""
+    def __init__(self, data: bytes, nt_definitions: list[Nt]):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("DerivationCorpus # not an encoded corpus")
+        self.grammar = as_grammar(nt_definitions)
+        self.fingerprint = data[len(MAGIC):len(MAGIC) + 16]
+        if self.fingerprint != grammar_fingerprint(self.grammar):
+            raise ValueError("DerivationCorpus # the corpus was encoded with a different grammar or different files")
+        length, pos = decode_varint(data, len(MAGIC) + 16)
+        header = json.loads(data[pos:pos + length].decode("utf-8"))
+        self.nt_name: str = header["nt"]
+        self.params: dict[str, str] = header["params"]
+        self.seed: int | str = header["seed"]
+        self.start: int = header["start"]
+        self.failed: list[int] = header.get("failed", [])
+        """stream indices of the sentences that failed to resolve when encoding"""
+        self.data = data
+
+        self.offsets: list[int] = []
+        pos += length
+        while pos < len(data):
+            self.offsets.append(pos)
+            _, pos = decode_choices(data, pos)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> list[str]:
+        choices, _ = decode_choices(self.data, self.offsets[i])
+        return replay_choices(self.grammar, self.nt_name, self.params, choices)
+
+    def stream_index(self, i: int) -> int:
+        """Index of sentence i in the stream of seed (see seeding.sentence_rng)"""
+        index = self.start + i
+        for failed in self.failed:
+            if failed > index:
+                break
+            index += 1
+        return index
+
+    def __iter__(self) -> Iterator[list[str]]:
+        for i in range(len(self)):
+            yield self[i]
+
+def decode_corpus(data: bytes, nt_definitions: list[Nt]) -> list[list[str]]:
+    return list(DerivationCorpus(data, nt_definitions))
@@ -0,0 +1,293 @@
+import json
+import random
+import struct
+from array import array
+from dataclasses import dataclass
+from random import Random
+
+from .environments import Environment
+from .helpers import shuffle
+from .structures import (
+    NO_CHANGES,
+    Nt,
+    NtDefinition,
+    Pattern,
+    PatternBNForm,
+    PatternFrom,
+    PatternIf,
+    PatternWith,
+    as_grammar,
+    resolve_nt
+)
+
+# Node kinds
+NODE_DEFINITION = 0 # Nonterminal resolved by a pattern definition
+NODE_FILE       = 1 # Nonterminal resolved from a file
+NODE_SHARED     = 2 # repeated <X> of a pattern, which reuses the resolution of the first <X>
+
+KIND_NAMES = {NODE_DEFINITION: "definition", NODE_FILE: "file", NODE_SHARED: "shared"}
+
+MAGIC   = b"GGRATRE1"
+COLUMNS = (
+    # name, typecode
+    ("parent", "i"), ("kind", "b"), ("name", "i"), ("definition", "i"), ("alternative", "i"),
+    ("environment", "i"), ("start", "i"), ("end", "i"), ("shared_from", "i"),
+)
+HEADER = struct.Struct(f"<8s{len(COLUMNS) + 1}q") # length of every column and of the JSON part
+
+@dataclass
+class DerivationNode:
+    """One node of a DerivationTree, for reading"""
+    index: int
+    parent: int
+    kind: str
+    name: str
+    definition: int
+    """index of the definition in the grammar"""
+    alternative: int
+    """index of the chosen pattern among the patterns of the definition, in the order of the file"""
+    params: dict[str, str]
+    start: int
+    end: int
+    """terminals start to end (exclusive) of the sentence"""
+    shared_from: int
+    """for shared nodes, the node whose resolution they repeat"""
+
+class DerivationTree:
+    """Derivation of one sentence as parallel columns, one entry per Nonterminal in preorder.\n
+    Node 0 is the resolved Nonterminal. Names and parameter environments are numbered
+    per tree (strings, environments). Terminals of patterns have no nodes of their own:
+    they belong to the deepest node whose span holds them (see path_at)."""
+    def __init__(self):
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS}
+        self.strings: list[str] = []
+        self.environments: list[dict[str, str]] = []
+        self.sentence: list[str] = []
+        self._string_ids: dict[str, int] = {}
+        self._environment_ids: dict = {}
+        self._children: list[list[int]] | None = None
+        self._appends = [self.columns[name].append for name, _ in COLUMNS]
+
+    def __len__(self) -> int:
+        return len(self.columns["parent"])
+
+    def add(self, *values: int) -> int:
+        """Appends a node with a value for every column; returns its index"""
+        index = len(self.columns["parent"])
+        for append, value in zip(self._appends, values):
+            append(value)
+        return index
+
+    def string_id(self, string: str) -> int:
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = self._string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def environment_id(self, params) -> int:
+        key = params if isinstance(params, Environment) else tuple(sorted(params.items()))
+        environment_id = self._environment_ids.get(key)
+        if environment_id is None:
+            environment_id = self._environment_ids[key] = len(self.environments)
+            self.environments.append(dict(params.items()))
+        return environment_id
+
+    #-----------------------
+    def node(self, index: int) -> DerivationNode:
+        columns = self.columns
+        return DerivationNode(
+            index,
+            columns["parent"][index],
+            KIND_NAMES[columns["kind"][index]],
+            self.strings[columns["name"][index]],
+            columns["definition"][index],
+            columns["alternative"][index],
+            self.environments[columns["environment"][index]],
+            columns["start"][index],
+            columns["end"][index],
+            columns["shared_from"][index],
+        )
+
+    def children(self, index: int) -> list[int]:
+        if self._children is None:
+            self._children = [[] for _ in range(len(self))]
+            for child, parent in enumerate(self.columns["parent"]):
+                if parent >= 0:
+                    self._children[parent].append(child)
+        return self._children[index]
+
+    def find(self, name: str) -> list[int]:
+        """Nodes of the Nonterminal name"""
+        string_id = self._string_ids.get(name)
+        return [i for i, node_name in enumerate(self.columns["name"]) if node_name == string_id]
+
+    def path_at(self, position: int) -> list[int]:
+        """Nodes from the root to the deepest node that produced terminal position"""
+        starts, ends = self.columns["start"], self.columns["end"]
+        path = []
+        node = 0
+        while node is not None and starts[node] <= position < ends[node]:
+            path.append(node)
+            node = next((child for child in self.children(node) if starts[child] <= position < ends[child]), None)
+        return path
+
+    def terminals(self, index: int) -> list[str]:
+        return self.sentence[self.columns["start"][index]:self.columns["end"][index]]
+
+    def lines(self) -> list[str]:
+        lines = []
+        depth = {}
+        for i in range(len(self)):
+            node = self.node(i)
+            depth[i] = depth[node.parent] + 1 if node.parent >= 0 else 0
+            params = ", ".join(f"{name}={value!r}" for name, value in node.params.items())
+            if node.kind == "shared":
+                detail = f"same as node {node.shared_from}"
+            elif node.kind == "file":
+                detail = f"file, definition {node.definition}"
+            else:
+                detail = f"definition {node.definition}, pattern {node.alternative}"
+            lines.append(f"{'  ' * depth[i]}{node.name}({params}) [{node.start}:{node.end}] {detail}: {' '.join(self.terminals(i))}")
+        return lines
+
+    def __str__(self) -> str:
+        return "\n".join(self.lines())
+
+    #-----------------------
+    def to_bytes(self) -> bytes:
+        sections = [self.columns[name].tobytes() for name, _ in COLUMNS]
+        extra = json.dumps({"strings": self.strings, "environments": self.environments, "sentence": self.sentence}, ensure_ascii=False).encode("utf-8")
+        return HEADER.pack(MAGIC, *(len(self.columns[name]) for name, _ in COLUMNS), len(extra)) + b"".join(sections) + extra
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DerivationTree":
+        magic, *lengths, extra_length = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("DerivationTree.from_bytes # not a serialized derivation tree")
+        tree = cls()
+        position = HEADER.size
+        for (name, typecode), length in zip(COLUMNS, lengths):
+            column = tree.columns[name]
+            size = length * column.itemsize
+            column.frombytes(data[position:position + size])
+            position += size
+        extra = json.loads(data[position:position + extra_length].decode("utf-8"))
+        tree.sentence = extra["sentence"]
+        for string in extra["strings"]:
+            tree.string_id(string)
+        for params in extra["environments"]:
+            tree.environment_id(params)
+        return tree
+
+    def to_json(self) -> dict:
+        return {
+            "sentence": self.sentence,
+            "nodes": [self.node(i).__dict__ for i in range(len(self))],
+        }
+
+#=================================
+class TreeResolver:
+    """Resolves like resolve_nt and records the derivation tree.\n
+    Makes the same random choices as resolve_nt, so with the same rng it produces the same
+    sentence. resolve_nt itself records nothing; create one TreeResolver per grammar and
+    use it only when a tree is wanted."""
+    def __init__(self, nt_definitions: list[Nt]):
+        self.grammar = as_grammar(nt_definitions)
+        self.definition_index = {id(nt): i for i, nt in enumerate(self.grammar)}
+        self.leaf_offsets: dict[int, list[int]] = {}
+
+    def resolve(self, nt_name: str, params: dict[str, str], rng: Random = random) -> tuple[list[str], DerivationTree]:
+        tree = DerivationTree()
+        self._resolve(tree, -1, nt_name, params, rng)
+        return tree.sentence, tree
+
+    def _resolve(self, tree: DerivationTree, parent: int, nt_name: str, params, rng) -> int:
+        grammar = self.grammar
+        environment = grammar.environments.environment(params)
+        candidates = grammar.environments.definitions(nt_name, environment.schema)
+        if not candidates:
+            # raises the error of resolve_nt
+            resolve_nt(grammar, nt_name, environment, rng)
+        definition = rng.choice(candidates)
+
+        columns = tree.columns
+        start = len(tree.sentence)
+        kind = NODE_DEFINITION if isinstance(definition, NtDefinition) else NODE_FILE
+        index = tree.add(parent, kind, tree.string_id(nt_name), self.definition_index[id(definition)], 0, tree.environment_id(environment), start, start, -1)
+
+        if kind == NODE_FILE:
+            tree.sentence.extend(definition.resolve(grammar, environment, rng))
+        else:
+            pattern, changes, alternative = self._choose(definition.subpattern, environment, rng)
+            pattern, nt_config = definition.configure_pattern(pattern, changes, environment, rng, grammar)
+            columns["alternative"][index] = alternative
+            self._fill(tree, index, pattern, nt_config, rng)
+        columns["end"][index] = len(tree.sentence)
+        return index
+
+    def _fill(self, tree: DerivationTree, parent: int, pattern: list, nt_config: dict[str, dict[str, str]], rng):
+        """Like fill_in_pattern, appending to the sentence of the tree"""
+        resolved = {}
+        for obj in pattern:
+            if isinstance(obj, str):
+                tree.sentence.append(obj)
+                continue
+            actual_name = obj.name.removeprefix("~")
+            if obj.name.startswith("~") or obj.name not in resolved:
+                node = self._resolve(tree, parent, actual_name, nt_config.get(actual_name, {}), rng)
+                if not obj.name.startswith("~"):
+                    resolved[obj.name] = node
+                continue
+            first = resolved[obj.name]
+            columns = tree.columns
+            start = len(tree.sentence)
+            tree.sentence.extend(tree.terminals(first))
+            tree.add(
+                parent, NODE_SHARED, columns["name"][first], columns["definition"][first], columns["alternative"][first],
+                columns["environment"][first], start, len(tree.sentence), first
+            )
+
+    def _choose(self, pattern: Pattern, params, rng) -> tuple[list | None, list | None, int]:
+        """pattern.resolve, which also tells the number of the chosen BN pattern"""
+        if isinstance(pattern, PatternBNForm):
+            return pattern.resolved(), NO_CHANGES, 0
+        if isinstance(pattern, PatternFrom):
+            subpatterns = pattern.subpatterns
+            offsets = self._leaf_offsets(pattern)
+            for i in shuffle(pattern.candidates(params), rng):
+                sub, changes, alternative = self._choose(subpatterns[i], params, rng)
+                if sub is not None:
+                    return sub, changes, offsets[i] + alternative
+            return None, None, 0
+        if isinstance(pattern, PatternIf):
+            if not pattern.condition.evaluate(params):
+                return None, None, 0
+            return self._choose(pattern.subpattern, params, rng)
+        if isinstance(pattern, PatternWith):
+            sub, sub_changes, alternative = self._choose(pattern.subpattern, params, rng)
+            if sub is None:
+                return None, None, 0
+            return sub, pattern.joined(sub_changes), alternative
+        raise TypeError(f"TreeResolver._choose # unknown pattern {pattern!r}")
+
+    def _leaf_offsets(self, pattern: PatternFrom) -> list[int]:
+        """Number of the first BN pattern of every subpattern"""
+        offsets = self.leaf_offsets.get(id(pattern))
+        if offsets is None:
+            offsets = [0]
+            for sub in pattern.subpatterns:
+                offsets.append(offsets[-1] + self._leaf_count(sub))
+            self.leaf_offsets[id(pattern)] = offsets
+        return offsets
+
+    def _leaf_count(self, pattern: Pattern) -> int:
+        if isinstance(pattern, PatternBNForm):
+            return 1
+        if isinstance(pattern, PatternFrom):
+            return self._leaf_offsets(pattern)[-1]
+        return self._leaf_count(pattern.subpattern)
+
+def resolve_nt_tree(nt_definitions: list[Nt], nt_name: str, params: dict[str, str], rng: Random = random) -> tuple[list[str], DerivationTree]:
+    """resolve_nt that also returns the derivation tree of the sentence (see TreeResolver)"""
+    return TreeResolver(nt_definitions).resolve(nt_name, params, rng)
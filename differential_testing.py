@@ -0,0 +1,371 @@
+import json
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from math import exp, lgamma, log, sqrt
+from random import Random
+from time import perf_counter
+from typing import Callable
+
+from .batch_sampler import compile_batch_tables, resolve_nt_batch
+from .code_generation import compiled_module
+from .grammar_tables import GrammarTables, export_tables
+from .gram_parser import line_iterator, make_lines, parse_file_from_lines
+from .optimizer import optimize_grammar
+from .structures import Grammar, as_grammar, resolve_nt
+
+# An engine generates count sentences (None for a failed resolution) from a seed
+Engine = Callable[[Grammar, str, dict[str, str], int, int], list[list[str] | None]]
+
+class EngineNotApplicable(Exception):
+    """The engine cannot handle the grammar (it is skipped, not failed)"""
+
+#=================================
+# Engines
+def reference_engine(grammar: Grammar, nt_name: str, params: dict[str, str], count: int, seed: int) -> list[list[str] | None]:
+    rng = Random(seed)
+    sentences = []
+    for _ in range(count):
+        try:
+            sentences.append(resolve_nt(grammar, nt_name, params, rng))
+        except Exception:
+            sentences.append(None)
+    return sentences
+
+def tables_engine(grammar: Grammar, nt_name: str, params: dict[str, str], count: int, seed: int) -> list[list[str] | None]:
+    tables = GrammarTables(export_tables(grammar))
+    rng = Random(seed)
+    sentences = []
+    for _ in range(count):
+        try:
+            sentences.append(tables.resolve_nt(nt_name, params, rng))
+        except Exception:
+            sentences.append(None)
+    return sentences
+
+def optimized_engine(grammar: Grammar, nt_name: str, params: dict[str, str], count: int, seed: int) -> list[list[str] | None]:
+    optimized, _ = optimize_grammar(grammar, [nt_name])
+    return reference_engine(optimized, nt_name, params, count, seed)
+
+def compiled_engine(grammar: Grammar, nt_name: str, params: dict[str, str], count: int, seed: int) -> list[list[str] | None]:
+    module = compiled_module(grammar)
+    rng = Random(seed)
+    sentences = []
+    for _ in range(count):
+        try:
+            sentences.append(module.resolve_nt(nt_name, params, rng))
+        except Exception:
+            sentences.append(None)
+    return sentences
+
+def batch_engine(grammar: Grammar, nt_name: str, params: dict[str, str], count: int, seed: int) -> list[list[str] | None]:
+    if params or compile_batch_tables(grammar, nt_name) is None:
+        raise EngineNotApplicable("only for parameter-free Nonterminals made of 'from' blocks and BN patterns")
+    return resolve_nt_batch(grammar, nt_name, count, seed)
+
+ENGINES: dict[str, Engine] = {
+    "reference":    reference_engine,
+    "tables":       tables_engine,
+    "optimized":    optimized_engine,
+    "compiled":     compiled_engine,
+    "batch":        batch_engine,
+}
+
+#=================================
+# Statistics
+def chi_square_sf(statistic: float, dof: int) -> float:
+    """P(X >= statistic) for a chi-square distribution, via the regularized incomplete gamma function"""
+    if dof <= 0:
+        return 1.
+    a, x = dof / 2, statistic / 2
+    if x <= 0:
+        return 1.
+    log_prefix = a * log(x) - x - lgamma(a)
+    if x < a + 1:
+        # series of the lower function
+        term = total = 1 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0., 1. - total * exp(log_prefix))
+    # continued fraction of the upper function (modified Lentz)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 10_000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return min(1., exp(log_prefix) * h)
+
+def chi_square_homogeneity(first: Counter, second: Counter, min_expected: float = 5.) -> tuple[float, int, float]:
+    """Chi-square test whether two samples of categories come from the same distribution.\n
+    Categories expected less than min_expected times in a sample are pooled into one.
+    Returns statistic, degrees of freedom and p-value."""
+    n1, n2 = sum(first.values()), sum(second.values())
+    if n1 == 0 or n2 == 0:
+        return 0., 0, 1.
+    share1 = n1 / (n1 + n2)
+    bins, pooled = [], [0, 0]
+    for category in first.keys() | second.keys():
+        observed = (first[category], second[category])
+        total = observed[0] + observed[1]
+        if min(total * share1, total * (1 - share1)) < min_expected:
+            pooled[0] += observed[0]
+            pooled[1] += observed[1]
+        else:
+            bins.append(observed)
+    if sum(pooled):
+        bins.append(tuple(pooled))
+    statistic = 0.
+    for o1, o2 in bins:
+        total = o1 + o2
+        e1, e2 = total * share1, total * (1 - share1)
+        statistic += (o1 - e1) ** 2 / e1 + (o2 - e2) ** 2 / e2
+    dof = len(bins) - 1
+    return statistic, dof, chi_square_sf(statistic, dof)
+
+def ks_two_sample(first: list[float], second: list[float]) -> tuple[float, float]:
+    """Two-sample Kolmogorov-Smirnov test; returns D and the asymptotic p-value"""
+    n1, n2 = len(first), len(second)
+    if n1 == 0 or n2 == 0:
+        return 0., 1.
+    xs, ys = sorted(first), sorted(second)
+    i = j = 0
+    d = 0.
+    while i < n1 and j < n2:
+        value = min(xs[i], ys[j])
+        while i < n1 and xs[i] == value:
+            i += 1
+        while j < n2 and ys[j] == value:
+            j += 1
+        d = max(d, abs(i / n1 - j / n2))
+    effective = sqrt(n1 * n2 / (n1 + n2))
+    lam = (effective + 0.12 + 0.11 / effective) * d
+    if lam < 0.2:
+        return d, 1.
+    p = 2 * sum((-1) ** (k - 1) * exp(-2 * k * k * lam * lam) for k in range(1, 101))
+    return d, min(1., max(0., p))
+
+#=================================
+@dataclass
+class TestResult:
+    name: str
+    statistic: float
+    p_value: float
+
+@dataclass
+class EngineComparison:
+    case: str
+    engine: str
+    tests: list[TestResult] = field(default_factory=list)
+    reference_rate: float = 0.
+    """sentences per second"""
+    candidate_rate: float = 0.
+    skipped: str | None = None
+
+    def passed(self, alpha: float) -> bool:
+        return all(test.p_value >= alpha for test in self.tests)
+
+@dataclass
+class DiffCase:
+    name: str
+    grammar: Grammar
+    nt_name: str = "S"
+    params: dict[str, str] = field(default_factory=dict)
+
+@dataclass
+class DiffReport:
+    comparisons: list[EngineComparison]
+    alpha: float
+    """significance level of every single test (already corrected for the number of tests)"""
+
+    @property
+    def passed(self) -> bool:
+        return all(comparison.passed(self.alpha) for comparison in self.comparisons)
+
+    def lines(self) -> list[str]:
+        lines = [f"significance level per test: {self.alpha:.2g}"]
+        for comparison in self.comparisons:
+            head = f"{comparison.case} / {comparison.engine}"
+            if comparison.skipped:
+                lines.append(f"{head}: skipped ({comparison.skipped})")
+                continue
+            verdict = "ok" if comparison.passed(self.alpha) else "DIFFERENT"
+            speedup = comparison.candidate_rate / comparison.reference_rate if comparison.reference_rate else 0.
+            lines.append(
+                f"{head}: {verdict}, {comparison.candidate_rate:.0f} vs {comparison.reference_rate:.0f} sentences/s ({speedup:.2f}x)"
+            )
+            lines += [f"    {test.name}: statistic {test.statistic:.3f}, p = {test.p_value:.3g}" for test in comparison.tests]
+        return lines
+
+    def __str__(self) -> str:
+        return "\n".join(self.lines())
+
+def timed(engine: Engine, case: DiffCase, count: int, seed: int) -> tuple[list[list[str] | None], float]:
+    start = perf_counter()
+    sentences = engine(case.grammar, case.nt_name, case.params, count, seed)
+    elapsed = perf_counter() - start
+    return sentences, count / elapsed if elapsed > 0 else float("inf")
+
+def compare_samples(reference: list[list[str] | None], candidate: list[list[str] | None]) -> list[TestResult]:
+    """Same distribution of sentences (failures count as one outcome), first terminals and lengths"""
+    outcome = lambda sentence: None if sentence is None else tuple(sentence)
+    first = lambda sentence: None if sentence is None else (sentence[0] if sentence else "")
+    tests = []
+    for name, key in (("sentences (chi-square)", outcome), ("first terminal (chi-square)", first)):
+        statistic, _, p = chi_square_homogeneity(Counter(map(key, reference)), Counter(map(key, candidate)))
+        tests.append(TestResult(name, statistic, p))
+    lengths = lambda sample: [len(sentence) for sentence in sample if sentence is not None]
+    d, p = ks_two_sample(lengths(reference), lengths(candidate))
+    tests.append(TestResult("length (Kolmogorov-Smirnov)", d, p))
+    return tests
+
+def run_differential(
+        cases: list[DiffCase],
+        candidates: dict[str, Engine],
+        reference: Engine = reference_engine,
+        count: int = 20_000,
+        seed: int = 0,
+        alpha: float = 0.001
+    ) -> DiffReport:
+    """Compares every candidate engine with the reference on every case.\n
+    Candidate and reference get different seeds, so equal distributions are tested,
+    not equal random streams. alpha is the overall significance level (Bonferroni-corrected)."""
+    comparisons = []
+    for case in cases:
+        expected, reference_rate = timed(reference, case, count, seed)
+        for name, engine in candidates.items():
+            comparison = EngineComparison(case.name, name, reference_rate=reference_rate)
+            try:
+                sample, comparison.candidate_rate = timed(engine, case, count, seed + 1)
+            except EngineNotApplicable as reason:
+                comparison.skipped = str(reason)
+            else:
+                comparison.tests = compare_samples(expected, sample)
+            comparisons.append(comparison)
+    tests = sum(len(comparison.tests) for comparison in comparisons)
+    return DiffReport(comparisons, alpha / max(1, tests))
+
+#=================================
+# Grammar library
+def parse_text(text: str) -> Grammar:
+    return parse_file_from_lines(make_lines(line_iterator(text)))
+
+SYNTHETIC_GRAMMARS: dict[str, str] = {
+    # uniform choice among the subpatterns of nested 'from' blocks (not among their leaves)
+    "nested_from": """
+S:
+  from:
+    "a"
+    "b"
+    from:
+      "c"
+      "d"
+      "e"
+  <T>
+
+T:
+  "t1"
+  "t2" <T>
+  "t3"
+""",
+    # the choice is uniform among the alternatives whose condition holds
+    "conditions": """
+S:
+  <A> <B>
+  with:
+    "x" | "y" | "z" => A.p
+    "y" => B.p
+
+A(p):
+  "ax"
+  if p = "x"
+  "axy"
+  if p = "x" | "y"
+  "anz"
+  if p != "z"
+  "any"
+
+B(p):
+  "by"
+  if p = "y"
+  "b?"
+""",
+    # constants, changes between Nonterminals, <X> sharing and <~X> separate resolution
+    "propagation": """
+S:
+  <Subj> <Verb> <~Subj> <Subj>
+  with:
+    "1" | "3" => Subj.form
+    Subj.form => Verb.form
+
+Subj(form):
+  "I"
+  if form = "1"
+  from:
+    "he"
+    "she"
+    <Name>
+  if form = "3"
+
+Verb(form):
+  "run"
+  if form = "1"
+  "runs"
+  if form = "3"
+
+Name -> "{names}"
+""",
+    # '...' choices and parameter lookups in files, including failing lookups
+    "files": """
+S:
+  <Word> <Word> <~Word>
+  with:
+    "a" | "b" | "c" => Word.kind
+
+Word(kind) -> "{words}"
+""",
+    # resolution fails for some choices
+    "failures": """
+S:
+  <A>
+  with:
+    "ok" | "bad" => A.p
+
+A(p):
+  "fine"
+  if p = "ok"
+""",
+}
+
+SYNTHETIC_FILES: dict[str, dict] = {
+    "names": {"order": ["..."], "content": ["Ann", "Ben", "Cid", "Dee"]},
+    "words": {"order": ["kind", "..."], "content": {"a": ["a1", "a2", "a3"], "b": [["b", "1"], ["b", "2"]]}},
+}
+
+def synthetic_cases(directory: str) -> list[DiffCase]:
+    """The synthetic grammar library; the JSON files are written to directory"""
+    paths = {}
+    for name, content in SYNTHETIC_FILES.items():
+        paths[name] = os.path.join(directory, f"{name}.json").replace("\\", "/")
+        with open(paths[name], "w", encoding="utf-8") as doc:
+            json.dump(content, doc)
+    return [DiffCase(name, parse_text(text.format(**paths))) for name, text in SYNTHETIC_GRAMMARS.items()]
+
+def file_case(grammar_path: str, nt_name: str = "S", params: dict[str, str] | None = None) -> DiffCase:
+    with open(grammar_path, "r", encoding="utf-8") as doc:
+        grammar = as_grammar(parse_text(doc.read()))
+    return DiffCase(os.path.basename(grammar_path), grammar, nt_name, params or {})
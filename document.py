@@ -0,0 +1,173 @@
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+
+from .custom_token import Token
+from .ggra_errors import GgraParserError
+from .gram_lexer import line_tokens
+from .gram_parser import make_lines, parse_file_from_lines
+from .lines import Line
+from .structures import Grammar, Nt
+
+@dataclass
+class Diagnostic:
+    """Error in the lines line to end_line (exclusive) of a document, counted from 0"""
+    line: int
+    end_line: int
+    error: GgraParserError
+
+@dataclass
+class ParsedBlock:
+    definitions: list[Nt] = field(default_factory=list)
+    diagnostics: list[Diagnostic] = field(default_factory=list)
+    """line numbers relative to the start of the block"""
+
+def is_block_start(line: str) -> bool:
+    """Whether a line starts a top-level block (not indented, not empty, not only a comment)"""
+    return line[:1] not in ("", " ") and not line.startswith("//")
+
+#=================================
+class GgraDocument:
+    """The text of a grammar file kept for editing, e.g. for live diagnostics.\n
+    Keeps the tokens of every line and splits the lines into top-level blocks:
+    a block starts with a line that is not indented and ends before the next one.
+    Blocks parse independently of each other, so an edit only re-lexes the
+    edited lines and re-parses the blocks containing them.\n
+    Lines and columns are counted from 0, the text is split at '\\n'."""
+    def __init__(self, text: str = ""):
+        self.set_text(text)
+
+    def set_text(self, text: str):
+        self.lines: list[str] = text.split("\n")
+        self.tokens: list[list[Token] | None] = []
+        self.lex_errors: list[GgraParserError | None] = []
+        self._lex_into(0, 0, self.lines)
+        self.block_starts: list[int] = [0] + [i for i, line in enumerate(self.lines) if i > 0 and is_block_start(line)]
+        self.blocks: list[ParsedBlock | None] = [None] * len(self.block_starts)
+        self._offsets: list[int] = []
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+    def _lex_into(self, start: int, end: int, lines: list[str]):
+        """Replaces tokens and lex errors of the lines start to end by those of lines"""
+        tokens, errors = [], []
+        for line in lines:
+            try:
+                tokens.append(line_tokens(line))
+                errors.append(None)
+            except GgraParserError as error:
+                tokens.append(None)
+                errors.append(error)
+        self.tokens[start:end] = tokens
+        self.lex_errors[start:end] = errors
+
+    #-----------------------
+    # Editing
+    def replace_lines(self, start: int, end: int, new_lines: list[str]):
+        """Replaces the lines start to end (exclusive) by new_lines"""
+        if not 0 <= start <= end <= len(self.lines):
+            raise IndexError(f"GgraDocument.replace_lines # lines {start} to {end} not in document of {len(self.lines)} lines")
+        if not new_lines and end - start == len(self.lines):
+            new_lines = [""] # like the text ""
+        delta = len(new_lines) - (end - start)
+        self.lines[start:end] = new_lines
+        self._lex_into(start, end, new_lines)
+        del self._offsets[start+1:]
+
+        # starts before the edit stay, starts in it are found again in the new lines and in
+        # the first line after them (which may start a block now that it follows other lines),
+        # starts after that are shifted
+        starts = self.block_starts
+        kept = bisect_left(starts, start)
+        after = bisect_right(starts, end)
+        new_starts = [
+            i for i in range(start, min(start + len(new_lines) + 1, len(self.lines)))
+            if i == 0 or is_block_start(self.lines[i])
+        ]
+        self.block_starts = starts[:kept] + new_starts + [s + delta for s in starts[after:]]
+        # the block before the edit may end elsewhere now
+        self.blocks = self.blocks[:max(0, kept - 1)] + [None] * (min(1, kept) + len(new_starts)) + self.blocks[after:]
+
+    def replace(self, start_line: int, start_column: int, end_line: int, end_column: int, text: str):
+        """Replaces the text between two positions, like an editor change event"""
+        before = self.lines[start_line][:start_column]
+        after = self.lines[end_line][end_column:]
+        self.replace_lines(start_line, end_line + 1, (before + text + after).split("\n"))
+
+    def replace_range(self, start: int, end: int, text: str):
+        """Replaces the text between two character offsets"""
+        self.replace(*self.position(start), *self.position(end), text)
+
+    #-----------------------
+    # Positions
+    def offsets(self) -> list[int]:
+        """Character offset of the start of every line"""
+        del self._offsets[len(self.lines):]
+        if not self._offsets:
+            self._offsets.append(0)
+        offset = self._offsets[-1]
+        for line in self.lines[len(self._offsets)-1:-1]:
+            offset += len(line) + 1
+            self._offsets.append(offset)
+        return self._offsets
+
+    def position(self, offset: int) -> tuple[int, int]:
+        """(line, column) of a character offset"""
+        offsets = self.offsets()
+        line = bisect_right(offsets, offset) - 1
+        return line, offset - offsets[line]
+
+    def offset(self, line: int, column: int) -> int:
+        return self.offsets()[line] + column
+
+    #-----------------------
+    # Parsing
+    def block_range(self, block: int) -> tuple[int, int]:
+        """First and last line (exclusive) of a block"""
+        end = self.block_starts[block+1] if block + 1 < len(self.block_starts) else len(self.lines)
+        return self.block_starts[block], end
+
+    def block_at(self, line: int) -> int:
+        """Index of the block containing the line"""
+        return bisect_right(self.block_starts, line) - 1
+
+    def parsed_block(self, block: int) -> ParsedBlock:
+        if self.blocks[block] is None:
+            self.blocks[block] = self._parse_block(*self.block_range(block))
+        return self.blocks[block]
+
+    def _parse_block(self, start: int, end: int) -> ParsedBlock:
+        parsed = ParsedBlock()
+        lines: list[Line] = []
+        for i in range(start, end):
+            if self.lex_errors[i] is not None:
+                parsed.diagnostics.append(Diagnostic(i - start, i - start + 1, self.lex_errors[i]))
+                continue
+            try:
+                lines.extend(make_lines([(i, self.tokens[i])]))
+            except GgraParserError as error:
+                parsed.diagnostics.append(Diagnostic(i - start, i - start + 1, error))
+        if parsed.diagnostics or not lines:
+            return parsed
+        try:
+            parsed.definitions = parse_file_from_lines(lines)
+        except GgraParserError as error:
+            parsed.diagnostics.append(Diagnostic(0, end - start, error))
+        return parsed
+
+    def diagnostics(self) -> list[Diagnostic]:
+        """All errors of the document, in the order of the lines"""
+        diagnostics = []
+        for block, start in enumerate(self.block_starts):
+            for diagnostic in self.parsed_block(block).diagnostics:
+                diagnostics.append(Diagnostic(start + diagnostic.line, start + diagnostic.end_line, diagnostic.error))
+        return diagnostics
+
+    def grammar(self) -> Grammar:
+        """Definitions of all blocks, like parse_file; blocks with errors are left out"""
+        return Grammar(
+            definition
+            for block in range(len(self.block_starts))
+            for definition in self.parsed_block(block).definitions
+        )
@@ -0,0 +1,127 @@
+from threading import Lock
+from typing import Iterable, Iterator, Mapping
+
+#=================================
+# INTERNING
+class Interner:
+    """Numbers strings in order of their first appearance.\n
+    Thread-safe: new strings are added under a lock, known ones are looked up without."""
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+        self.strings: list[str] = []
+        self.lock = Lock()
+
+    def intern(self, string: str) -> int:
+        string_id = self.ids.get(string)
+        if string_id is None:
+            with self.lock:
+                string_id = self.ids.get(string)
+                if string_id is None:
+                    string_id = len(self.strings)
+                    self.strings.append(string)
+                    self.ids[string] = string_id
+        return string_id
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+class ParamSchema:
+    """Sorted parameter names of a Nonterminal Definition.\n
+    Schemas are unique per grammar, so they are compared and hashed by identity."""
+    __slots__ = ("names", "name_ids", "slots", "values")
+    def __init__(self, names: Iterable[str], name_interner: Interner, value_interner: Interner):
+        self.names      = tuple(sorted(names))
+        self.name_ids   = tuple(name_interner.intern(name) for name in self.names)
+        self.slots      = {name: slot for slot, name in enumerate(self.names)}
+        self.values     = value_interner
+
+    def __repr__(self) -> str:
+        return f"ParamSchema({', '.join(self.names)})"
+
+#=================================
+# ENVIRONMENT
+class Environment:
+    """Parameters of one Nonterminal instance: interned values in the slots of its schema.\n
+    Can be read like the dict of parameters it replaces, and is hashable."""
+    __slots__ = ("schema", "values")
+    def __init__(self, schema: ParamSchema, values: tuple[int, ...]):
+        self.schema = schema
+        self.values = values
+
+    def __getitem__(self, name: str) -> str:
+        return self.schema.values.strings[self.values[self.schema.slots[name]]]
+
+    def get(self, name: str, default = None):
+        slot = self.schema.slots.get(name)
+        if slot is None:
+            return default
+        return self.schema.values.strings[self.values[slot]]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.schema.slots
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.schema.names)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def keys(self):
+        return self.schema.slots.keys()
+
+    def items(self) -> Iterator[tuple[str, str]]:
+        strings = self.schema.values.strings
+        return ((name, strings[value]) for name, value in zip(self.schema.names, self.values))
+
+    def __hash__(self) -> int:
+        return hash((self.schema.name_ids, self.values))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Environment):
+            return self.schema is other.schema and self.values == other.values
+        if isinstance(other, Mapping):
+            return dict(self.items()) == dict(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Environment({dict(self.items())!r})"
+
+#=================================
+class GrammarEnvironments:
+    """Interned parameter names and values of one grammar,
+    and its Nonterminal Definitions indexed by name and parameter schema"""
+    def __init__(self, nt_definitions: list):
+        self.names  = Interner()
+        self.values = Interner()
+        self.lock   = Lock()
+        self.schemas: dict[frozenset[str], ParamSchema] = {}
+        self.empty  = Environment(self.schema(()), ())
+        self.index: dict[tuple[str, ParamSchema], list] = {}
+        self.plans: dict[int, dict[int, object]] = {}
+        """ChangePlans of the grammar by id of the resolved pattern and of its changes (see structures)"""
+        for nt in nt_definitions:
+            self.index.setdefault((nt.name, self.schema(nt.param_names)), []).append(nt)
+
+    def schema(self, param_names: Iterable[str]) -> ParamSchema:
+        key = frozenset(param_names)
+        schema = self.schemas.get(key)
+        if schema is None:
+            with self.lock:
+                # schemas are compared by identity, so there must only ever be one per key
+                schema = self.schemas.get(key)
+                if schema is None:
+                    schema = ParamSchema(key, self.names, self.values)
+                    self.schemas[key] = schema
+        return schema
+
+    def environment(self, params: Mapping[str, str]) -> Environment:
+        if isinstance(params, Environment):
+            return params
+        if not params:
+            return self.empty
+        schema = self.schema(params)
+        return Environment(schema, tuple(self.values.intern(params[name]) for name in schema.names))
+
+    def definitions(self, nt_name: str, schema: ParamSchema) -> list:
+        """All Nonterminal Definitions named nt_name with exactly the parameters of the schema"""
+        return self.index.get((nt_name, schema), [])
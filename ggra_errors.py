@@ -16,4 +16,16 @@ class GgraParserError(GgraError):
     pass
 
 class GgraResolutionError(GgraError):
-    pass
\ No newline at end of file
+    pass
+
+class GgraFileError(GgraError):
+    pass
+
+class UnresolvableError(Exception):
+    """resolve_nt found no fitting definition, pattern, parameter or file entry for a sentence.\n
+    Raised with a plain message like Exception, which it replaces there."""
+    pass
+
+RESOLUTION_ERRORS = (UnresolvableError, GgraResolutionError, RecursionError)
+"""What resolving a sentence raises when the grammar does not produce one (too deep ones included);
+anything else is an error of the engine"""
@@ -41,13 +41,13 @@ COMP_PATTERNS = {key: re.compile(regex) for key, regex in PATTERNS.items()}
 #=================================
 debreaked  = lambda text: text.replace("\n", "↵")
 
-def next_token(text: str) -> tuple[Token, int]:
-    """returns token and its length, if found"""
+def next_token(text: str, pos: int = 0) -> tuple[Token, int]:
+    """returns token starting at pos and its length, if found"""
     for patname, pattern in COMP_PATTERNS.items():
-        mat = pattern.match(text)
+        mat = pattern.match(text, pos)
 
         if mat is None:
-            # If the pattern does not fit the start of the string
+            # If the pattern does not fit the string at pos
             continue
 
         content = mat.group()
@@ -55,20 +55,20 @@ def next_token(text: str) -> tuple[Token, int]:
         length  = span[1] - span[0]
         return Token(patname, content), length
     
-    tek = debreaked(text)
+    tek = debreaked(text[pos:pos+16])
     raise GgraParserError(
         "Lexer: Generating Tokens",
-        ["No available token:", f"{tek[:min(16, len(tek))]} ...", "^"]
+        ["No available token:", f"{tek} ...", "^"]
     )
 
 def tokens(text: str, ignore_types: list[str]) -> Iterator[tuple[Token, int]]:
     """yields all tokens from the text; ignored if token type in ignore_types"""
-    current_text = text
-    while len(current_text) > 0:
-        token, tokenlength = next_token(current_text)
+    pos = 0
+    while pos < len(text):
+        token, tokenlength = next_token(text, pos)
         if token.name not in ignore_types:
             yield token, tokenlength
-        current_text = current_text[tokenlength:]
+        pos += tokenlength
 
 def token_lines(text: str, ignore_types: list[str] = []) -> Iterator[list]:
     """Iterator. Returns tokens in the line"""
@@ -79,7 +79,11 @@ def token_lines(text: str, ignore_types: list[str] = []) -> Iterator[list]:
             token_stack = []
             continue
         token_stack.append(token)
-    
+
+def line_tokens(line: str) -> list[Token]:
+    """Tokens of a single line (without linebreak), like one list of token_lines"""
+    return [token for token, _ in tokens(line, [])]
+
 #=================================
 def write_token_file(token_stream, ignore_types: list[str], filename: str = "out_tokens.txt"):
     with open(filename, "w", encoding="utf-8") as doc:
@@ -1,10 +1,13 @@
 
+from dataclasses import dataclass
+from time import perf_counter
 from typing import Iterator, TextIO
 
 from .ggra_errors import GgraParserError
 from .custom_token import Token
 from .gram_lexer import token_lines
-from .helpers import alltrue, anytrue, index_where, time_info
+from .helpers import alltrue, index_where, time_info
+from .node_sharing import share_nodes
 from .structures import (
     Change, 
     Condition, 
@@ -15,6 +18,7 @@ from .structures import (
     ExpressionChoice,
     ExpressionIdentifier,
     ExpressionString,
+    Grammar,
     Nt,
     NtDefinition,
     Pattern, 
@@ -60,16 +64,6 @@ def indent_size(line: list[Token]) -> int:
         return 0
     return len(line[0].content)
 
-def trivial_line(line: list[Token]) -> bool:
-    if len(line) == 0:
-        return True
-    match remove_all_spaces(line):
-        case []:
-            return True
-        case [tok_comment] if tok_comment.name == "comment":
-            return True
-    return False
-
 def fits_nt_opening(tokens: list[Token]) -> bool:
     """Whether tokens can constitute the header line of a Nt-Definition"""
     if len(tokens) < 3:
@@ -151,96 +145,118 @@ def or_condition_options(tokens: list[Token]) -> ExpressionChoice:
 # ================================
 def make_lines(lines: LineIterator) -> Iterator[Line]:
     for i, line_tokens in lines:
-        if trivial_line(line_tokens):
+        spaceless = remove_all_spaces(line_tokens)
+        if not spaceless:
+            # trivial line: only spaces and comments
             continue
         indent = indent_size(line_tokens)
-        spaceless = remove_all_spaces(line_tokens)
         line = partial_parse_line(indent, spaceless)
         yield line
 
 def partial_parse_line(indent: int, line: list[Token]) -> Line:
-    match line:
-        case [t_from, t_colon, *rest] if alltrue(
-            t_from.name == "identifier",
-            t_from.content == "from",
-            t_colon.name == "colon"
-        ):
-            if rest:
-                return LineFullFrom(indent, parse_bn_pattern(rest))
-            return LineOpenFrom(indent)
-        case [t_with, t_colon, *rest] if alltrue(
-            t_with.name == "identifier",
-            t_with.content == "with",
-            t_colon.name == "colon"
-        ):
-            if rest:
-                change = parse_change(rest)
-                return LineFullWith(indent, With([change]))
-            return LineOpenWith(indent)
-        case [t_if, *rest] if alltrue(
-            t_if.name == "identifier",
-            t_if.content == "if"
-        ):
-            if not rest:
-                raise GgraParserError(
-                    "Parser: Pre-Parsing lines",
-                    ["If expects condition", "However, none was given"]
-                )
-            return LineCondition(
-                indent,
-                parse_condition(rest)
-            )
-        case [t_id, t_arr, t_filename] if alltrue(
-            t_id.name == "identifier",
-            t_arr.name == "arrow_normal",
-            t_filename.name == "string"
-        ):
-            return LineFileNt(indent, t_id.content, set(), t_filename.content[1:-1])
-        case [t_id, t_colon, *rest] if alltrue(
-            t_id.name == "identifier",
-            t_colon.name == "colon"
-        ):
-            if rest:
-                return LineFullNt(indent, t_id.content, set(), parse_bn_pattern(rest))
-            return LineOpenNt(indent, t_id.content, set())
-        case changeline if fits_change(changeline):
-            return LineChange(
-                indent,
-                parse_change(changeline)
-            )
-        case [t_patternstart, *rest] if anytrue(
-            t_patternstart.name == "nonterminal",
-            t_patternstart.name == "string",
-            t_patternstart.name == "epsilon"
-        ):
-            return LineBNPattern(
-                indent,
-                parse_bn_pattern(line)
-            )
-        case [t_id, *rest, t_arr, t_filename] if alltrue(
-            t_id.name == "identifier",
-            t_arr.name == "arrow_normal",
-            t_filename.name == "string",
-            fits_nt_opening(rest)
-        ):
-            close_b_index = index_where(rest, lambda token: token.name == "close_paren")
-            param_names = nt_opening_params(rest[1:close_b_index])
-            return LineFileNt(indent, t_id.content, set(param_names), t_filename.content[1:-1])
-        case [t_id, *rest] if alltrue(
-            t_id.name == "identifier",
-            fits_nt_opening(rest)
-        ):
-            close_b_index = index_where(rest, lambda token: token.name == "close_paren")
-            param_names = nt_opening_params(rest[1:close_b_index])
-            after_header = rest[close_b_index+2:]
-            if after_header:
-                return LineFullNt(indent, t_id.content, set(param_names), parse_bn_pattern(after_header))
-            return LineOpenNt(indent, t_id.content, set(param_names))
-        case otherwise:
-            raise GgraParserError(
-                "Parser: Pre-Parsing lines",
-                ["Could not parse line consisting of tokens:", str(otherwise)]
-            )
+    """Classifies a line (without spaces) by its first token, see LINE_STARTS"""
+    if not line:
+        return parse_other_line(indent, line)
+    first = line[0]
+    parse_line = LINE_STARTS.get((first.name, first.content)) or LINE_STARTS.get(first.name, parse_other_line)
+    return parse_line(indent, line)
+
+def unparsable_line(line: list[Token]) -> GgraParserError:
+    return GgraParserError(
+        "Parser: Pre-Parsing lines",
+        ["Could not parse line consisting of tokens:", str(line)]
+    )
+
+def parse_from_line(indent: int, line: list[Token]) -> Line:
+    if len(line) < 2 or line[1].name != "colon":
+        return parse_identifier_line(indent, line)
+    if len(line) > 2:
+        return LineFullFrom(indent, parse_bn_pattern(line[2:]))
+    return LineOpenFrom(indent)
+
+def parse_with_line(indent: int, line: list[Token]) -> Line:
+    if len(line) < 2 or line[1].name != "colon":
+        return parse_identifier_line(indent, line)
+    if len(line) > 2:
+        change = parse_change(line[2:])
+        return LineFullWith(indent, With([change]))
+    return LineOpenWith(indent)
+
+def parse_if_line(indent: int, line: list[Token]) -> Line:
+    if len(line) == 1:
+        raise GgraParserError(
+            "Parser: Pre-Parsing lines",
+            ["If expects condition", "However, none was given"]
+        )
+    return LineCondition(
+        indent,
+        parse_condition(line[1:])
+    )
+
+def parse_identifier_line(indent: int, line: list[Token]) -> Line:
+    """Nonterminal headers, Nonterminals from files and changes starting with an identifier"""
+    t_id = line[0]
+    if len(line) > 1 and line[1].name == "colon":
+        if len(line) > 2:
+            return LineFullNt(indent, t_id.content, set(), parse_bn_pattern(line[2:]))
+        return LineOpenNt(indent, t_id.content, set())
+    if len(line) == 3 and line[1].name == "arrow_normal" and line[2].name == "string":
+        return LineFileNt(indent, t_id.content, set(), line[2].content[1:-1])
+
+    # one pass for everything the other forms need
+    is_change = False
+    close_index = None
+    for i, token in enumerate(line):
+        if token.name in ("arrow_double", "arrow_labeled"):
+            is_change = True
+            break
+        if close_index is None and token.name == "close_paren":
+            close_index = i
+    if is_change:
+        return LineChange(indent, parse_change(line))
+
+    # header with parameters: Nt(a, b) ... or Nt(a, b) -> "file.json"
+    if close_index is None or len(line) < 4 or line[1].name != "open_paren":
+        raise unparsable_line(line)
+    param_names = nt_opening_params(line[2:close_index])
+    if len(line) >= 6 and line[-2].name == "arrow_normal" and line[-1].name == "string":
+        return LineFileNt(indent, t_id.content, set(param_names), line[-1].content[1:-1])
+    after_header = line[close_index+2:]
+    if after_header:
+        return LineFullNt(indent, t_id.content, set(param_names), parse_bn_pattern(after_header))
+    return LineOpenNt(indent, t_id.content, set(param_names))
+
+def parse_pattern_line(indent: int, line: list[Token]) -> Line:
+    for token in line:
+        if token.name not in ("string", "nonterminal", "epsilon"):
+            # not a pattern; a change that starts with a string, or an error
+            return parse_other_line(indent, line)
+    return LineBNPattern(
+        indent,
+        parse_bn_pattern(line)
+    )
+
+def parse_other_line(indent: int, line: list[Token]) -> Line:
+    if fits_change(line):
+        return LineChange(
+            indent,
+            parse_change(line)
+        )
+    if line and line[0].name in ("string", "nonterminal", "epsilon"):
+        # raises the error of the pattern
+        parse_bn_pattern(line)
+    raise unparsable_line(line)
+
+LINE_STARTS = {
+    # first token (name, content) or name -> parser of the line
+    ("identifier", "from"): parse_from_line,
+    ("identifier", "with"): parse_with_line,
+    ("identifier", "if"):   parse_if_line,
+    "identifier":           parse_identifier_line,
+    "string":               parse_pattern_line,
+    "nonterminal":          parse_pattern_line,
+    "epsilon":              parse_pattern_line,
+}
 
 def parse_bn_pattern(line: list[Token]) -> PatternBNForm:
     elements = []
@@ -391,6 +407,11 @@ def group_pattern_def(structures: list[LineBNPattern|PatternFrom|With|LineFullWi
 
 #-----------------------
 def parse_group(group: list[LineBNPattern|PatternFrom|With|LineFullWith|LineCondition]) -> Pattern:
+    if not isinstance(group[0], (LineBNPattern, PatternFrom)):
+        raise GgraParserError(
+            "Parser: Parsing modifiers of a pattern",
+            ["Pattern expected before changes (with) or condition (if)", f"got type {group[0].__class__.__name__!r}"]
+        )
     current = group[0] if isinstance(group[0], PatternFrom) else PatternBNForm(group[0].content.elements)
 
     for obj in group[1:]:
@@ -448,10 +469,53 @@ def parse_context(context_structures: list[Line]):
 
 #-----------------------
 @time_info("Parsing the file")
-def parse_file(file: TextIO) -> list[Nt]:
-    return parse_file_from_lines(make_lines(line_iterator(file.read())))
-
-def parse_file_from_lines(parsed_lines: Iterator[Line]) -> list[Nt]:
+def parse_file(file: TextIO, share: bool = True) -> Grammar:
+    """Parses a grammar file.\n
+    With share, structurally equal nodes of the result are shared (see node_sharing);
+    the grammar's sharing_report tells how much memory that saved."""
+    grammar = parse_file_from_lines(make_lines(line_iterator(file.read())))
+    if share:
+        grammar.sharing_report = share_nodes(grammar)
+    return grammar
+
+@dataclass
+class ParseThroughput:
+    """Best time of each parsing stage over the repetitions of benchmark_parse"""
+    lines: int
+    characters: int
+    lexing: float
+    classifying: float
+    building: float
+
+    def lines_report(self) -> list[str]:
+        total = self.lexing + self.classifying + self.building
+        rate = lambda seconds: f"{self.lines / seconds if seconds > 0 else float('inf'):12.0f} lines/s"
+        return [
+            f"{self.lines} lines, {self.characters / 1024:.1f} KiB",
+            f"lexing:      {self.lexing:8.4f}s {rate(self.lexing)}",
+            f"classifying: {self.classifying:8.4f}s {rate(self.classifying)}",
+            f"building:    {self.building:8.4f}s {rate(self.building)}",
+            f"total:       {total:8.4f}s {rate(total)}",
+        ]
+
+    def __str__(self) -> str:
+        return "\n".join(self.lines_report())
+
+def benchmark_parse(text: str, repeat: int = 5) -> ParseThroughput:
+    """Times lexing, line classification (make_lines) and building the grammar separately"""
+    best = [float("inf")] * 3
+    for _ in range(repeat):
+        start = perf_counter()
+        token_line_list = list(line_iterator(text))
+        lexed = perf_counter()
+        lines = list(make_lines(iter(token_line_list)))
+        classified = perf_counter()
+        parse_file_from_lines(iter(lines))
+        built = perf_counter()
+        best = [min(old, new) for old, new in zip(best, (lexed - start, classified - lexed, built - classified))]
+    return ParseThroughput(len(token_line_list), len(text), *best)
+
+def parse_file_from_lines(parsed_lines: Iterator[Line]) -> Grammar:
     contexts = [
         [0, []]
     ] # List of indents and structures on that level
@@ -493,6 +557,11 @@ def parse_file_from_lines(parsed_lines: Iterator[Line]) -> list[Nt]:
     
     # Closing of contexts
     indent_here, structures = contexts[-1]
+    if indent_here is None:
+        raise GgraParserError(
+            "Parser: Parsing file from indented contexts",
+            ["Content of a context needs to be indented:", f"(context opened by {structures[0]!r} is empty)"]
+        )
     while indent_here > 0:
         parsed_context = parse_context(structures)
         contexts.pop()
@@ -501,9 +570,9 @@ def parse_file_from_lines(parsed_lines: Iterator[Line]) -> list[Nt]:
         
     return standardize_nts(contexts[0][1])
 
-def standardize_nts(nt_defs: list[NtDefinition|LineFullNt|LineFileNt]) -> list[Nt]:
+def standardize_nts(nt_defs: list[NtDefinition|LineFullNt|LineFileNt]) -> Grammar:
     """so that LineFullNt lines  also are converted to Nts"""
-    definitions = []
+    definitions = Grammar()
     for definition in nt_defs:
         if isinstance(definition, NtDefinition):
             definitions.append(definition)
@@ -0,0 +1,237 @@
+from dataclasses import dataclass
+from itertools import product
+from typing import Callable, Iterator
+
+from .environments import Environment
+from .structures import (
+    Change,
+    ElementNonterminal,
+    Nt,
+    NtDefinition,
+    NtFile,
+    Pattern,
+    PatternBNForm,
+    PatternFrom,
+    PatternIf,
+    PatternWith,
+    SourceChoice,
+    SourceIdentifier,
+    SourceNonterminal,
+    SourceString,
+    as_grammar,
+    sort_changes
+)
+from .helpers import separate
+
+# A Nonterminal instance: its name and its parameters
+State = tuple[str, Environment]
+
+@dataclass
+class Expansion:
+    """One way to resolve a State, with the probability resolve_nt chooses it.\n
+    items are terminals (str) and child slots (int), children the State of each slot.
+    Like in fill_in_pattern, all <X> of a pattern share one slot, every <~X> has its own.\n
+    trace names the choices taken by the expansion (see pattern_alternatives)."""
+    probability: float
+    items: tuple[str | int, ...]
+    children: tuple[State, ...]
+    trace: tuple[tuple, ...] = ()
+
+    def terminals(self) -> Iterator[str]:
+        return (item for item in self.items if isinstance(item, str))
+
+class ResolutionFailure(Exception):
+    """Resolving a pattern would raise in resolve_nt"""
+
+#=================================
+# Patterns
+def pattern_alternatives(pattern: Pattern, params: Environment, probability: float) -> list[tuple[float, list, list[Change], tuple]]:
+    """All (probability, elements, changes, trace) a pattern can resolve to, like Pattern.resolve.\n
+    The trace holds ("from", id(pattern), index) for every chosen subpattern
+    and ("if", id(pattern)) for every fulfilled condition."""
+    if isinstance(pattern, PatternBNForm):
+        return [(probability, pattern.elements, [], ())]
+    if isinstance(pattern, PatternIf):
+        try:
+            fulfilled = pattern.condition.evaluate(params)
+        except Exception:
+            return []
+        if not fulfilled:
+            return []
+        return [
+            (p, elements, changes, (("if", id(pattern)),) + trace)
+            for p, elements, changes, trace in pattern_alternatives(pattern.subpattern, params, probability)
+        ]
+    if isinstance(pattern, PatternWith):
+        return [
+            (p, elements, changes + pattern.changes.changes, trace)
+            for p, elements, changes, trace in pattern_alternatives(pattern.subpattern, params, probability)
+        ]
+    # PatternFrom: uniform among the subpatterns that resolve at all
+    alternatives = [pattern_alternatives(sub, params, 1.) for sub in pattern.subpatterns]
+    resolving = [i for i, sub_alternatives in enumerate(alternatives) if sub_alternatives]
+    share = probability / len(resolving) if resolving else 0.
+    return [
+        (p * share, elements, changes, (("from", id(pattern), i),) + trace)
+        for i in resolving
+        for p, elements, changes, trace in alternatives[i]
+    ]
+
+def decided_configurations(changes: list[Change]) -> Iterator[tuple[float, list[Change]]]:
+    """Splits changes with a SourceChoice into all decided variants and their probability"""
+    options = [
+        change.source.options if isinstance(change.source, SourceChoice) else [change.source]
+        for change in changes
+    ]
+    for sources in product(*options):
+        probability = 1.
+        for opts in options:
+            probability /= len(opts)
+        decided = [
+            Change(source, change.target_nt_name, change.target_nt_param)
+            for source, change in zip(sources, changes)
+        ]
+        yield probability, decided
+
+def nt_configuration(elements: list, changes: list[Change], params: Environment) -> dict[str, dict[str, str]]:
+    """Parameters of the Nonterminals in elements, like in NtDefinition.resolve"""
+    nts = set(elem.name.removeprefix("~") for elem in elements if isinstance(elem, ElementNonterminal))
+    nt_changes, constant_changes = separate(changes, lambda change: isinstance(change.source, SourceNonterminal))
+    nt_config = {nt_name: {} for nt_name in nts}
+    for change in constant_changes:
+        if change.target_nt_name not in nt_config:
+            raise ResolutionFailure(f"Nonterminal {change.target_nt_name} does not exist")
+        if isinstance(change.source, SourceIdentifier):
+            if change.source.name not in params:
+                raise ResolutionFailure(f"Parameter {change.source.name!r} does not exist")
+            nt_config[change.target_nt_name][change.target_nt_param] = params[change.source.name]
+        elif isinstance(change.source, SourceString):
+            nt_config[change.target_nt_name][change.target_nt_param] = change.source.content
+    for change in sort_changes(nt_changes):
+        source_config = nt_config.get(change.source.nt_name, {})
+        if change.target_nt_name not in nt_config or change.source.nt_param not in source_config:
+            raise ResolutionFailure(f"Change {change!r} cannot be executed")
+        nt_config[change.target_nt_name][change.target_nt_param] = source_config[change.source.nt_param]
+    return nt_config
+
+#=================================
+class GrammarGraph:
+    """The grammar as a graph of States (Nonterminal name and parameters) and their Expansions.\n
+    Parameter values only come from string literals, so the graph is finite.
+    States and their expansions are computed when first needed."""
+    def __init__(self, nt_definitions: list[Nt]):
+        self.grammar = as_grammar(nt_definitions)
+        self.environments = self.grammar.environments
+        self._expansions: dict[State, list[Expansion]] = {}
+
+    def state(self, nt_name: str, params: dict[str, str]) -> State:
+        return nt_name, self.environments.environment(params)
+
+    def expansions(self, state: State) -> list[Expansion]:
+        """All expansions of the state; their probabilities sum up to less than 1
+        if resolve_nt can fail for the state"""
+        expansions = self._expansions.get(state)
+        if expansions is None:
+            expansions = list(self._compute_expansions(state))
+            self._expansions[state] = expansions
+        return expansions
+
+    def _compute_expansions(self, state: State) -> Iterator[Expansion]:
+        nt_name, params = state
+        candidates = self.environments.definitions(nt_name, params.schema)
+        for nt in candidates:
+            if isinstance(nt, NtFile):
+                yield from self._file_expansions(nt, params, 1 / len(candidates))
+            elif isinstance(nt, NtDefinition):
+                yield from self._definition_expansions(nt, params, 1 / len(candidates))
+
+    def _definition_expansions(self, nt: NtDefinition, params: Environment, probability: float) -> Iterator[Expansion]:
+        for p_pattern, elements, changes, trace in pattern_alternatives(nt.subpattern, params, probability):
+            for p_decided, decided in decided_configurations(changes):
+                try:
+                    nt_config = nt_configuration(elements, decided, params)
+                except ResolutionFailure:
+                    continue
+                items, children, slots = [], [], {}
+                for elem in elements:
+                    if not isinstance(elem, ElementNonterminal):
+                        items.append(elem.content)
+                        continue
+                    name = elem.name.removeprefix("~")
+                    separately = elem.name.startswith("~")
+                    if separately or name not in slots:
+                        slot = len(children)
+                        children.append((name, self.environments.environment(nt_config[name])))
+                        if not separately:
+                            slots[name] = slot
+                    else:
+                        slot = slots[name]
+                    items.append(slot)
+                yield Expansion(p_pattern * p_decided, tuple(items), tuple(children), trace)
+
+    def _file_expansions(self, nt: NtFile, params: Environment, probability: float) -> Iterator[Expansion]:
+        nt.load_once()
+        order = nt.json_content.get("order")
+        if set(elem for elem in order if elem != "...") != set(params):
+            return
+        def leaves(field, depth: int, p: float, json_path: tuple):
+            if field is None:
+                return
+            if depth == len(order):
+                terminals = (field,) if isinstance(field, str) else tuple(field)
+                yield Expansion(p, terminals, (), (("file", nt.filename, json_path),))
+                return
+            if order[depth] == "..." and isinstance(field, list):
+                for i, sub in enumerate(field):
+                    yield from leaves(sub, depth+1, p / len(field), json_path + (i,))
+            elif order[depth] != "..." and isinstance(field, dict):
+                key = params.get(order[depth])
+                yield from leaves(field.get(key), depth+1, p, json_path + (key,))
+        yield from leaves(nt.json_content.get("content"), 0, probability, ())
+
+    #-----------------------
+    def reachable(self, roots: list[State]) -> list[State]:
+        """All states reachable from the roots, in the order they are found"""
+        seen = dict.fromkeys(roots)
+        todo = list(roots)
+        while todo:
+            state = todo.pop()
+            for expansion in self.expansions(state):
+                for child in expansion.children:
+                    if child not in seen:
+                        seen[child] = None
+                        todo.append(child)
+        return list(seen)
+
+    def fixpoint(self, states: list[State], update: Callable[[State], bool]):
+        """Calls update for states until it returns False for all of them.\n
+        update(state) recomputes a value of the state and returns whether it changed;
+        after a change, the states with an expansion using that state are updated again."""
+        parents: dict[State, set[State]] = {state: set() for state in states}
+        for state in states:
+            for expansion in self.expansions(state):
+                for child in expansion.children:
+                    parents[child].add(state)
+        todo = list(states)
+        queued = set(states)
+        while todo:
+            state = todo.pop()
+            queued.discard(state)
+            if update(state):
+                for parent in parents[state]:
+                    if parent not in queued:
+                        queued.add(parent)
+                        todo.append(parent)
+
+    def productive(self, roots: list[State]) -> set[State]:
+        """States that can be resolved without error (with finitely many expansions)"""
+        productive = set()
+        def update(state: State) -> bool:
+            if state in productive:
+                return False
+            if any(all(child in productive for child in expansion.children) for expansion in self.expansions(state)):
+                productive.add(state)
+                return True
+            return False
+        self.fixpoint(self.reachable(roots), update)
+        return productive
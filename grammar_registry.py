@@ -0,0 +1,188 @@
+import json
+import sys
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, fields, is_dataclass
+from hashlib import blake2b
+from threading import Lock
+from time import perf_counter
+from typing import Callable
+
+from .gram_parser import parse_file
+from .nt_files import json_size, prefetch_nt_files
+from .structures import Grammar, NtFile
+
+@dataclass
+class RegistryMetrics:
+    loads: int = 0
+    hits: int = 0
+    evictions: int = 0
+    shared_vocabularies: int = 0
+    """files whose content was already held for another grammar (or another file of the same grammar)"""
+    load_seconds: float = 0.
+
+    def lines(self) -> list[str]:
+        requests = self.loads + self.hits
+        return [
+            f"loads: {self.loads} ({self.load_seconds:.2f}s), hits: {self.hits} ({self.hits / requests if requests else 0:.1%} of requests)",
+            f"evictions: {self.evictions}, shared vocabularies: {self.shared_vocabularies}",
+        ]
+
+    def __str__(self) -> str:
+        return "\n".join(self.lines())
+
+@dataclass
+class Vocabulary:
+    """Content of NtFiles shared by all grammars of a registry that use it"""
+    json_content: dict
+    size: int
+    users: int = 0
+
+@dataclass
+class RegistryEntry:
+    grammar: Grammar
+    size: int
+    """estimated bytes of the parsed nodes, without vocabularies"""
+    vocabularies: list[bytes]
+
+def node_size(obj, seen: set[int]) -> int:
+    """Estimated bytes (sys.getsizeof) of a grammar node and everything below it not in seen"""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(node_size(item, seen) for item in obj)
+    elif is_dataclass(obj):
+        size += sum(node_size(getattr(obj, field.name), seen) for field in fields(obj))
+    return size
+
+def vocabulary_key(json_content) -> bytes:
+    """Equal for equal contents, whatever file they come from"""
+    canonical = json.dumps(json_content, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return blake2b(canonical.encode("utf-8"), digest_size=16).digest()
+
+#=================================
+class GrammarRegistry:
+    """Parsed grammars by key, loaded on demand and evicted least recently used first
+    when their estimated memory exceeds byte_budget.\n
+    locate maps a key to the path of its .ggra file (by default, the key is the path).
+    Equal NtFile contents are held once for all grammars that use them and count once
+    towards the budget. The grammar that was just requested is never evicted, even if it
+    alone exceeds the budget.\n
+    Thread-safe. Grammars are parsed outside the registry's lock, so requests for loaded
+    grammars do not wait for others being loaded; concurrent requests for the same key
+    wait for one load."""
+    def __init__(self, byte_budget: int, locate: Callable[[str], str] = lambda key: key):
+        self.byte_budget = byte_budget
+        self.locate = locate
+        self.entries: OrderedDict[str, RegistryEntry] = OrderedDict()
+        self.vocabularies: dict[bytes, Vocabulary] = {}
+        self.loading: dict[str, Future] = {}
+        self.metrics = RegistryMetrics()
+        self.lock = Lock()
+        self._memory = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def memory(self) -> int:
+        """Estimated bytes of all loaded grammars and their vocabularies"""
+        return self._memory
+
+    def get(self, key: str) -> Grammar:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.metrics.hits += 1
+                return entry.grammar
+            loading = self.loading.get(key)
+            if loading is None:
+                loading = self.loading[key] = Future()
+                loads = True
+            else:
+                self.metrics.hits += 1
+                loads = False
+        if not loads:
+            return loading.result()
+
+        try:
+            start = perf_counter()
+            grammar = self.load(key)
+            seconds = perf_counter() - start
+        except BaseException as error:
+            with self.lock:
+                del self.loading[key]
+            loading.set_exception(error)
+            raise
+        with self.lock:
+            self.entries[key] = self.share_vocabularies(grammar)
+            self.metrics.loads += 1
+            self.metrics.load_seconds += seconds
+            del self.loading[key]
+            self.shrink(keep=key)
+        loading.set_result(grammar)
+        return grammar
+
+    def load(self, key: str) -> Grammar:
+        """Parses the grammar of key and loads its files, without changing the registry"""
+        with open(self.locate(key), "r", encoding="utf-8") as file:
+            grammar = parse_file(file)
+        prefetch_nt_files(grammar)
+        return grammar
+
+    def share_vocabularies(self, grammar: Grammar) -> RegistryEntry:
+        """Points the NtFiles of grammar at the registry's copy of their contents;
+        call under the lock"""
+        vocabularies = []
+        contents = {}
+        for nt in grammar:
+            if not isinstance(nt, NtFile):
+                continue
+            shared = contents.get(id(nt.json_content))
+            if shared is None:
+                vocabulary_id = vocabulary_key(nt.json_content)
+                vocabulary = self.vocabularies.get(vocabulary_id)
+                if vocabulary is None:
+                    vocabulary = self.vocabularies[vocabulary_id] = Vocabulary(nt.json_content, json_size(nt.json_content))
+                    self._memory += vocabulary.size
+                else:
+                    self.metrics.shared_vocabularies += 1
+                if vocabulary_id not in vocabularies:
+                    vocabularies.append(vocabulary_id)
+                    vocabulary.users += 1
+                shared = contents[id(nt.json_content)] = vocabulary.json_content
+            nt.json_content = shared
+
+        entry = RegistryEntry(grammar, node_size(grammar, set()), vocabularies)
+        self._memory += entry.size
+        return entry
+
+    def shrink(self, keep: str | None = None):
+        """Evicts grammars until the memory fits the budget; call under the lock"""
+        while self._memory > self.byte_budget and len(self.entries) > (1 if keep in self.entries else 0):
+            key = next(iter(self.entries))
+            if key == keep:
+                self.entries.move_to_end(key)
+                key = next(iter(self.entries))
+            self._evict(key)
+
+    def evict(self, key: str):
+        with self.lock:
+            if key in self.entries:
+                self._evict(key)
+
+    def _evict(self, key: str):
+        entry = self.entries.pop(key)
+        self._memory -= entry.size
+        for vocabulary_id in entry.vocabularies:
+            vocabulary = self.vocabularies[vocabulary_id]
+            vocabulary.users -= 1
+            if vocabulary.users == 0:
+                del self.vocabularies[vocabulary_id]
+                self._memory -= vocabulary.size
+        self.metrics.evictions += 1
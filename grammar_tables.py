@@ -0,0 +1,489 @@
+import mmap
+import random
+import struct
+from array import array
+from bisect import bisect_left
+from multiprocessing import shared_memory
+from random import Random
+
+from .change_graph import Graph
+from .ggra_errors import UnresolvableError
+from .helpers import shuffle
+from .nt_files import prefetch_nt_files
+from .structures import (
+    Change,
+    ConditionEq,
+    ConditionNeq,
+    ElementNonterminal,
+    ElementString,
+    ExpressionChoice,
+    ExpressionIdentifier,
+    ExpressionString,
+    Nt,
+    NtFile,
+    PatternBNForm,
+    PatternFrom,
+    PatternIf,
+    PatternWith,
+    SourceChoice,
+    SourceIdentifier,
+    SourceNonterminal,
+    SourceString,
+    build_guard_index
+)
+
+# Node kinds; a, b and the children of each kind
+K_BN            = 0  # children: elements
+K_FROM          = 1  # children: subpatterns
+K_IF            = 2  # children: subpattern, condition
+K_WITH          = 3  # children: subpattern, changes...
+K_EL_STRING     = 4  # a: terminal
+K_EL_NT         = 5  # a: name (without ~), b: 1 for <~X>
+K_CHANGE        = 6  # a: target Nonterminal, b: target parameter, children: source
+K_SRC_NT        = 7  # a: Nonterminal, b: parameter
+K_SRC_STRING    = 8  # a: string
+K_SRC_ID        = 9  # a: parameter name
+K_SRC_CHOICE    = 10 # children: options
+K_EXPR_ID       = 11 # a: parameter name
+K_EXPR_STRING   = 12 # a: string
+K_EXPR_CHOICE   = 13 # children: options
+K_COND_EQ       = 14 # children: first, second
+K_COND_NEQ      = 15 # children: first, second
+K_JSON_STRING   = 16 # a: string
+K_JSON_LIST     = 17 # children: items
+K_JSON_DICT     = 18 # children: entries, sorted by key
+K_JSON_ENTRY    = 19 # a: key, children: value
+K_JSON_NULL     = 20
+
+DEF_PATTERN     = 0
+DEF_FILE        = 1
+CHOOSE          = -1 # "..." in the order of a file
+
+MAGIC   = b"GGRATBL1"
+COLUMNS = (
+    # name, typecode
+    ("string_offsets", "q"), ("sorted_strings", "i"),
+    ("kind", "i"), ("a", "i"), ("b", "i"), ("child_start", "i"), ("child_count", "i"), ("child", "i"),
+    ("def_kind", "i"), ("def_name", "i"), ("def_root", "i"),
+    ("def_param_start", "i"), ("def_param_count", "i"), ("def_order_start", "i"), ("def_order_count", "i"),
+    ("params", "i"), ("order", "i"),
+)
+HEADER = struct.Struct(f"<8s{2 * (len(COLUMNS) + 1)}q") # offset and length of every column and the pool
+
+#=================================
+# Export
+class TableWriter:
+    """Flattens a grammar into the columns of GrammarTables"""
+    def __init__(self):
+        self.string_ids: dict[str, int] = {}
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS}
+        self.columns["string_offsets"].append(0)
+        self.pool = bytearray()
+        self.encoded: dict[int, int] = {}
+        self.string("")
+
+    def string(self, string: str) -> int:
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = len(self.string_ids)
+            self.string_ids[string] = string_id
+            self.pool += string.encode("utf-8")
+            self.columns["string_offsets"].append(len(self.pool))
+        return string_id
+
+    def node(self, kind: int, a: int = 0, b: int = 0, children: list[int] = ()) -> int:
+        columns = self.columns
+        node_id = len(columns["kind"])
+        columns["kind"].append(kind)
+        columns["a"].append(a)
+        columns["b"].append(b)
+        columns["child_start"].append(len(columns["child"]))
+        columns["child_count"].append(len(children))
+        columns["child"].extend(children)
+        return node_id
+
+    def encode(self, obj) -> int:
+        """Node id of a pattern, element, change, source or condition; shared nodes are encoded once"""
+        node_id = self.encoded.get(id(obj))
+        if node_id is None:
+            node_id = self._encode(obj)
+            self.encoded[id(obj)] = node_id
+        return node_id
+
+    def _encode(self, obj) -> int:
+        s, encode = self.string, self.encode
+        match obj:
+            case PatternBNForm(elements):
+                return self.node(K_BN, children=[encode(element) for element in elements])
+            case PatternFrom(subpatterns):
+                return self.node(K_FROM, children=[encode(sub) for sub in subpatterns])
+            case PatternIf(subpattern, condition):
+                return self.node(K_IF, children=[encode(subpattern), encode(condition)])
+            case PatternWith(subpattern, changes):
+                return self.node(K_WITH, children=[encode(subpattern)] + [encode(change) for change in changes.changes])
+            case ElementString(content):
+                return self.node(K_EL_STRING, s(content))
+            case ElementNonterminal(name):
+                return self.node(K_EL_NT, s(name.removeprefix("~")), int(name.startswith("~")))
+            case SourceNonterminal(nt_name, nt_param):
+                return self.node(K_SRC_NT, s(nt_name), s(nt_param))
+            case SourceString(content):
+                return self.node(K_SRC_STRING, s(content))
+            case SourceIdentifier(name):
+                return self.node(K_SRC_ID, s(name))
+            case SourceChoice(options):
+                return self.node(K_SRC_CHOICE, children=[encode(option) for option in options])
+            case ExpressionIdentifier(name):
+                return self.node(K_EXPR_ID, s(name))
+            case ExpressionString(content):
+                return self.node(K_EXPR_STRING, s(content))
+            case ExpressionChoice(options):
+                return self.node(K_EXPR_CHOICE, children=[encode(option) for option in options])
+            case ConditionEq(first, second):
+                return self.node(K_COND_EQ, children=[encode(first), encode(second)])
+            case ConditionNeq(first, second):
+                return self.node(K_COND_NEQ, children=[encode(first), encode(second)])
+            case Change(source, target_nt_name, target_nt_param):
+                return self.node(K_CHANGE, s(target_nt_name), s(target_nt_param), [encode(source)])
+        raise TypeError(f"TableWriter.encode # cannot encode {obj!r}")
+
+    def encode_json(self, field) -> int:
+        if isinstance(field, str):
+            return self.node(K_JSON_STRING, self.string(field))
+        if isinstance(field, list):
+            return self.node(K_JSON_LIST, children=[self.encode_json(sub) for sub in field])
+        if isinstance(field, dict):
+            entries = sorted((self.string(key), self.encode_json(sub)) for key, sub in field.items())
+            return self.node(K_JSON_DICT, children=[self.node(K_JSON_ENTRY, key, 0, [value]) for key, value in entries])
+        return self.node(K_JSON_NULL)
+
+    def definition(self, nt: Nt):
+        columns = self.columns
+        columns["def_name"].append(self.string(nt.name))
+        columns["def_param_start"].append(len(columns["params"]))
+        columns["def_param_count"].append(len(nt.param_names))
+        columns["params"].extend(sorted(self.string(name) for name in nt.param_names))
+        columns["def_order_start"].append(len(columns["order"]))
+        if isinstance(nt, NtFile):
+            order = nt.json_content.get("order", [])
+            columns["def_kind"].append(DEF_FILE)
+            columns["def_root"].append(self.encode_json(nt.json_content.get("content")))
+            columns["def_order_count"].append(len(order))
+            columns["order"].extend(CHOOSE if specifier == "..." else self.string(specifier) for specifier in order)
+        else:
+            columns["def_kind"].append(DEF_PATTERN)
+            columns["def_root"].append(self.encode(nt.subpattern))
+            columns["def_order_count"].append(0)
+
+    def to_bytes(self) -> bytes:
+        strings = self.columns["sorted_strings"]
+        strings.extend(sorted(range(len(self.string_ids)), key=lambda i: self.string_bytes(i)))
+        sections = [self.columns[name].tobytes() for name, _ in COLUMNS] + [bytes(self.pool)]
+        layout = []
+        position = HEADER.size
+        for section in sections:
+            layout += [position, len(section)]
+            position += len(section) + (-len(section) % 8)
+        buffer = bytearray(HEADER.pack(MAGIC, *layout))
+        for section in sections:
+            buffer += section + bytes(-len(section) % 8)
+        return bytes(buffer)
+
+    def string_bytes(self, string_id: int) -> bytes:
+        offsets = self.columns["string_offsets"]
+        return bytes(self.pool[offsets[string_id]:offsets[string_id+1]])
+
+def export_tables(nt_definitions: list[Nt]) -> bytes:
+    """The grammar and the contents of its files as one flat buffer (see GrammarTables).\n
+    Loads all NtFiles; raises GgraFileError if one of them cannot be used."""
+    prefetch_nt_files(nt_definitions)
+    writer = TableWriter()
+    for nt in nt_definitions:
+        writer.definition(nt)
+    return writer.to_bytes()
+
+def write_tables(nt_definitions: list[Nt], filename: str):
+    with open(filename, "wb") as doc:
+        doc.write(export_tables(nt_definitions))
+
+def share_tables(nt_definitions: list[Nt], name: str | None = None) -> shared_memory.SharedMemory:
+    """Exports the grammar into a new shared memory block that workers can attach to by its name.\n
+    The caller owns the block: close() and unlink() it when all workers are done."""
+    buffer = export_tables(nt_definitions)
+    block = shared_memory.SharedMemory(name=name, create=True, size=len(buffer))
+    block.buf[:len(buffer)] = buffer
+    return block
+
+#=================================
+# Attaching
+class GrammarTables:
+    """A grammar as flat integer columns and a string pool in one buffer,
+    e.g. shared memory or a mapped file. The columns are read through memoryviews,
+    so attaching copies nothing and the buffer never gets written to.\n
+    resolve_nt works like structures.resolve_nt and makes the same random choices:
+    with equally seeded generators, both return the same sentences."""
+    def __init__(self, buffer, owner = None):
+        self.buffer = memoryview(buffer)
+        self.owner  = owner # keeps a mapped file or shared memory block open
+        magic, *layout = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError("GrammarTables # buffer does not hold GGRA grammar tables")
+        sections = [self.buffer[start:start + length] for start, length in zip(layout[::2], layout[1::2])]
+        for (name, typecode), section in zip(COLUMNS, sections):
+            setattr(self, name, section.cast(typecode))
+        self.pool = sections[-1]
+        self.string_count = len(self.string_offsets) - 1
+        self._candidates: dict[tuple, list[int]] | None = None
+        self._guard_indexes: dict[int, object] = {}
+
+    def release(self):
+        """Releases the memoryviews, so the buffer can be closed"""
+        for name, _ in COLUMNS:
+            getattr(self, name).release()
+        self.pool.release()
+        self.buffer.release()
+
+    #-----------------------
+    # Strings
+    def string(self, string_id: int) -> str:
+        return str(self.pool[self.string_offsets[string_id]:self.string_offsets[string_id+1]], "utf-8")
+
+    def string_id(self, string: str) -> int | None:
+        """Id of a string of the pool, None if the grammar does not contain it"""
+        encoded = string.encode("utf-8")
+        key = lambda i: bytes(self.pool[self.string_offsets[i]:self.string_offsets[i+1]])
+        position = bisect_left(self.sorted_strings, encoded, key=key)
+        if position < len(self.sorted_strings) and key(self.sorted_strings[position]) == encoded:
+            return self.sorted_strings[position]
+        return None
+
+    def children(self, node: int) -> memoryview:
+        start = self.child_start[node]
+        return self.child[start:start + self.child_count[node]]
+
+    #-----------------------
+    # Resolution
+    def candidates(self, name: int, param_names: tuple[int, ...]) -> list[int]:
+        if self._candidates is None:
+            # small: one entry per definition
+            index = {}
+            for d in range(len(self.def_name)):
+                start = self.def_param_start[d]
+                key = (self.def_name[d], tuple(self.params[start:start + self.def_param_count[d]]))
+                index.setdefault(key, []).append(d)
+            self._candidates = index
+        return self._candidates.get((name, param_names), [])
+
+    def resolve_nt(self, nt_name: str, params: dict[str, str], rng: Random = random) -> list[str]:
+        """Like structures.resolve_nt on the grammar the tables were exported from"""
+        unknown = {} # strings not in the pool get ids after it
+        def string_id(string: str) -> int:
+            string_id = self.string_id(string)
+            if string_id is None:
+                string_id = unknown.setdefault(string, self.string_count + len(unknown))
+            return string_id
+        name = string_id(nt_name)
+        return self._resolve(name, {string_id(key): string_id(value) for key, value in params.items()}, rng)
+
+    def _resolve(self, name: int, params: dict[int, int], rng) -> list[str]:
+        candidates = self.candidates(name, tuple(sorted(params)))
+        if not candidates:
+            param_names = ", ".join(sorted(self._name(param) for param in params))
+            raise UnresolvableError(f"resolve_nt # There exists no Nonterminal Definition that fits {self._name(name)}({param_names}).")
+        definition = rng.choice(candidates)
+        if self.def_kind[definition] == DEF_FILE:
+            return self._resolve_file(definition, params, rng)
+        return self._resolve_definition(definition, params, rng)
+
+    def _name(self, string_id: int) -> str:
+        return self.string(string_id) if string_id < self.string_count else f"#{string_id}"
+
+    def _resolve_definition(self, definition: int, params: dict[int, int], rng) -> list[str]:
+        resolved = self._resolve_pattern(self.def_root[definition], params, rng)
+        if resolved is None:
+            raise UnresolvableError(f"NtDefinition.resolve # unresolvable subpattern for Nonterminal {self._name(self.def_name[definition])!r}")
+        elements, changes = resolved
+        if not changes:
+            return self._fill_in(elements, {}, rng)
+
+        kind, a, b = self.kind, self.a, self.b
+        nt_config = {a[element]: {} for element in elements if kind[element] == K_EL_NT}
+        nt_changes = []
+        for change in changes:
+            source = self.child[self.child_start[change]]
+            if kind[source] == K_SRC_NT:
+                nt_changes.append(change)
+                continue
+            if kind[source] == K_SRC_CHOICE:
+                source = rng.choice(self.children(source))
+            target, target_param = a[change], b[change]
+            if target not in nt_config:
+                raise UnresolvableError(f"NtDefinition.resolve # Nonterminal {self._name(target)} does not exist.")
+            if kind[source] == K_SRC_ID:
+                if a[source] not in params:
+                    raise UnresolvableError(f"NtDefinition.resolve # Parameter {self._name(a[source])!r} does not exist.")
+                nt_config[target][target_param] = params[a[source]]
+            elif kind[source] == K_SRC_STRING:
+                nt_config[target][target_param] = a[source]
+
+        # same order as structures.sort_changes
+        graph = Graph()
+        for change in nt_changes:
+            graph.add_edge(a[self.child[self.child_start[change]]], a[change])
+        priorities = graph.topological_sort()
+        for change in sorted(nt_changes, key=lambda change: priorities.index(a[self.child[self.child_start[change]]])):
+            source = self.child[self.child_start[change]]
+            nt_config[a[change]][b[change]] = nt_config[a[source]][b[source]]
+        return self._fill_in(elements, nt_config, rng)
+
+    def _resolve_pattern(self, node: int, params: dict[int, int], rng) -> tuple[list[int], list[int]] | None:
+        """(elements, changes) of a pattern like Pattern.resolve, None if it does not resolve"""
+        kind = self.kind[node]
+        if kind == K_BN:
+            return list(self.children(node)), []
+        if kind == K_FROM:
+            subpatterns = self.children(node)
+            for i in shuffle(self._from_candidates(node, params), rng):
+                resolved = self._resolve_pattern(subpatterns[i], params, rng)
+                if resolved is not None:
+                    return resolved
+            return None
+        subpattern, *rest = self.children(node)
+        if kind == K_IF:
+            if not self._truthy(self._evaluate(rest[0], params)):
+                return None
+            return self._resolve_pattern(subpattern, params, rng)
+        # K_WITH
+        resolved = self._resolve_pattern(subpattern, params, rng)
+        if resolved is None:
+            return None
+        return resolved[0], resolved[1] + rest
+
+    def _from_candidates(self, node: int, params: dict[int, int]):
+        """Like PatternFrom.candidates, with string ids"""
+        if node not in self._guard_indexes:
+            self._guard_indexes[node] = build_guard_index([self._pattern_guard(sub) for sub in self.children(node)])
+        index = self._guard_indexes[node]
+        if index is not None:
+            found = index.candidates(params)
+            if found is not None:
+                return found
+        return range(self.child_count[node])
+
+    def _pattern_guard(self, node: int) -> tuple[int, frozenset[int]] | None:
+        """Like structures.pattern_guard"""
+        kind = self.kind
+        while kind[node] == K_WITH:
+            node = self.child[self.child_start[node]]
+        if kind[node] != K_IF:
+            return None
+        condition = self.children(node)[1]
+        if kind[condition] != K_COND_EQ:
+            return None
+        first, second = self.children(condition)
+        if kind[second] == K_EXPR_ID:
+            first, second = second, first
+        if kind[first] != K_EXPR_ID:
+            return None
+        if kind[second] == K_EXPR_STRING:
+            return self.a[first], frozenset([self.a[second]])
+        options = self.children(second) if kind[second] == K_EXPR_CHOICE else []
+        if options and all(kind[option] == K_EXPR_STRING for option in options):
+            return self.a[first], frozenset(self.a[option] for option in options)
+        return None
+
+    def _evaluate(self, node: int, params: dict[int, int]):
+        """Condition value: a string id, a bool, or an iterator of options"""
+        kind = self.kind[node]
+        if kind == K_EXPR_ID:
+            if self.a[node] not in params:
+                raise UnresolvableError(f"Identifier evaluation # identifier {self._name(self.a[node])!r} unknown!")
+            return params[self.a[node]]
+        if kind == K_EXPR_STRING:
+            return self.a[node]
+        if kind == K_EXPR_CHOICE:
+            return (self._evaluate(option, params) for option in self.children(node))
+        first, second = self.children(node)
+        options = lambda part: self._evaluate(part, params) if self.kind[part] == K_EXPR_CHOICE else [self._evaluate(part, params)]
+        equal = lambda x, y: type(x) is type(y) and x == y
+        for option_first in options(first):
+            for option_second in options(second):
+                if equal(option_first, option_second) == (kind == K_COND_EQ):
+                    return True
+        return False
+
+    def _truthy(self, value) -> bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int):
+            # "" is always the string 0; unknown strings are not empty
+            return value != 0
+        return True
+
+    def _fill_in(self, elements: list[int], nt_config: dict[int, dict[int, int]], rng) -> list[str]:
+        terminals = []
+        resolved = {}
+        for element in elements:
+            if self.kind[element] == K_EL_STRING:
+                terminals.append(self.string(self.a[element]))
+                continue
+            name = self.a[element]
+            if self.b[element]:
+                terminals.extend(self._resolve(name, nt_config.get(name, {}), rng))
+                continue
+            if name not in resolved:
+                resolved[name] = self._resolve(name, nt_config.get(name, {}), rng)
+            terminals.extend(resolved[name])
+        return terminals
+
+    def _resolve_file(self, definition: int, params: dict[int, int], rng) -> list[str]:
+        start = self.def_order_start[definition]
+        order = self.order[start:start + self.def_order_count[definition]]
+        order_nochoose = set(specifier for specifier in order if specifier != CHOOSE)
+        name = self._name(self.def_name[definition])
+        if order_nochoose != set(params):
+            raise UnresolvableError(
+                f"NtFile.resolve # parameters {set(map(self._name, params))} for NtFile {name!r} "
+                f"do not fit parameters in file ({set(map(self._name, order_nochoose))})"
+            )
+        field = self.def_root[definition]
+        for specifier in order:
+            if specifier == CHOOSE and self.kind[field] == K_JSON_LIST:
+                field = rng.choice(self.children(field))
+            elif specifier != CHOOSE and self.kind[field] == K_JSON_DICT:
+                entries = self.children(field)
+                key = params[specifier]
+                position = bisect_left(entries, key, key=lambda entry: self.a[entry])
+                if position == len(entries) or self.a[entries[position]] != key:
+                    field = None
+                    break
+                field = self.child[self.child_start[entries[position]]]
+            else:
+                field = None
+                break
+            if self.kind[field] == K_JSON_NULL:
+                field = None
+                break
+        if field is None:
+            shown = dict(sorted((self._name(param), self._name(value)) for param, value in params.items()))
+            raise UnresolvableError(f"NtFile.resolve # no result for params Environment({shown!r}) in Nonterminal from file {name!r}")
+        if self.kind[field] == K_JSON_STRING:
+            return [self.string(self.a[field])]
+        return [self.string(self.a[item]) for item in self.children(field)]
+
+#-----------------------
+def attach_file(filename: str) -> GrammarTables:
+    """Maps a file written by write_tables; processes mapping the same file share its pages"""
+    with open(filename, "rb") as doc:
+        mapped = mmap.mmap(doc.fileno(), 0, access=mmap.ACCESS_READ)
+    return GrammarTables(mapped, mapped)
+
+def attach_shared(name: str) -> GrammarTables:
+    """Attaches to a block created by share_tables.\n
+    Before Python 3.13, attach only from processes started by multiprocessing:
+    the resource tracker of any other process unlinks the block when that process exits."""
+    try:
+        block = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        block = shared_memory.SharedMemory(name=name)
+    return GrammarTables(block.buf, block)
@@ -1,5 +1,6 @@
 
-from random import randint
+import random
+from random import Random
 from time import perf_counter
 from typing import Any, Callable, Iterable, Iterator
 
@@ -60,13 +61,13 @@ def separate(iterable: Iterable, predicate: Callable[[Any], bool]) -> tuple[list
 
 #=================================
 #Fixes
-def shuffle(obj: Iterable) -> Iterator:
+def shuffle(obj: Iterable, rng: Random = random) -> Iterator:
     """Man könnte auch py.random shuffle benutzen, aber dies liefert keinen Iterator"""
     objlen  = len(obj)
     remlen  = objlen
     remaining = list(range(objlen))
     for _ in range(objlen):
-        ii  = randint(0, remlen-1)
+        ii  = rng.randint(0, remlen-1)
         i   = remaining.pop(ii)
         remlen -= 1
         yield obj[i]
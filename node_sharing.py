@@ -0,0 +1,97 @@
+import sys
+from dataclasses import dataclass, fields, is_dataclass
+
+from .structures import Grammar, Nt, PatternFrom, PatternIf
+
+# Nodes that stay unique: traces and coverage targets tell them apart by id
+UNSHARED = (Nt, PatternFrom, PatternIf)
+
+@dataclass
+class SharingReport:
+    """What share_nodes replaced by a shared copy; bytes are estimated with sys.getsizeof"""
+    nodes: int = 0
+    shared_nodes: int = 0
+    strings: int = 0
+    shared_strings: int = 0
+    bytes_saved: int = 0
+
+    def lines(self) -> list[str]:
+        return [
+            f"nodes: {self.nodes}, replaced by a shared node: {self.shared_nodes}",
+            f"strings: {self.strings}, replaced by an interned string: {self.shared_strings}",
+            f"memory saved: about {self.bytes_saved / 1024:.1f} KiB",
+        ]
+
+    def __str__(self) -> str:
+        return "\n".join(self.lines())
+
+#=================================
+class NodeTable:
+    """Hash-consing of grammar nodes: structurally equal nodes are replaced by one shared node,
+    strings by their interned version (sys.intern).\n
+    Nodes are shared bottom-up, so the key of a node holds the ids of its (already shared)
+    children. Shared nodes must not be modified; the parser and the engine never do."""
+    def __init__(self):
+        self.nodes: dict[tuple, object] = {}
+        self.report = SharingReport()
+
+    def share_string(self, string: str) -> str:
+        self.report.strings += 1
+        interned = sys.intern(string)
+        if interned is not string:
+            self.report.shared_strings += 1
+            self.report.bytes_saved += sys.getsizeof(string)
+        return interned
+
+    def share(self, node):
+        """The shared version of node; its fields are replaced by shared children"""
+        if type(node) is str:
+            return self.share_string(node)
+        if isinstance(node, list):
+            return [self.share(child) for child in node]
+        if not is_dataclass(node):
+            return node
+
+        self.report.nodes += 1
+        key = [type(node)]
+        size = sys.getsizeof(node)
+        for field in fields(node):
+            value = getattr(node, field.name)
+            shared = self.share(value)
+            if shared is not value:
+                setattr(node, field.name, shared)
+            if isinstance(shared, list):
+                key.append(tuple(self.key_part(child) for child in shared))
+                size += sys.getsizeof(shared)
+            else:
+                key.append(self.key_part(shared))
+        if isinstance(node, UNSHARED):
+            return node
+
+        key = tuple(key)
+        existing = self.nodes.get(key)
+        if existing is None:
+            self.nodes[key] = node
+            return node
+        self.report.shared_nodes += 1
+        self.report.bytes_saved += size
+        return existing
+
+    @staticmethod
+    def key_part(value):
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (set, frozenset)):
+            return frozenset(value)
+        # shared nodes are unique, so their identity stands for their structure
+        return id(value)
+
+def share_nodes(nt_definitions: list[Nt], table: NodeTable | None = None) -> SharingReport:
+    """Replaces structurally equal patterns, elements, conditions and changes in the
+    definitions by shared nodes and interns their strings, in place.\n
+    'from' and 'if' patterns stay unique (they are told apart by identity).
+    Pass a table to share nodes across several grammars."""
+    table = table or NodeTable()
+    for nt in nt_definitions:
+        table.share(nt)
+    return table.report
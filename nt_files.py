@@ -0,0 +1,187 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import json
+from os import path
+import sys
+
+from .ggra_errors import GgraFileError
+from .grammar_graph import GrammarGraph
+from .structures import Nt, NtFile
+
+def load_json_file(filename: str) -> tuple[dict | None, list[str]]:
+    """Loads a Nonterminal JSON file; returns its content (None on failure) and the problems found"""
+    if not path.exists(filename):
+        return None, [f"{filename!r}: file does not exist"]
+    try:
+        with open(filename, "r", encoding="utf-8") as doc:
+            json_content = json.load(doc)
+    except (OSError, UnicodeDecodeError, json.JSONDecodeError) as error:
+        return None, [f"{filename!r}: cannot be read ({error})"]
+    return json_content, check_json_layout(filename, json_content)
+
+def check_json_layout(filename: str, json_content) -> list[str]:
+    """Problems with the 'order'/'content' layout of a Nonterminal JSON file"""
+    if not isinstance(json_content, dict):
+        return [f"{filename!r}: expected an object with 'order' and 'content'"]
+    order = json_content.get("order")
+    if not isinstance(order, list) or not all(isinstance(specifier, str) for specifier in order):
+        return [f"{filename!r}: 'order' must be a list of parameter names and \"...\""]
+    if "content" not in json_content:
+        return [f"{filename!r}: 'content' is missing"]
+
+    problems = []
+    def check(field, depth: int, location: str):
+        if len(problems) >= 5:
+            return
+        if depth == len(order):
+            if isinstance(field, str):
+                return
+            if isinstance(field, list) and all(isinstance(terminal, str) for terminal in field):
+                return
+            problems.append(f"{filename!r}: {location} must be a string or a list of strings")
+            return
+        if order[depth] == "...":
+            if not isinstance(field, list) or not field:
+                problems.append(f"{filename!r}: {location} must be a non-empty list (for \"...\")")
+                return
+            for i, sub in enumerate(field):
+                check(sub, depth+1, f"{location}[{i}]")
+            return
+        if not isinstance(field, dict):
+            problems.append(f"{filename!r}: {location} must be an object (for {order[depth]!r})")
+            return
+        for key, sub in field.items():
+            check(sub, depth+1, f"{location}[{key!r}]")
+
+    check(json_content["content"], 0, "content")
+    return problems
+
+def check_nt_params(nt: NtFile, json_content: dict) -> list[str]:
+    order_nochoose = set(elem for elem in json_content["order"] if elem != "...")
+    if order_nochoose != set(nt.param_names):
+        return [f"{nt.filename!r}: parameters {sorted(order_nochoose)} of the file do not fit Nonterminal {nt.name}({', '.join(sorted(nt.param_names))})"]
+    return []
+
+def prefetch_nt_files(nt_definitions: list[Nt], max_workers: int = 8):
+    """Loads and validates the files of all NtFile definitions concurrently.\n
+    Like NtFile.load_once, files whose content is already set (e.g. pruned or shared by a
+    GrammarRegistry) are not loaded again; their content is only validated.
+    Definitions naming the same file share its content. Raises a GgraFileError listing
+    all problems; if there are none, no file is loaded lazily during resolution."""
+    nt_files = [nt for nt in nt_definitions if isinstance(nt, NtFile)]
+    to_load = [nt for nt in nt_files if nt.json_content is None]
+    filenames = list(dict.fromkeys(nt.filename for nt in to_load))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        loaded = dict(zip(filenames, pool.map(load_json_file, filenames)))
+
+    problems = []
+    for filename in filenames:
+        problems += loaded[filename][1]
+    checked = set()
+    for nt in nt_files:
+        if nt.json_content is None:
+            json_content = loaded[nt.filename][0]
+        else:
+            json_content = nt.json_content
+            if id(json_content) not in checked:
+                checked.add(id(json_content))
+                problems += check_json_layout(nt.filename, json_content)
+        if isinstance(json_content, dict) and isinstance(json_content.get("order"), list):
+            problems += check_nt_params(nt, json_content)
+    if problems:
+        raise GgraFileError("Loading files of Nonterminals", problems)
+
+    for nt in to_load:
+        nt.json_content = loaded[nt.filename][0]
+
+#=================================
+# PRUNING
+@dataclass
+class PruningReport:
+    """What prune_nt_files removed from the file contents"""
+    removed_entries: dict[str, int] = field(default_factory=dict)
+    """per file: number of removed keys"""
+    kept_entries: dict[str, int] = field(default_factory=dict)
+    bytes_saved: int = 0
+    """estimated with sys.getsizeof"""
+
+    def lines(self) -> list[str]:
+        lines = [
+            f"{filename!r}: removed {removed} of {removed + self.kept_entries[filename]} keys"
+            for filename, removed in self.removed_entries.items()
+        ]
+        return lines + [f"memory saved: about {self.bytes_saved / 1024:.1f} KiB"]
+
+    def __str__(self) -> str:
+        return "\n".join(self.lines())
+
+def json_size(field) -> int:
+    size = sys.getsizeof(field)
+    if isinstance(field, dict):
+        size += sum(json_size(key) + json_size(sub) for key, sub in field.items())
+    elif isinstance(field, list):
+        size += sum(json_size(sub) for sub in field)
+    return size
+
+def queried_parameters(nt_definitions: list[Nt], entry_points: list[tuple[str, dict[str, str]]]) -> dict[int, list[dict[str, str]]]:
+    """All parameters each file content can be queried with when resolving the entry points,
+    by id of the content (definitions naming the same file share it)"""
+    graph = GrammarGraph(nt_definitions)
+    roots = [graph.state(nt_name, params) for nt_name, params in entry_points]
+    queried = {}
+    for nt in graph.grammar:
+        if isinstance(nt, NtFile):
+            nt.load_once()
+            queried.setdefault(id(nt.json_content), [])
+    for nt_name, params in graph.reachable(roots):
+        for nt in graph.environments.definitions(nt_name, params.schema):
+            if isinstance(nt, NtFile):
+                queried[id(nt.json_content)].append(dict(params.items()))
+    return queried
+
+def prune_nt_files(nt_definitions: list[Nt], entry_points: list[tuple[str, dict[str, str]]]) -> PruningReport:
+    """Replaces the NtFile contents by copies without the entries that no resolution of
+    the entry points (Nonterminal name and parameters) can query.\n
+    The original contents are not modified, so grammars sharing them (see GrammarRegistry)
+    keep all entries; definitions that shared a content share the pruned copy.\n
+    Parameter values only come from the entry points and the string literals of the grammar,
+    so they are followed through all 'with' changes and 'if' conditions (see GrammarGraph).
+    Only keys of parameter levels are removed; "..." lists are kept whole.
+    Afterwards, resolving other Nonterminals or parameters from the files may fail."""
+    report = PruningReport()
+    queried = queried_parameters(nt_definitions, entry_points)
+
+    def prune(content, order: list[str], depth: int, queries: list[dict[str, str]], filename: str):
+        if depth == len(order):
+            return content
+        specifier = order[depth]
+        if specifier == "...":
+            if isinstance(content, list):
+                return [prune(sub, order, depth+1, queries, filename) for sub in content]
+            return content
+        if not isinstance(content, dict):
+            return content
+        kept = {}
+        for key, sub in content.items():
+            matching = [query for query in queries if query.get(specifier) == key]
+            if matching:
+                kept[key] = prune(sub, order, depth+1, matching, filename)
+            else:
+                report.bytes_saved += json_size(key) + json_size(sub)
+                report.removed_entries[filename] = report.removed_entries.get(filename, 0) + 1
+        report.kept_entries[filename] = report.kept_entries.get(filename, 0) + len(kept)
+        return kept
+
+    pruned = {}
+    for nt in nt_definitions:
+        if not isinstance(nt, NtFile):
+            continue
+        json_content = nt.json_content
+        if id(json_content) not in pruned:
+            report.removed_entries.setdefault(nt.filename, 0)
+            report.kept_entries.setdefault(nt.filename, 0)
+            content = prune(json_content.get("content"), json_content.get("order", []), 0, queried[id(json_content)], nt.filename)
+            pruned[id(json_content)] = {**json_content, "content": content}
+        nt.json_content = pruned[id(json_content)]
+    return report
+
@@ -0,0 +1,289 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from math import lcm
+from typing import Iterator
+
+from .structures import (
+    Change,
+    ElementNonterminal,
+    ElementString,
+    Grammar,
+    Nt,
+    NtDefinition,
+    Pattern,
+    PatternBNForm,
+    PatternFrom,
+    PatternIf,
+    PatternWith,
+    SourceNonterminal
+)
+
+@dataclass
+class OptimizationReport:
+    """What optimize_grammar changed"""
+    unwrapped_froms: int = 0
+    flattened_froms: int = 0
+    inlined_aliases: dict[str, str] = field(default_factory=dict)
+    inlined_single_use: list[str] = field(default_factory=list)
+    folded_nonterminals: dict[str, list[str]] = field(default_factory=dict)
+    removed_definitions: list[str] = field(default_factory=list)
+    warnings: list[str] = field(default_factory=list)
+
+    def lines(self) -> list[str]:
+        lines = [
+            f"unwrapped single-pattern 'from' blocks: {self.unwrapped_froms}",
+            f"flattened nested 'from' blocks: {self.flattened_froms}",
+        ]
+        lines += [f"inlined alias {name!r} -> {target!r}" for name, target in self.inlined_aliases.items()]
+        lines += [f"inlined single-use {name!r}" for name in self.inlined_single_use]
+        lines += [f"folded deterministic {name!r} into {terminals!r}" for name, terminals in self.folded_nonterminals.items()]
+        lines += [f"removed unreachable definition {name!r}" for name in self.removed_definitions]
+        lines += [f"warning: {warning}" for warning in self.warnings]
+        return lines
+
+    def __str__(self) -> str:
+        return "\n".join(self.lines())
+
+#=================================
+# Helpers
+def pattern_nt_names(pattern: Pattern) -> set[str]:
+    """Names (without ~) of all Nonterminals that may appear in the resolved pattern"""
+    if isinstance(pattern, PatternBNForm):
+        return {elem.name.removeprefix("~") for elem in pattern.elements if isinstance(elem, ElementNonterminal)}
+    if isinstance(pattern, PatternFrom):
+        return set().union(*(pattern_nt_names(sub) for sub in pattern.subpatterns))
+    return pattern_nt_names(pattern.subpattern)
+
+def nt_references(pattern: Pattern) -> Iterator[str]:
+    """Names (without ~) of the Nonterminals of the pattern and its changes, once per occurrence"""
+    if isinstance(pattern, PatternBNForm):
+        for elem in pattern.elements:
+            if isinstance(elem, ElementNonterminal):
+                yield elem.name.removeprefix("~")
+    elif isinstance(pattern, PatternFrom):
+        for sub in pattern.subpatterns:
+            yield from nt_references(sub)
+    else:
+        yield from nt_references(pattern.subpattern)
+        if isinstance(pattern, PatternWith):
+            for change in pattern.changes.changes:
+                yield from change_nt_names(change)
+
+def change_nt_names(change: Change) -> set[str]:
+    if isinstance(change.source, SourceNonterminal):
+        return {change.target_nt_name, change.source.nt_name}
+    return {change.target_nt_name}
+
+def unconditional(pattern: Pattern) -> bool:
+    """Whether the pattern resolves (is not None) for any parameters"""
+    if isinstance(pattern, PatternBNForm):
+        return True
+    if isinstance(pattern, PatternFrom):
+        return all(unconditional(sub) for sub in pattern.subpatterns)
+    if isinstance(pattern, PatternWith):
+        return unconditional(pattern.subpattern)
+    return False
+
+def single_parameterless(nt_definitions: list[Nt], nt_name: str) -> NtDefinition | None:
+    """The only definition that resolve_nt can use for nt_name without parameters"""
+    candidates = [nt for nt in nt_definitions if nt.name == nt_name and not nt.param_names]
+    if len(candidates) != 1 or not isinstance(candidates[0], NtDefinition):
+        return None
+    return candidates[0]
+
+#=================================
+# Pattern rewriting
+class PatternOptimizer:
+    def __init__(self, nt_definitions: list[Nt], report: OptimizationReport, max_flatten: int, entry_points: list[str]):
+        self.nt_definitions = nt_definitions
+        self.report         = report
+        self.max_flatten    = max_flatten
+        self.entry_points   = entry_points
+        self.folded: dict[str, list[str] | None] = {}
+        reached = reachable_names(nt_definitions, entry_points)
+        self.references = Counter(
+            name
+            for nt in nt_definitions if isinstance(nt, NtDefinition) and nt.name in reached
+            for name in nt_references(nt.subpattern)
+        )
+
+    def alias_target(self, nt_name: str) -> str | None:
+        definition = single_parameterless(self.nt_definitions, nt_name)
+        if definition is None:
+            return None
+        match definition.subpattern:
+            case PatternBNForm([ElementNonterminal(name)]) if name.removeprefix("~") != nt_name:
+                return name.removeprefix("~")
+        return None
+
+    def single_use_elements(self, nt_name: str) -> list | None:
+        """Elements of nt_name if it is used once in the reachable grammar and its only
+        parameterless definition is one sequence, which can replace the use"""
+        if nt_name in self.entry_points or self.references[nt_name] != 1:
+            return None
+        definition = single_parameterless(self.nt_definitions, nt_name)
+        if definition is None or not isinstance(definition.subpattern, PatternBNForm):
+            return None
+        return definition.subpattern.elements
+
+    def fold(self, nt_name: str) -> list[str] | None:
+        """Terminals of nt_name if resolving it without parameters involves no choice"""
+        if nt_name in self.folded:
+            return self.folded[nt_name]
+        self.folded[nt_name] = None # cycle guard
+        definition = single_parameterless(self.nt_definitions, nt_name)
+        if definition is None or not isinstance(definition.subpattern, PatternBNForm):
+            return None
+        terminals = []
+        for elem in definition.subpattern.elements:
+            if isinstance(elem, ElementString):
+                terminals.append(elem.content)
+                continue
+            sub_terminals = self.fold(elem.name.removeprefix("~"))
+            if sub_terminals is None:
+                return None
+            terminals.extend(sub_terminals)
+        self.folded[nt_name] = terminals
+        return terminals
+
+    def rewrite_bn(self, pattern: PatternBNForm, changed_nts: set[str]) -> PatternBNForm:
+        # non-~ names of the pattern and the name each of them stands for after inlining
+        shared = {elem.name: elem.name for elem in pattern.elements if isinstance(elem, ElementNonterminal)}
+        elements = []
+        for elem in pattern.elements:
+            if isinstance(elem, ElementString):
+                elements.append(elem)
+                continue
+            name = elem.name.removeprefix("~")
+            if name in changed_nts:
+                # parameters given by 'with': other definitions might be used
+                elements.append(elem)
+                continue
+            terminals = self.fold(name)
+            if terminals is not None:
+                self.report.folded_nonterminals[name] = terminals
+                elements.extend(ElementString(terminal) for terminal in terminals)
+                continue
+            target = self.alias_target(name)
+            # <X> <Y> must not become <Y> <Y>, which would share one resolution
+            if target is not None and elem.name.startswith("~"):
+                self.report.inlined_aliases[name] = target
+                elements.append(ElementNonterminal("~" + target))
+                continue
+            if target is not None and shared.get(target, name) == name:
+                self.report.inlined_aliases[name] = target
+                shared[target] = name
+                elements.append(ElementNonterminal(target))
+                continue
+            inner = self.single_use_elements(name)
+            if inner is not None:
+                inner_shared = {e.name for e in inner if isinstance(e, ElementNonterminal) and not e.name.startswith("~")}
+                # the Nonterminals of the inlined pattern must not share a resolution with
+                # Nonterminals of this pattern, nor get parameters from its 'with'
+                if not inner_shared & shared.keys() and not inner_shared & changed_nts:
+                    self.report.inlined_single_use.append(name)
+                    shared.update((inner_name, name) for inner_name in inner_shared)
+                    elements.extend(inner)
+                    continue
+            elements.append(elem)
+        if elements == pattern.elements:
+            return pattern
+        return PatternBNForm(elements)
+
+    def flatten(self, pattern: PatternFrom) -> PatternFrom:
+        """Merges unconditional nested froms into the outer one.\n
+        Choices are uniform among resolvable subpatterns, so every subpattern is repeated
+        until all alternatives carry the same weight as before."""
+        sizes = [
+            len(sub.subpatterns) if isinstance(sub, PatternFrom) and unconditional(sub) else 1
+            for sub in pattern.subpatterns
+        ]
+        if all(size == 1 for size in sizes):
+            return pattern
+        repeat = lcm(*sizes)
+        if repeat * len(sizes) > self.max_flatten:
+            return pattern
+        subpatterns = []
+        for sub, size in zip(pattern.subpatterns, sizes):
+            if size == 1:
+                subpatterns += [sub] * repeat
+                continue
+            for inner in sub.subpatterns:
+                subpatterns += [inner] * (repeat // size)
+        self.report.flattened_froms += 1
+        return PatternFrom(subpatterns)
+
+    def rewrite(self, pattern: Pattern, changed_nts: set[str]) -> Pattern:
+        if isinstance(pattern, PatternBNForm):
+            return self.rewrite_bn(pattern, changed_nts)
+        if isinstance(pattern, PatternIf):
+            sub = self.rewrite(pattern.subpattern, changed_nts)
+            return pattern if sub is pattern.subpattern else PatternIf(sub, pattern.condition)
+        if isinstance(pattern, PatternWith):
+            changed_here = changed_nts.union(*(change_nt_names(change) for change in pattern.changes.changes))
+            sub = self.rewrite(pattern.subpattern, changed_here)
+            self.check_with(pattern)
+            return pattern if sub is pattern.subpattern else PatternWith(sub, pattern.changes)
+        subs = [self.rewrite(sub, changed_nts) for sub in pattern.subpatterns]
+        if len(subs) == 1:
+            self.report.unwrapped_froms += 1
+            return subs[0]
+        if any(new is not old for new, old in zip(subs, pattern.subpatterns)):
+            pattern = PatternFrom(subs)
+        return self.flatten(pattern)
+
+    def check_with(self, pattern: PatternWith):
+        """Changes for Nonterminals that are not in the pattern fail when resolving;
+        they are reported but kept, so the optimized grammar behaves the same."""
+        present = pattern_nt_names(pattern.subpattern)
+        for change in pattern.changes.changes:
+            if change.target_nt_name not in present:
+                warning = f"'with' targets {change.target_nt_name!r}, which its pattern does not contain"
+                if warning not in self.report.warnings:
+                    self.report.warnings.append(warning)
+
+#=================================
+def reachable_names(nt_definitions: list[Nt], entry_points: list[str]) -> set[str]:
+    reached = set()
+    todo = list(entry_points)
+    while todo:
+        name = todo.pop()
+        if name in reached:
+            continue
+        reached.add(name)
+        for nt in nt_definitions:
+            if nt.name == name and isinstance(nt, NtDefinition):
+                todo.extend(pattern_nt_names(nt.subpattern))
+    return reached
+
+def optimize_grammar(
+        nt_definitions: list[Nt],
+        entry_points: list[str],
+        max_flatten: int = 64,
+        max_passes: int = 8
+    ) -> tuple[Grammar, OptimizationReport]:
+    """Simplifies a parsed grammar without changing the distribution of resolve_nt for the entry points.\n
+    - unwraps 'from' blocks with one pattern and flattens unconditional nested 'from' blocks
+    - inlines aliases (`X: <Y>`) and folds Nonterminals that always resolve to the same terminals
+    - inlines Nonterminals used once (that are no entry point) whose definition is a single sequence
+    - removes definitions that are not reachable from the entry points\n
+    The given definitions are not modified."""
+    report = OptimizationReport()
+    optimized = list(nt_definitions)
+    for _ in range(max_passes):
+        optimizer = PatternOptimizer(optimized, report, max_flatten, entry_points)
+        rewritten = []
+        for nt in optimized:
+            if isinstance(nt, NtDefinition):
+                subpattern = optimizer.rewrite(nt.subpattern, set())
+                if subpattern is not nt.subpattern:
+                    nt = NtDefinition(nt.name, nt.param_names, subpattern)
+            rewritten.append(nt)
+        unchanged = all(new is old for new, old in zip(rewritten, optimized))
+        optimized = rewritten
+        if unchanged:
+            break
+
+    reached = reachable_names(optimized, entry_points)
+    report.removed_definitions = [nt.name for nt in optimized if nt.name not in reached]
+    return Grammar(nt for nt in optimized if nt.name in reached), report
@@ -0,0 +1,126 @@
+from .constrained_generation import TerminalIndex
+from .grammar_graph import GrammarGraph, State
+from .structures import Nt
+
+# Symbols of compiled expansions
+SYM_TERMINAL    = 0 # (SYM_TERMINAL, terminal)
+SYM_NT          = 1 # (SYM_NT, child state id, slot or -1 if the slot does not repeat)
+SYM_REPEAT      = 2 # (SYM_REPEAT, slot): the same terminals as the first occurrence of the slot
+
+class CompiledState:
+    """Expansions of one state as symbol tuples, indexed by their first terminal"""
+    __slots__ = ("rules", "by_first", "unindexed")
+    def __init__(self):
+        self.rules: list[tuple[tuple, ...]] = []
+        self.by_first: dict[str, list[int]] = {}
+        self.unindexed: list[int] = []
+
+class Recognizer:
+    """Earley recognizer for the sentences resolve_nt can produce from one Nonterminal.\n
+    Works on the states of a GrammarGraph, so `if` conditions and `with` changes are taken into account,
+    and a pattern like <X> "and" <X> only accepts the same terminals for both <X>.
+    Sentences are lists of terminals as returned by resolve_nt.
+    The prepared tables are reused for all sentences."""
+    def __init__(self, nt_definitions: list[Nt], nt_name: str, params: dict[str, str]):
+        graph = GrammarGraph(nt_definitions)
+        root = graph.state(nt_name, params)
+        index = TerminalIndex(graph, [root])
+        self.state_ids: dict[State, int] = {state: i for i, state in enumerate(index.states)}
+        self.nullable = [state in index.nullable for state in index.states]
+        self.compiled = [self._compile(index, state) for state in index.states]
+        self.root = self.state_ids[root]
+
+    def _compile(self, index: TerminalIndex, state: State) -> CompiledState:
+        compiled = CompiledState()
+        for expansion in index.expansions[state]:
+            repeated = {slot for slot in expansion.items if not isinstance(slot, str) and expansion.items.count(slot) > 1}
+            seen = set()
+            symbols = []
+            for item in expansion.items:
+                if isinstance(item, str):
+                    symbols.append((SYM_TERMINAL, item))
+                elif item in seen:
+                    symbols.append((SYM_REPEAT, item))
+                else:
+                    seen.add(item)
+                    symbols.append((SYM_NT, self.state_ids[expansion.children[item]], item if item in repeated else -1))
+            rule = len(compiled.rules)
+            compiled.rules.append(tuple(symbols))
+            if symbols and symbols[0][0] == SYM_TERMINAL:
+                compiled.by_first.setdefault(symbols[0][1], []).append(rule)
+            else:
+                compiled.unindexed.append(rule)
+        return compiled
+
+    def recognize(self, sentence: list[str]) -> bool:
+        """Whether resolve_nt can produce exactly this list of terminals"""
+        n = len(sentence)
+        # Earley item: (state id, rule, dot, origin, bindings of repeated slots)
+        sets: list[list[tuple]] = [[] for _ in range(n + 1)]
+        seen: list[set] = [set() for _ in range(n + 1)]
+        waiting: list[dict[int, list[tuple]]] = [{} for _ in range(n + 1)]
+        predicted: list[set[int]] = [set() for _ in range(n + 1)]
+
+        def add(position: int, item: tuple):
+            if item not in seen[position]:
+                seen[position].add(item)
+                sets[position].append(item)
+
+        def advance(item: tuple, slot: int, start: int, end: int) -> tuple:
+            state_id, rule, dot, origin, bindings = item
+            if slot >= 0:
+                bindings = bindings + ((slot, start, end),)
+            return state_id, rule, dot + 1, origin, bindings
+
+        def predict(state_id: int, position: int):
+            if state_id in predicted[position]:
+                return
+            predicted[position].add(state_id)
+            compiled = self.compiled[state_id]
+            rules = compiled.unindexed
+            if position < n:
+                rules = rules + compiled.by_first.get(sentence[position], [])
+            for rule in rules:
+                add(position, (state_id, rule, 0, position, ()))
+
+        predict(self.root, 0)
+        for position in range(n + 1):
+            agenda = sets[position]
+            i = 0
+            while i < len(agenda):
+                item = agenda[i]
+                i += 1
+                state_id, rule, dot, origin, bindings = item
+                symbols = self.compiled[state_id].rules[rule]
+                if dot == len(symbols):
+                    # completion
+                    for parent in waiting[origin].get(state_id, []):
+                        add(position, advance(parent, self._slot(parent), origin, position))
+                    continue
+                symbol = symbols[dot]
+                if symbol[0] == SYM_TERMINAL:
+                    if position < n and sentence[position] == symbol[1]:
+                        add(position + 1, advance(item, -1, 0, 0))
+                elif symbol[0] == SYM_REPEAT:
+                    start, end = next((s, e) for slot, s, e in bindings if slot == symbol[1])
+                    length = end - start
+                    if sentence[position:position + length] == sentence[start:end]:
+                        add(position + length, advance(item, -1, 0, 0))
+                else:
+                    waiting[position].setdefault(symbol[1], []).append(item)
+                    predict(symbol[1], position)
+                    # empty completions of the child happen in this set, maybe before item was added
+                    if self.nullable[symbol[1]]:
+                        add(position, advance(item, symbol[2], position, position))
+        return any(
+            item[0] == self.root and item[3] == 0 and item[2] == len(self.compiled[self.root].rules[item[1]])
+            for item in sets[n]
+        )
+
+    def _slot(self, item: tuple) -> int:
+        """Slot to bind for the Nonterminal an item waits for"""
+        state_id, rule, dot, _, _ = item
+        return self.compiled[state_id].rules[rule][dot][2]
+
+    def recognize_many(self, sentences: list[list[str]]) -> list[bool]:
+        return [self.recognize(sentence) for sentence in sentences]
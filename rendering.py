@@ -0,0 +1,169 @@
+import random
+from dataclasses import dataclass
+from io import StringIO
+from random import Random
+from typing import Iterable
+
+from .seeding import sentence_rng
+from .structures import ElementNonterminal, Nt, NtDefinition, as_grammar, resolve_nt, resolve_pattern_nt
+
+@dataclass(frozen=True)
+class RenderRules:
+    """How terminals are joined into text"""
+    separator: str = " "
+    no_space_before: frozenset[str] = frozenset(".,!?;:)]}%…")
+    """terminals starting with one of these are attached to the previous terminal"""
+    no_space_after: frozenset[str] = frozenset("([{")
+    """terminals ending with one of these are attached to the next terminal"""
+    sentence_end: frozenset[str] = frozenset(".!?")
+    """terminals ending with one of these start a new sentence"""
+    capitalize: bool = True
+    """upper-case the first letter of every sentence"""
+    line_end: str = "\n"
+    """written after every rendered sentence"""
+
+PLAIN_RULES = RenderRules(no_space_before=frozenset(), no_space_after=frozenset(), capitalize=False)
+"""Terminals joined by spaces, like " ".join(...)"""
+
+class Renderer:
+    """Formats terminals one at a time and writes them to out.\n
+    out is a text file (anything with write, e.g. io.StringIO) or a bytearray,
+    which gets the text encoded with encoding. The text of a sentence is buffered and only
+    written by end_sentence (or flush), so a sentence that fails to resolve can be dropped
+    with discard_sentence instead of leaving a partial line in out."""
+    def __init__(self, out, rules: RenderRules = RenderRules(), encoding: str = "utf-8"):
+        self.rules = rules
+        if isinstance(out, bytearray):
+            self._out_write = lambda text: out.extend(text.encode(encoding))
+        else:
+            self._out_write = out.write
+        self._pending: list[str] = []
+        self._write = self._pending.append
+        self.start_sentence()
+
+    def start_sentence(self):
+        self._first = True
+        self._attach = False
+        self._upper = self.rules.capitalize
+
+    def write(self, terminal: str):
+        if not terminal:
+            return
+        rules = self.rules
+        if not self._first and not self._attach and terminal[0] not in rules.no_space_before:
+            self._write(rules.separator)
+        if self._upper:
+            stripped = terminal.lstrip("\"'([{¿¡")
+            if stripped:
+                start = len(terminal) - len(stripped)
+                terminal = terminal[:start] + stripped[0].upper() + stripped[1:]
+                self._upper = False
+        self._write(terminal)
+        self._first = False
+        self._attach = terminal[-1] in rules.no_space_after
+        if rules.capitalize and terminal[-1] in rules.sentence_end:
+            self._upper = True
+
+    def write_all(self, terminals: Iterable[str]):
+        for terminal in terminals:
+            self.write(terminal)
+
+    def flush(self):
+        """Writes the buffered text to out"""
+        if self._pending:
+            self._out_write("".join(self._pending))
+            self._pending.clear()
+
+    def end_sentence(self):
+        self._write(self.rules.line_end)
+        self.flush()
+        self.start_sentence()
+
+    def discard_sentence(self):
+        """Drops the buffered text of the current sentence"""
+        self._pending.clear()
+        self.start_sentence()
+
+def render_sentence(terminals: Iterable[str], rules: RenderRules = RenderRules()) -> str:
+    """Formatted text of a list of terminals, e.g. from resolve_nt, without the line end"""
+    out = StringIO()
+    renderer = Renderer(out, rules)
+    renderer.write_all(terminals)
+    renderer.flush()
+    return out.getvalue()
+
+#=================================
+# GENERATION
+def render_into(nt_definitions: list[Nt], nt_name: str, params: dict[str, str], renderer: Renderer, rng: Random = random):
+    """Resolves nt_name like resolve_nt, but hands every terminal to the renderer as soon as
+    it is known instead of building the list of terminals.\n
+    Makes the same random choices as resolve_nt, so with the same rng the text is the
+    rendering of resolve_nt's result. Only Nonterminals that appear several times in a
+    pattern (and share one resolution) are resolved to a list first."""
+    grammar = as_grammar(nt_definitions)
+    environment = grammar.environments.environment(params)
+    candidates = grammar.environments.definitions(nt_name, environment.schema)
+    if not candidates:
+        # raises the error of resolve_nt
+        resolve_nt(grammar, nt_name, environment, rng)
+    definition = rng.choice(candidates)
+    if not isinstance(definition, NtDefinition):
+        renderer.write_all(definition.resolve(grammar, environment, rng))
+        return
+    pattern, nt_config = definition.configure(environment, rng, grammar)
+
+    shared = set()
+    seen = set()
+    for obj in pattern:
+        if isinstance(obj, ElementNonterminal) and not obj.name.startswith("~"):
+            (shared if obj.name in seen else seen).add(obj.name)
+    nts_resolved = {}
+    for obj in pattern:
+        if isinstance(obj, str):
+            renderer.write(obj)
+        elif obj.name in shared:
+            renderer.write_all(resolve_pattern_nt(obj.name, nts_resolved, nt_config, grammar, rng))
+        else:
+            actual_name = obj.name.removeprefix("~")
+            render_into(grammar, actual_name, nt_config.get(actual_name, {}), renderer, rng)
+
+def render_sentence_into(nt_definitions: list[Nt], nt_name: str, params: dict[str, str], renderer: Renderer, rng: Random = random):
+    """render_into followed by the end of the sentence; drops the sentence if it fails to resolve"""
+    try:
+        render_into(nt_definitions, nt_name, params, renderer, rng)
+    except Exception:
+        renderer.discard_sentence()
+        raise
+    renderer.end_sentence()
+
+def render_nt(
+        nt_definitions: list[Nt],
+        nt_name: str,
+        params: dict[str, str],
+        out,
+        rules: RenderRules = RenderRules(),
+        rng: Random = random
+    ):
+    """Resolves nt_name and writes it to out as one formatted line (see Renderer).\n
+    If the resolution fails, nothing is written."""
+    renderer = Renderer(out, rules)
+    render_sentence_into(nt_definitions, nt_name, params, renderer, rng)
+
+def render_range(
+        nt_definitions: list[Nt],
+        nt_name: str,
+        params: dict[str, str],
+        out,
+        seed: int | str,
+        start: int,
+        stop: int,
+        rules: RenderRules = RenderRules()
+    ):
+    """Writes sentences start to stop (exclusive) of the stream seed (see seeding) to out,
+    one formatted line each, reusing one renderer.\n
+    If a sentence fails to resolve, the error is raised after the sentences before it;
+    nothing of the failed sentence is written."""
+    grammar = as_grammar(nt_definitions)
+    renderer = Renderer(out, rules)
+    for index in range(start, stop):
+        render_sentence_into(grammar, nt_name, params, renderer, sentence_rng(seed, index))
@@ -0,0 +1,49 @@
+from hashlib import blake2b
+import os
+from random import Random
+import threading
+from typing import Iterator
+
+from .structures import Nt, as_grammar, resolve_nt
+
+def sentence_seed(seed: int | str, index: int) -> int:
+    """128-bit seed of sentence index of the stream seed, a hash of both"""
+    digest = blake2b(f"{seed}/{index}".encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest, "little")
+
+def sentence_rng(seed: int | str, index: int) -> Random:
+    """Random generator of sentence index of the stream seed.\n
+    Depends on nothing but (seed, index), so sentences can be generated
+    in any order, by any process and again later."""
+    return Random(sentence_seed(seed, index))
+
+_local = threading.local()
+
+def thread_rng() -> Random:
+    """Random generator of the calling thread, seeded from os.urandom on first use.\n
+    Pass it as rng to resolve_nt from worker threads: the random module's shared
+    generator is correct there too, but every thread contends for it."""
+    rng = getattr(_local, "rng", None)
+    if rng is None:
+        rng = _local.rng = Random(os.urandom(16))
+    return rng
+
+#=================================
+def resolve_nt_at(nt_definitions: list[Nt], nt_name: str, params: dict[str, str], seed: int | str, index: int) -> list[str]:
+    """Sentence index of the stream seed, without generating the ones before it"""
+    return resolve_nt(nt_definitions, nt_name, params, sentence_rng(seed, index))
+
+def resolve_nt_range(
+        nt_definitions: list[Nt],
+        nt_name: str,
+        params: dict[str, str],
+        seed: int | str,
+        start: int,
+        stop: int
+    ) -> Iterator[list[str]]:
+    """Sentences start to stop (exclusive) of the stream seed.\n
+    resolve_nt_range(..., 0, 100) yields the same sentences as
+    resolve_nt_range(..., 0, 50) followed by resolve_nt_range(..., 50, 100)."""
+    grammar = as_grammar(nt_definitions)
+    for index in range(start, stop):
+        yield resolve_nt(grammar, nt_name, params, sentence_rng(seed, index))
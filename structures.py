@@ -1,12 +1,18 @@
 
 from abc import ABC
+from collections import OrderedDict
 from dataclasses import dataclass
 import json
+from operator import is_
 from os import path
-from random import choice#, shuffle # Achtung! Inplace
-from typing import Iterator, Self
+import random
+from random import Random
+from threading import Lock
+from typing import Iterator, Self, Sequence
 
 from .change_graph import Graph
+from .environments import Environment, GrammarEnvironments
+from .ggra_errors import UnresolvableError
 from .helpers import shuffle, first_where, separate, time_info
 
 
@@ -25,7 +31,7 @@ class ExpressionIdentifier(Expression):
     name: str
     def evaluate(self, params) -> str:
         if self.name not in params:
-            raise Exception(f"Identifier evaluation # identifier {self.name!r} unknown!")
+            raise UnresolvableError(f"Identifier evaluation # identifier {self.name!r} unknown!")
         return params[self.name]
 
 @dataclass
@@ -90,8 +96,8 @@ class SourceIdentifier(Source):
 @dataclass
 class SourceChoice(Source):
     options: list[Source]
-    def choose_one(self):
-        return choice(self.options)
+    def choose_one(self, rng: Random = random):
+        return rng.choice(self.options)
 
 @dataclass
 class Change:
@@ -99,11 +105,11 @@ class Change:
     target_nt_name: str
     target_nt_param: str
 
-    def decided_source(self):
+    def decided_source(self, rng: Random = random):
         """resolves SourceChoice to one of the choices\n
         in cases like `"a"|name`"""
         if isinstance(self.source, SourceChoice):
-            return self.source.choose_one()
+            return self.source.choose_one(rng)
         return self.source
 
 @dataclass
@@ -112,8 +118,12 @@ class With:
 
 #=================================
 # PATTERNS
+NO_CHANGES: list = []
+"""Changes of a pattern without `with`, shared by all of them; never modified"""
+
 class Pattern(ABC):
-    def resolve(self, params: dict[str, str]) -> tuple[list, list[Change]]:
+    def resolve(self, params: dict[str, str], rng: Random = random) -> tuple[list, list[Change]]:
+        """rng makes all random choices; the random module by default"""
         pass
 
 #-----------------------
@@ -135,49 +145,146 @@ class ElementString(Element):
 @dataclass
 class PatternBNForm(Pattern):
     elements: list[Element]
-    def resolve(self, params):
-        return [element.resolve() for element in self.elements], []
+    def resolve(self, params, rng = random):
+        return self.resolved(), NO_CHANGES
+
+    def resolved(self) -> list[str | ElementNonterminal]:
+        """The resolved elements, made once: the same list on every call, do not modify it"""
+        resolved = self.__dict__.get("_resolved")
+        if resolved is None:
+            resolved = [element.resolve() for element in self.elements]
+            self.__dict__["_resolved"] = resolved
+        return resolved
 
 #-----------------------
 @dataclass
 class PatternFrom(Pattern):
     subpatterns: list[Pattern]
-    def resolve(self, params):
-        subs = self.subpatterns.copy()
-        subs = shuffle(subs)
-        subs_resolved = (sub.resolve(params) for sub in subs)
+    def resolve(self, params, rng = random):
+        subs = self.subpatterns
+        candidates = shuffle(self.candidates(params), rng)
+        subs_resolved = (subs[i].resolve(params, rng) for i in candidates)
         sub_with_result = first_where(
             subs_resolved,
             lambda sub: sub[0] is not None,
             (None, None)
         )
         return sub_with_result
-        
+
+    def candidates(self, params) -> Sequence[int]:
+        """Indices of the subpatterns that may resolve with params, in order.\n
+        All of them, unless several subpatterns are guarded by `if param = "value"`:
+        then only those whose value fits, and the unguarded ones (see GuardIndex).
+        The index is built on first use; do not modify the subpatterns afterwards."""
+        if "_guard_index" not in self.__dict__:
+            self.__dict__["_guard_index"] = build_guard_index([pattern_guard(sub) for sub in self.subpatterns])
+        index = self.__dict__["_guard_index"]
+        if index is not None:
+            found = index.candidates(params)
+            if found is not None:
+                return found
+        return range(len(self.subpatterns))
+
 @dataclass
 class PatternIf(Pattern):
     subpattern: Pattern
     condition: Condition
-    def resolve(self, params):
+    def resolve(self, params, rng = random):
         if not self.condition.evaluate(params):
             return None, None
-        return self.subpattern.resolve(params)
+        return self.subpattern.resolve(params, rng)
 
 @dataclass
 class PatternWith(Pattern):
     subpattern: Pattern
     changes: With
-    def resolve(self, params):
-        sub, changes = self.subpattern.resolve(params)
-        res = sub, changes + self.changes.changes
-        return res
+    def resolve(self, params, rng = random):
+        sub, changes = self.subpattern.resolve(params, rng)
+        if sub is None:
+            # e.g. a condition below the changes is not fulfilled
+            return None, None
+        return sub, self.joined(changes)
+
+    def joined(self, changes: list[Change]) -> list[Change]:
+        """changes followed by the changes of this block.\n
+        The same list for the same changes, so resolved patterns with their changes
+        can be told apart by identity (see ChangePlan); do not modify it."""
+        if not changes:
+            return self.changes.changes
+        joined = self.__dict__.setdefault("_joined", {})
+        known = joined.get(id(changes))
+        if known is None or known[0] is not changes:
+            known = (changes, changes + self.changes.changes)
+            joined[id(changes)] = known
+        return known[1]
+
+#-----------------------
+class GuardIndex:
+    """Subpatterns of a PatternFrom by the value of the parameter most of them are guarded by
+    (`if param = "a"` or `if param = "a" | "b"`).\n
+    by_value holds, for every value in a guard, the subpatterns guarded by it together with all
+    subpatterns that are not guarded by param (others); any other value only leaves the others.
+    Other conditions (!=, several parameters, ...) are still evaluated when resolving."""
+    __slots__ = ("param", "by_value", "others")
+    def __init__(self, param, by_value: dict[object, tuple[int, ...]], others: tuple[int, ...]):
+        self.param      = param
+        self.by_value   = by_value
+        self.others     = others
+
+    def candidates(self, params) -> tuple[int, ...] | None:
+        """None if params does not contain the parameter (all subpatterns are candidates)"""
+        value = params.get(self.param)
+        if value is None:
+            return None
+        return self.by_value.get(value, self.others)
+
+def build_guard_index(guards: list[tuple[object, frozenset] | None]) -> GuardIndex | None:
+    """Index of the guards (parameter, values) of the subpatterns; None if less than
+    two subpatterns test the same parameter"""
+    tested = {}
+    for guard in guards:
+        if guard is not None:
+            tested[guard[0]] = tested.get(guard[0], 0) + 1
+    if not tested or max(tested.values()) < 2:
+        return None
+    param = max(tested, key=tested.get)
+    others = tuple(i for i, guard in enumerate(guards) if guard is None or guard[0] != param)
+    by_value = {}
+    for i, guard in enumerate(guards):
+        if guard is not None and guard[0] == param:
+            for value in guard[1]:
+                by_value.setdefault(value, []).append(i)
+    by_value = {value: tuple(sorted(indices + list(others))) for value, indices in by_value.items()}
+    return GuardIndex(param, by_value, others)
+
+def pattern_guard(pattern: Pattern) -> tuple[str, frozenset[str]] | None:
+    """(parameter, values) if the pattern only resolves when the parameter has one of the values"""
+    while isinstance(pattern, PatternWith):
+        pattern = pattern.subpattern
+    if not isinstance(pattern, PatternIf) or not isinstance(pattern.condition, ConditionEq):
+        return None
+    first, second = pattern.condition.first, pattern.condition.second
+    if isinstance(second, ExpressionIdentifier):
+        first, second = second, first
+    if not isinstance(first, ExpressionIdentifier):
+        return None
+    if isinstance(second, ExpressionString):
+        return first.name, frozenset([second.content])
+    if isinstance(second, ExpressionChoice) and second.options and all(isinstance(option, ExpressionString) for option in second.options):
+        return first.name, frozenset(option.content for option in second.options)
+    return None
 
 #=================================
 #NONTERMINAL DEFINITION
+_file_load_lock     = Lock()
+_environments_lock  = Lock()
+
+
 @dataclass
 class Nt(ABC):
     name: str
     param_names: set[str]
-    def resolve(self, nt_definitions: list[Self], params: dict[str, str]) -> list[str]:
+    def resolve(self, nt_definitions: list[Self], params: dict[str, str], rng: Random = random) -> list[str]:
         pass
 
 @dataclass
@@ -187,39 +294,46 @@ class NtFile(Nt):
 
     # @time_info("Loading JSON")
     def load_json_content(self):
+        """(Re)loads the file; use load_once while resolving"""
         if not path.exists(self.filename):
             raise Exception(f"File {self.filename!r} does not exist! (for resolution of Nonterminal {self.name!r} from file)")
         with open(self.filename, "r", encoding="utf-8") as doc:
             self.json_content = json.load(doc)
     
-    def query(self, query: list[str]) -> str | list[str] | None:
+    def load_once(self):
+        """Loads the file if it was not loaded yet; safe to call from several threads"""
+        if self.json_content is None:
+            with _file_load_lock:
+                if self.json_content is None:
+                    self.load_json_content()
+
+    def query(self, query: list[str], rng: Random = random) -> str | list[str] | None:
         field = self.json_content.get("content")
         for specifier in query:
             if specifier == "...":
-                field = choice(field)
+                field = rng.choice(field)
             else:
                 field = field.get(specifier, None)
             if field is None:
                 return None
         return field
 
-    def resolve(self, nt_definitions, params: dict[str, str]) -> list[str]:
-        if self.json_content is None:
-            self.load_json_content()
+    def resolve(self, nt_definitions, params: dict[str, str], rng: Random = random) -> list[str]:
+        self.load_once()
         
         order:list = self.json_content.get("order")
 
         order_nochoose = [elem for elem in order if elem != "..."]
 
         if set(order_nochoose) != set(params):
-            raise Exception(f"NtFile.resolve # parameters {set(params)} for NtFile {self.name!r} do not fit parameters in file ({set(order_nochoose)})")
+            raise UnresolvableError(f"NtFile.resolve # parameters {set(params)} for NtFile {self.name!r} do not fit parameters in file ({set(order_nochoose)})")
         
         # "..." corresponds to a choice using "from" in the json files
         query = [specifier if specifier == "..." else params.get(specifier) for specifier in order] 
-        result = self.query(query)
+        result = self.query(query, rng)
 
         if result is None:
-            raise Exception(f"NtFile.resolve # no result for params {params!r} in Nonterminal from file {self.name!r}")
+            raise UnresolvableError(f"NtFile.resolve # no result for params {params!r} in Nonterminal from file {self.name!r}")
         if isinstance(result, str):
             return [result]
         return result
@@ -229,11 +343,30 @@ class NtFile(Nt):
 class NtDefinition(Nt):
     subpattern: Pattern
 
-    def resolve(self, nt_definitions, params: dict[str, str]) -> list[str]:
-        pattern, changes = self.subpattern.resolve(params)
+    def resolve(self, nt_definitions, params: dict[str, str], rng: Random = random) -> list[str]:
+        pattern, nt_config = self.configure(params, rng, nt_definitions)
+        return fill_in_pattern(pattern, nt_config, nt_definitions, rng)
+
+    def configure(self, params: dict[str, str], rng: Random = random, nt_definitions = None) -> tuple[list[str | ElementNonterminal], dict[str, dict[str, str]]]:
+        """Chooses the pattern and the parameters of its Nonterminals, without resolving them"""
+        pattern, changes = self.subpattern.resolve(params, rng)
+        return self.configure_pattern(pattern, changes, params, rng, nt_definitions)
 
+    def configure_pattern(self, pattern: list[str | ElementNonterminal] | None, changes: list[Change], params: dict[str, str], rng: Random = random, nt_definitions = None) -> tuple[list[str | ElementNonterminal], dict[str, dict[str, str]]]:
+        """Executes the changes of a resolved subpattern (see configure).\n
+        Given the Grammar and an Environment, the parameters are Environments made with the
+        ChangePlan of the pattern; otherwise dicts."""
         if pattern is None:
-            raise Exception(f"NtDefinition.resolve # unresolvable subpattern for Nonterminal {self.name!r}")
+            raise UnresolvableError(f"NtDefinition.resolve # unresolvable subpattern for Nonterminal {self.name!r}")
+
+        if not changes:
+            # every Nonterminal of the pattern is resolved without parameters
+            return pattern, {}
+
+        if isinstance(nt_definitions, Grammar) and isinstance(params, Environment):
+            plan = change_plan(nt_definitions.environments, pattern, changes, params.schema)
+            if plan is not None:
+                return pattern, plan.configure(params, rng)
 
         nts = set (elem.name.removeprefix("~") for elem in pattern if isinstance(elem, ElementNonterminal))
         
@@ -241,7 +374,7 @@ class NtDefinition(Nt):
         
         nt_config = {nt_name : dict() for nt_name in nts}
         # Execution of changes
-        execute_constants(constant_changes, nt_config, params)
+        execute_constants(constant_changes, nt_config, params, rng)
         sorted_changes = sort_changes(nt_changes)
         for change in sorted_changes:
             execute_change(change, nt_config)
@@ -249,28 +382,212 @@ class NtDefinition(Nt):
         # for change in changes:
         #     change.restore()
         
-        return fill_in_pattern(pattern, nt_config, nt_definitions)
+        return pattern, nt_config
+
+#-----------------------
+_CONST, _PARAM, _CHOICE, _COPY = range(4)
+
+class ChangePlan:
+    """The changes of one resolved pattern, prepared for the parameter schema of its definition:
+    the schema of every Nonterminal they configure, and where each of its slots gets its value from.\n
+    The values of all configured Nonterminals are kept in one list, the slots of each one after another.
+    Steps run in the order of configure_pattern and make the same random choices.
+    Nonterminals that only get string constants have their Environment made once (fixed).
+    Without steps, the changes fail and configure_pattern executes them with dicts."""
+    __slots__ = ("pattern", "changes", "schema", "template", "steps", "targets", "fixed", "other")
+
+    def __init__(self, pattern: list, changes: list[Change], schema, template: list[int], steps: list[tuple], targets: list[tuple], fixed: dict[str, Environment]):
+        self.pattern    = pattern
+        self.changes    = changes
+        self.schema     = schema
+        self.template   = template
+        self.steps      = steps
+        self.targets    = targets
+        self.fixed      = fixed
+        self.other: ChangePlan | None = None
+        """plan of the same pattern and changes for another schema"""
+
+    def configure(self, params: Environment, rng: Random = random) -> dict[str, Environment]:
+        """The Environments of the Nonterminals of the pattern, for the parameters of its definition"""
+        if not self.targets:
+            return self.fixed
+        values = self.template.copy()
+        for kind, position, source in self.steps:
+            if kind == _CHOICE:
+                kind, source = rng.choice(source)
+            if kind == _CONST:
+                values[position] = source
+            elif kind == _PARAM:
+                values[position] = params.values[source]
+            else:
+                values[position] = values[source]
+        nt_config = self.fixed.copy()
+        for name, schema, start, stop in self.targets:
+            nt_config[name] = Environment(schema, tuple(values[start:stop]))
+        return nt_config
+
+def change_plan(environments: GrammarEnvironments, pattern: list, changes: list[Change], schema) -> ChangePlan | None:
+    """The ChangePlan of the resolved pattern and its changes for the parameter schema, made on first use.\n
+    None if executing the changes fails, so configure_pattern raises its usual error.
+    Shared nodes (see node_sharing) can give the same pattern in definitions with other schemas,
+    so the plans of a pattern are chained by schema."""
+    by_changes = environments.plans.get(id(pattern))
+    if by_changes is None:
+        by_changes = environments.plans.setdefault(id(pattern), {})
+    first = by_changes.get(id(changes))
+    if first is not None and (first.pattern is not pattern or first.changes is not changes):
+        first = None # the id of an object that no longer exists
+    plan = first
+    while plan is not None and plan.schema is not schema:
+        plan = plan.other
+    if plan is None:
+        plan = build_change_plan(environments, pattern, changes, schema) or ChangePlan(pattern, changes, schema, None, None, None, None)
+        plan.other = first
+        by_changes[id(changes)] = plan
+    return plan if plan.steps is not None else None
+
+def build_change_plan(environments: GrammarEnvironments, pattern: list, changes: list[Change], schema) -> ChangePlan | None:
+    nts = set(elem.name.removeprefix("~") for elem in pattern if isinstance(elem, ElementNonterminal))
+    nt_changes, constant_changes = separate(changes, lambda change: isinstance(change.source, SourceNonterminal))
+    try:
+        sorted_changes = sort_changes(nt_changes)
+    except Exception:
+        return None
+
+    def compiled(source: Source) -> tuple | None:
+        if isinstance(source, SourceString):
+            return _CONST, environments.values.intern(source.content)
+        if isinstance(source, SourceIdentifier) and source.name in schema.slots:
+            return _PARAM, schema.slots[source.name]
+        return None
+
+    # (kind, Nonterminal, parameter, source) in the order of configure_pattern
+    writes = []
+    assigned = {}
+    for change in constant_changes:
+        if change.target_nt_name not in nts:
+            return None
+        if isinstance(change.source, SourceChoice):
+            options = tuple(compiled(option) for option in change.source.options)
+            if None in options:
+                return None
+            writes.append((_CHOICE, change.target_nt_name, change.target_nt_param, options))
+        else:
+            source = compiled(change.source)
+            if source is None:
+                return None
+            writes.append((source[0], change.target_nt_name, change.target_nt_param, source[1]))
+        assigned.setdefault(change.target_nt_name, set()).add(change.target_nt_param)
+    for change in sorted_changes:
+        source = change.source
+        if change.target_nt_name not in nts or source.nt_param not in assigned.get(source.nt_name, ()):
+            return None
+        writes.append((_COPY, change.target_nt_name, change.target_nt_param, (source.nt_name, source.nt_param)))
+        assigned.setdefault(change.target_nt_name, set()).add(change.target_nt_param)
+
+    starts = {}
+    schemas = {}
+    size = 0
+    for name in sorted(assigned):
+        schemas[name] = environments.schema(assigned[name])
+        starts[name] = size
+        size += len(schemas[name].names)
+    position = lambda name, param: starts[name] + schemas[name].slots[param]
+
+    template = [0] * size
+    steps = []
+    dynamic = set() # Nonterminals written by a step
+    written = set() # positions written by a step before
+    for kind, name, param, source in writes:
+        target = position(name, param)
+        if kind == _CONST and target not in written:
+            template[target] = source
+            continue
+        if kind == _COPY:
+            source = position(*source)
+        steps.append((kind, target, source))
+        dynamic.add(name)
+        written.add(target)
+
+    fixed = {
+        name: Environment(schemas[name], tuple(template[starts[name]:starts[name] + len(schemas[name].names)]))
+        for name in schemas if name not in dynamic
+    }
+    targets = [
+        (name, schemas[name], starts[name], starts[name] + len(schemas[name].names))
+        for name in schemas if name in dynamic
+    ]
+    return ChangePlan(pattern, changes, schema, template, steps, targets, fixed)
+
+#=================================
+# GRAMMAR
+class Grammar(list):
+    """List of Nonterminal Definitions, as returned by parse_file.\n
+    Keeps the interned parameter environments and the definition index of the grammar,
+    which are built once on first use. Do not modify the list after resolving from it."""
+    sharing_report = None
+    """SharingReport of parse_file, if it shared the nodes of the grammar"""
+    source = None
+    """The plain list as_grammar made the Grammar of"""
+
+    @property
+    def environments(self) -> GrammarEnvironments:
+        environments = self.__dict__.get("_environments")
+        if environments is None:
+            with _environments_lock:
+                # another thread may have built them meanwhile
+                environments = self.__dict__.get("_environments")
+                if environments is None:
+                    environments = GrammarEnvironments(self)
+                    self.__dict__["_environments"] = environments
+        return environments
+
+_grammars: OrderedDict[int, Grammar] = OrderedDict()
+"""Grammars made by as_grammar for plain lists, most recently used last"""
+_grammars_lock = Lock()
+GRAMMAR_CACHE_SIZE = 16
+
+def as_grammar(nt_definitions: list[Nt]) -> Grammar:
+    """nt_definitions if it is a Grammar, else a Grammar with the same definitions.\n
+    The Grammars of the last GRAMMAR_CACHE_SIZE lists are kept, so resolving from the same
+    list again reuses its environments; a list that was modified since gets a new one."""
+    if isinstance(nt_definitions, Grammar):
+        return nt_definitions
+    with _grammars_lock:
+        grammar = _grammars.get(id(nt_definitions))
+        if grammar is not None and grammar.source is nt_definitions and len(grammar) == len(nt_definitions) and all(map(is_, grammar, nt_definitions)):
+            _grammars.move_to_end(id(nt_definitions))
+            return grammar
+        grammar = Grammar(nt_definitions)
+        # keeps the list alive, so its id is not reused while cached
+        grammar.source = nt_definitions
+        _grammars[id(nt_definitions)] = grammar
+        _grammars.move_to_end(id(nt_definitions))
+        if len(_grammars) > GRAMMAR_CACHE_SIZE:
+            _grammars.popitem(last=False)
+        return grammar
 
 #-----------------------
 def error_check_change_id(change: Change, params: dict[str, str]):
     if change.source.name not in params:
-        raise Exception(f"NtDefinition.resolve # Parameter {change.source.name!r} does not exist.")
+        raise UnresolvableError(f"NtDefinition.resolve # Parameter {change.source.name!r} does not exist.")
 
 def fits_nt_def_params(nt_definition: Nt, params: set[str]) -> bool:
     return nt_definition.param_names == params
 
-def resolve_nt(nt_definitions: list[Nt], nt_name: str, params: dict[str, str]) -> list[str]:
-    param_set = set(key for key in params)
-    shuffled_defs = nt_definitions.copy()
-    shuffled_defs = shuffle(shuffled_defs)
-    definition = first_where(
-        shuffled_defs,
-        lambda nt_definition: nt_definition.name == nt_name and fits_nt_def_params(nt_definition, param_set)
-    )
-    if definition is None:
-        param_names = ", ".join(sorted(list(param_set)))
-        raise Exception(f"resolve_nt # There exists no Nonterminal Definition that fits {nt_name}({param_names}).")
-    return definition.resolve(nt_definitions, params)
+def resolve_nt(nt_definitions: list[Nt], nt_name: str, params: dict[str, str] | Environment, rng: Random = random) -> list[str]:
+    """Resolves nt_name to a list of terminals.\n
+    All random choices are made with rng, which is the random module by default;
+    pass a random.Random to reproduce or separate generations."""
+    grammar = as_grammar(nt_definitions)
+    environment = grammar.environments.environment(params)
+    candidates = grammar.environments.definitions(nt_name, environment.schema)
+    if not candidates:
+        param_names = ", ".join(environment.schema.names)
+        raise UnresolvableError(f"resolve_nt # There exists no Nonterminal Definition that fits {nt_name}({param_names}).")
+    # uniform among fitting definitions, like taking the first fitting one of all shuffled definitions
+    definition = rng.choice(candidates)
+    return definition.resolve(grammar, environment, rng)
 
 def sort_changes(nt_changes: list[Change]) -> list[Change]:
     nt_graph    = Graph()
@@ -281,14 +598,14 @@ def sort_changes(nt_changes: list[Change]) -> list[Change]:
     sorted_changes  = sorted(nt_changes, key=lambda change: nt_priorities.index(change.source.nt_name))
     return sorted_changes
 
-def execute_constants(constant_changes: list[Change], nt_configuration: dict[str, dict], params: dict[str, str]):
+def execute_constants(constant_changes: list[Change], nt_configuration: dict[str, dict], params: dict[str, str], rng: Random = random):
     for change in constant_changes:
-        source      = change.decided_source()
+        source      = change.decided_source(rng)
         target_name = change.target_nt_name
         target_param = change.target_nt_param
         
         if change.target_nt_name not in nt_configuration:
-            raise Exception(f"NtDefinition.resolve # Nonterminal {change.target_nt_name} does not exist.")
+            raise UnresolvableError(f"NtDefinition.resolve # Nonterminal {change.target_nt_name} does not exist.")
         if isinstance(source, SourceIdentifier):
             error_check_change_id(change, params)
             nt_configuration[target_name][target_param] = params[source.name]
@@ -310,29 +627,29 @@ def resolve_pattern_nt(
         nt_name: str,
         nts_resolved: dict[str, list[str]],
         nt_configuration: dict[str, dict[str, str]],
-        nt_definitions: list[Nt]
+        nt_definitions: Grammar,
+        rng: Random = random
     ) -> list[str]:
     if nt_name.startswith("~"):
         # separately resolve the Nonterminal
         actual_name = nt_name.removeprefix("~")
-        return resolve_nt(nt_definitions, actual_name, nt_configuration[actual_name])
+        return resolve_nt(nt_definitions, actual_name, nt_configuration.get(actual_name, {}), rng)
     if nt_name not in nts_resolved:
-        raise Exception(f"fill_in_pattern # Nonterminal {nt_name!r} in pattern not resolved!")
-    if nts_resolved[nt_name] is None:
         # nt gets resolved just when needed.
         # This way, rules regarding nonexistent nts dont do anything
         # Also, performance might be improved
-        nts_resolved[nt_name] = resolve_nt(nt_definitions, nt_name, nt_configuration[nt_name])
+        nts_resolved[nt_name] = resolve_nt(nt_definitions, nt_name, nt_configuration.get(nt_name, {}), rng)
     return nts_resolved[nt_name]
 
-def fill_in_pattern(pattern: list[str | ElementNonterminal], nt_configuration: dict[str, dict[str, str]], nt_definitions: list[Nt]) -> list[str]:
-    """Makes a list of resolved contents out of the pattern and its config"""
-    nts_resolved = {nt_name : None for nt_name in nt_configuration}
+def fill_in_pattern(pattern: list[str | ElementNonterminal], nt_configuration: dict[str, dict[str, str]], nt_definitions: Grammar, rng: Random = random) -> list[str]:
+    """Makes a list of resolved contents out of the pattern and its config.\n
+    Nonterminals without configuration are resolved without parameters."""
+    nts_resolved = {}
     p = []
     for obj in pattern:
         if isinstance(obj, str):
             p.append(obj)
         else:
-            res = resolve_pattern_nt(obj.name, nts_resolved, nt_configuration, nt_definitions)
+            res = resolve_pattern_nt(obj.name, nts_resolved, nt_configuration, nt_definitions, rng)
             p.extend(res)
     return p
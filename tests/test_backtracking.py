@@ -0,0 +1,22 @@
+import io
+from random import Random
+
+import pytest
+
+from ..backtracking import BacktrackingResolver
+from ..ggra_errors import GgraResolutionError
+from ..gram_parser import parse_file
+
+def test_recursive_dead_end_raises_resolution_error():
+    grammar = parse_file(io.StringIO('A:\n  <A> "x"\n  <B>\n\nB:\n  <C>\n'))
+    resolver = BacktrackingResolver(grammar)
+    with pytest.raises(GgraResolutionError):
+        resolver.resolve("A", {}, Random(0))
+    assert resolver.report.failed_sentences == 1
+
+def test_recursion_still_resolves_past_dead_ends():
+    grammar = parse_file(io.StringIO('A:\n  <A> "x"\n  <B>\n\nB:\n  <C>\n  "b"\n'))
+    resolver = BacktrackingResolver(grammar)
+    for seed in range(20):
+        sentence = resolver.resolve("A", {}, Random(seed))
+        assert sentence[0] == "b" and set(sentence[1:]) <= {"x"}
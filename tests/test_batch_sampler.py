@@ -0,0 +1,59 @@
+import json
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from ..batch_sampler import compile_batch_tables, resolve_nt_batch
+from ..differential_testing import chi_square_homogeneity, parse_text, reference_engine
+
+GRAMMAR = """
+S:
+  from:
+    "a"
+    "b"
+    from:
+      "c"
+      "d"
+      "e"
+  <T> <~T>
+
+T:
+  "t1"
+  "t2" <T>
+  "t3"
+"""
+
+def test_batch_matches_resolve_nt_distribution():
+    grammar = parse_text(GRAMMAR)
+    assert compile_batch_tables(grammar, "S") is not None
+    count = 20_000
+    batch = resolve_nt_batch(grammar, "S", count, seed=1)
+    reference = reference_engine(grammar, "S", {}, count, 2)
+    assert len(batch) == count
+
+    # exact probabilities: the inner 'from' counts as one of three subpatterns
+    first = Counter(sentence[0] for sentence in batch)
+    assert abs(first["a"] / count - 1 / 6) < 0.02
+    assert abs(first["c"] / count - 1 / 18) < 0.01
+    assert abs(sum(first[t] for t in ("t1", "t2", "t3")) / count - 1 / 2) < 0.02
+
+    for key in (tuple, len, lambda sentence: sentence[0]):
+        _, _, p = chi_square_homogeneity(Counter(map(key, batch)), Counter(map(key, reference)))
+        assert p > 1e-4
+
+def test_batch_is_repeatable_with_a_seed():
+    grammar = parse_text(GRAMMAR)
+    assert resolve_nt_batch(grammar, "S", 500, seed=7) == resolve_nt_batch(grammar, "S", 500, seed=7)
+
+def test_batch_with_files_is_repeatable_with_a_seed(tmp_path):
+    names_path = tmp_path / "names.json"
+    names_path.write_text(json.dumps({"order": ["..."], "content": ["Alice", "Bob", "Carol", "Dave"]}), encoding="utf-8")
+    grammar = parse_text(f'S:\n  "hi" <Name> <~Name>\n  <T>\n\nT:\n  "t" <~Name>\n\nName -> {json.dumps(str(names_path))}\n')
+    assert compile_batch_tables(grammar, "S") is not None
+    first = resolve_nt_batch(grammar, "S", 300, seed=3)
+    assert first == resolve_nt_batch(grammar, "S", 300, seed=3)
+    assert len({tuple(sentence) for sentence in first}) > 10
+    # also when nothing can be batched
+    assert resolve_nt_batch(grammar, "Name", 50, seed=3) == resolve_nt_batch(grammar, "Name", 50, seed=3)
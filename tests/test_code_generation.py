@@ -0,0 +1,81 @@
+import importlib.util
+import json
+import sys
+from random import Random
+
+from ..code_generation import compiled_module, write_module
+from ..differential_testing import parse_text
+from ..structures import resolve_nt
+
+GRAMMAR = """
+S:
+  <Subj> <Verb> <~Subj> <Obj>
+  with:
+    "1" | "3" => Subj.form
+    Subj.form => Verb.form
+
+  <Verb> "!"
+  with:
+    "5" => Verb.form
+
+Subj(form):
+  "I"
+  if form = "1"
+  from:
+    <Name>
+    "she"
+  if form = "3"
+
+Verb(form):
+  "see"
+  if form = "1"
+  from:
+    "sees"
+    "watches"
+  if form = "3"
+
+Obj:
+  "it"
+  "them"
+  <~Obj> "and" <Name>
+
+Name -> {names}
+"""
+
+def outputs(resolve, nt_name: str = "S", params: dict | None = None, count: int = 300) -> list:
+    """Sentences from one seeded generator, None where resolving fails"""
+    rng = Random(4)
+    result = []
+    for _ in range(count):
+        try:
+            result.append(resolve(nt_name, params or {}, rng))
+        except Exception:
+            result.append(None)
+    return result
+
+def make_grammar(tmp_path):
+    names_path = tmp_path / "names.json"
+    names_path.write_text(json.dumps({"order": ["..."], "content": ["Alice", "Bob"]}), encoding="utf-8")
+    return parse_text(GRAMMAR.format(names=json.dumps(str(names_path))))
+
+def test_written_module_makes_the_choices_of_resolve_nt(tmp_path, monkeypatch):
+    grammar = make_grammar(tmp_path)
+    filename = tmp_path / "grammar_gen.py"
+    write_module(grammar, str(filename))
+    spec = importlib.util.spec_from_file_location("grammar_gen", filename)
+    module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, "grammar_gen", module)
+    spec.loader.exec_module(module)
+
+    expected = outputs(lambda nt_name, params, rng: resolve_nt(grammar, nt_name, params, rng))
+    assert outputs(module.resolve_nt) == expected
+    assert None in expected and len({tuple(output) for output in expected if output}) > 10
+    # the file does not need the grammar file any more
+    (tmp_path / "names.json").unlink()
+    assert outputs(module.resolve_nt) == expected
+
+def test_compiled_module_with_parameters(tmp_path):
+    grammar = make_grammar(tmp_path)
+    module = compiled_module(grammar)
+    for params in ({"form": "1"}, {"form": "3"}, {"form": "2"}):
+        assert outputs(module.resolve_nt, "Subj", params) == outputs(lambda *args: resolve_nt(grammar, *args), "Subj", params)
@@ -0,0 +1,20 @@
+import io
+from random import Random
+
+from ..constrained_generation import ConstrainedGenerator, generate_constrained
+from ..gram_parser import parse_file
+
+GRAMMAR = 'S:\n  <Name> "likes" <Name>\n  <Name> "sleeps"\n\nName:\n  "Alice"\n  "Bob"\n  "Carol"\n  "Dave"\n'
+
+def test_constraints_hold():
+    generator = ConstrainedGenerator(parse_file(io.StringIO(GRAMMAR)), "S", {})
+    for seed in range(20):
+        sentence = generator.generate(contains="likes", prefix=["Carol"], rng=Random(seed))
+        assert sentence[:2] == ["Carol", "likes"]
+
+def test_seeded_generation_is_repeatable():
+    grammar = parse_file(io.StringIO(GRAMMAR))
+    first = [generate_constrained(grammar, "S", {}, contains="Dave", rng=Random(seed)) for seed in range(10)]
+    second = [generate_constrained(grammar, "S", {}, contains="Dave", rng=Random(seed)) for seed in range(10)]
+    assert first == second
+    assert all("Dave" in sentence for sentence in first)
@@ -0,0 +1,57 @@
+import io
+import json
+import os
+
+import pytest
+
+from ..__main__ import main
+from ..corpus_export import ExportJob, export_corpus
+from ..gram_parser import parse_file
+from ..seeding import resolve_nt_range
+
+GRAMMAR = """S:
+  <Name> "sleeps"
+  <Name> "and" <Name>
+
+Name:
+  "Alice"
+  "Bob"
+  "Carol"
+"""
+
+def read_shards(out_dir: str) -> dict[str, list[list[str]]]:
+    shards = {}
+    for name in sorted(os.listdir(out_dir)):
+        with open(os.path.join(out_dir, name), encoding="utf-8") as file:
+            shards[name] = [json.loads(line) for line in file]
+    return shards
+
+def test_resumed_export_keeps_written_shards(tmp_path):
+    grammar_path = tmp_path / "grammar.ggra"
+    grammar_path.write_text(GRAMMAR, encoding="utf-8")
+    out_dir = str(tmp_path / "corpus")
+    job = ExportJob(str(grammar_path), "S", {}, count=25, seed=7, out_dir=out_dir, shard_size=10)
+    assert export_corpus(job, progress=io.StringIO()) == 25
+    resumed = ExportJob(str(grammar_path), "S", {}, count=5, seed=7, out_dir=out_dir, start=20, shard_size=10)
+    assert export_corpus(resumed, progress=io.StringIO()) == 5
+
+    shards = read_shards(out_dir)
+    assert [name for name in shards] == [
+        "shard-0000000000.jsonl", "shard-0000000010.jsonl", "shard-0000000020.jsonl"
+    ]
+    grammar = parse_file(io.StringIO(GRAMMAR))
+    expected = list(resolve_nt_range(grammar, "S", {}, 7, 0, 25))
+    assert shards["shard-0000000000.jsonl"] == expected[0:10]
+    assert shards["shard-0000000010.jsonl"] == expected[10:20]
+    assert shards["shard-0000000020.jsonl"] == expected[20:25]
+
+def test_unaligned_start_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="resume at 20"):
+        ExportJob("grammar.ggra", "S", {}, count=5, seed=7, out_dir=str(tmp_path), start=23, shard_size=10)
+    assert ExportJob("grammar.ggra", "S", {}, count=1, seed=7, out_dir=str(tmp_path), start=23, shard_size=1).shard_path(0).endswith("shard-0000000023.jsonl")
+
+def test_cli_rejects_unaligned_start(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        main(["generate", "grammar.ggra", "--count", "5", "--start", "23", "--shard-size", "10", "--out", str(tmp_path)])
+    assert "resume at 20" in capsys.readouterr().err
+    assert os.listdir(tmp_path) == []
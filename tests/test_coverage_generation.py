@@ -0,0 +1,54 @@
+from ..coverage_generation import generate_covering
+from ..differential_testing import parse_text
+from ..recognizer import Recognizer
+
+GRAMMAR = """
+S:
+  <A> "x"
+  <B> <Verb>
+  with:
+    "1" | "2" => Verb.form
+
+A:
+  "a1"
+  "a2"
+  from:
+    "a3"
+    "a4" <A>
+
+B:
+  "b1"
+  "b2"
+
+Verb(form):
+  "v1"
+  if form = "1"
+  "v2"
+  if form = "2"
+  "v9"
+  if form = "9"
+"""
+
+def test_covers_every_alternative():
+    grammar = parse_text(GRAMMAR)
+    result = generate_covering(grammar, "S", {})
+    assert result.covered == result.coverable
+    assert result.uncovered == []
+    terminals = {terminal for sentence in result.sentences for terminal in sentence}
+    assert {"a1", "a2", "a3", "a4", "b1", "b2", "v1", "v2", "x"} <= terminals
+    # no resolution of S gives Verb the form "9"
+    assert "v9" not in terminals
+    assert all("v9" in target for target in result.unreachable)
+    assert result.covered + len(result.unreachable) == result.total
+
+def test_every_sentence_is_derivable():
+    grammar = parse_text(GRAMMAR)
+    recognizer = Recognizer(grammar, "S", {})
+    sentences = generate_covering(grammar, "S", {}).sentences
+    assert sentences
+    assert all(recognizer.recognize_many(sentences))
+
+def test_max_sentences():
+    result = generate_covering(parse_text(GRAMMAR), "S", {}, max_sentences=1)
+    assert len(result.sentences) == 1
+    assert result.covered < result.coverable and result.uncovered
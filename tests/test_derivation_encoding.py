@@ -0,0 +1,50 @@
+import io
+import json
+from random import Random
+
+import pytest
+
+from .. import derivation_encoding
+from ..derivation_encoding import (
+    MAGIC,
+    DerivationCorpus,
+    encode_choices,
+    encode_corpus,
+    encode_varints,
+    grammar_fingerprint,
+    record_nt
+)
+from ..ggra_errors import UnresolvableError
+from ..gram_parser import parse_file
+from ..seeding import resolve_nt_at
+from ..structures import resolve_nt
+
+GRAMMAR = 'S:\n  <Name> "sleeps"\n  <Name> <Broken>\n\nName:\n  "Alice"\n  "Bob"\n  "Carol"\n\nBroken:\n  <Missing>\n'
+
+def test_failed_sentences_are_skipped():
+    grammar = parse_file(io.StringIO(GRAMMAR))
+    corpus = DerivationCorpus(encode_corpus(grammar, "S", {}, seed=3, start=10, stop=40), grammar)
+    assert corpus.failed
+    assert len(corpus) + len(corpus.failed) == 30
+    for i, sentence in enumerate(corpus):
+        assert sentence == resolve_nt_at(grammar, "S", {}, 3, corpus.stream_index(i))
+
+def test_engine_errors_are_raised(monkeypatch):
+    grammar = parse_file(io.StringIO(GRAMMAR))
+    with pytest.raises(UnresolvableError):
+        resolve_nt(grammar, "Broken", {})
+    def broken_engine(*args):
+        raise AttributeError("not a resolution error")
+    monkeypatch.setattr(derivation_encoding, "resolve_nt", broken_engine)
+    with pytest.raises(AttributeError):
+        encode_corpus(grammar, "S", {}, seed=3, start=0, stop=5)
+
+def test_unused_choices_are_rejected():
+    grammar = parse_file(io.StringIO(GRAMMAR))
+    sentence, _ = record_nt(grammar, "Name", {}, Random(0))
+    data = bytearray(MAGIC + grammar_fingerprint(grammar))
+    header = json.dumps({"nt": "Name", "params": {}, "seed": 0, "start": 0}).encode("utf-8")
+    encode_varints([len(header)], data)
+    data += header + encode_choices([["Alice", "Bob", "Carol"].index(sentence[0]), 1])
+    with pytest.raises(ValueError):
+        DerivationCorpus(bytes(data), grammar)[0]
@@ -0,0 +1,63 @@
+from random import Random
+
+from ..derivation_trees import NODE_SHARED, DerivationTree, TreeResolver
+from ..differential_testing import parse_text
+from ..structures import resolve_nt
+
+GRAMMAR = """
+S:
+  <X> "and" <X> "or" <~X>
+  <Subj> <Verb>
+  with:
+    "1" | "3" => Subj.form
+    Subj.form => Verb.form
+
+X:
+  "a"
+  "b" <Y>
+
+Y:
+  "y"
+  "z" <Y>
+
+Subj(form):
+  "I"
+  if form = "1"
+  from:
+    "he"
+    "she"
+  if form = "3"
+
+Verb(form):
+  "see"
+  if form = "1"
+  "sees"
+  if form = "3"
+"""
+
+def test_yield_is_the_sentence_of_resolve_nt():
+    grammar = parse_text(GRAMMAR)
+    resolver = TreeResolver(grammar)
+    for seed in range(100):
+        sentence, tree = resolver.resolve("S", {}, Random(seed))
+        assert sentence == resolve_nt(grammar, "S", {}, Random(seed))
+        assert tree.sentence == sentence
+        assert tree.terminals(0) == sentence
+        assert DerivationTree.from_bytes(tree.to_bytes()).sentence == sentence
+
+def test_repeated_nonterminals_are_resolved_once():
+    grammar = parse_text(GRAMMAR)
+    resolver = TreeResolver(grammar)
+    for seed in range(100):
+        sentence, tree = resolver.resolve("S", {}, Random(seed))
+        xs = tree.find("X")
+        if not xs:
+            continue
+        first, shared, separate = xs
+        assert tree.node(shared).kind == "shared" and tree.columns["kind"][shared] == NODE_SHARED
+        assert tree.node(shared).shared_from == first
+        assert tree.children(shared) == []
+        assert tree.terminals(shared) == tree.terminals(first)
+        assert tree.node(separate).kind == "definition"
+        # the Y below the shared <X> is only in the tree of the first one
+        assert all(tree.path_at(tree.columns["start"][y])[1] in (first, separate) for y in tree.find("Y"))
@@ -0,0 +1,44 @@
+from random import Random
+
+from ..differential_testing import (
+    DiffCase,
+    chi_square_sf,
+    ks_two_sample,
+    parse_text,
+    reference_engine,
+    run_differential
+)
+
+GRAMMAR = """
+S:
+  "a" <T>
+  "b"
+  "c" <T> <~T>
+
+T:
+  "x"
+  "y"
+  "z"
+"""
+
+def skewed_engine(grammar, nt_name, params, count, seed):
+    """resolve_nt, but every fifth sentence is replaced by ["b"]"""
+    sentences = reference_engine(grammar, nt_name, params, count, seed)
+    return [["b"] if i % 5 == 0 else sentence for i, sentence in enumerate(sentences)]
+
+def test_statistics_match_known_values():
+    assert abs(chi_square_sf(3.841, 1) - 0.05) < 1e-3
+    assert abs(chi_square_sf(18.307, 10) - 0.05) < 1e-3
+    assert abs(chi_square_sf(50., 30) - 0.0126) < 1e-3
+    rng = Random(0)
+    same = [rng.random() for _ in range(2000)], [rng.random() for _ in range(2000)]
+    assert ks_two_sample(*same)[1] > 0.01
+    shifted = same[0], [value + 0.2 for value in same[1]]
+    assert ks_two_sample(*shifted)[1] < 1e-6
+
+def test_harness_rejects_skewed_engine_and_accepts_equal_one():
+    case = DiffCase("small", parse_text(GRAMMAR))
+    report = run_differential([case], {"equal": reference_engine, "skewed": skewed_engine}, count=5000)
+    verdicts = {comparison.engine: comparison.passed(report.alpha) for comparison in report.comparisons}
+    assert verdicts == {"equal": True, "skewed": False}
+    assert not report.passed
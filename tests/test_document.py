@@ -0,0 +1,40 @@
+from random import Random
+
+import pytest
+
+from ..document import GgraDocument
+
+def state(doc: GgraDocument):
+    diagnostics = [(d.line, d.end_line, str(d.error)) for d in doc.diagnostics()]
+    return doc.block_starts, diagnostics, repr(list(doc.grammar()))
+
+def assert_like_fresh(doc: GgraDocument):
+    assert state(doc) == state(GgraDocument(doc.text))
+
+@pytest.mark.parametrize("text, start, end, new_lines, block_starts", [
+    ('S:\n  "a"', 0, 0, ["B:"], [0, 1]),
+    ("S:", 0, 0, ['  "a"'], [0, 1]),
+    ("B:\nS:", 0, 1, [], [0]),
+    ('S:\n  "a"\nB:\n  "b"', 1, 2, ["T:", '  "t"'], [0, 1, 3]),
+    ('S:\n  "a"\nB:\n  "b"', 2, 3, ['  "c"'], [0]),
+    ('S:\n  "a"', 2, 2, ["B:", '  <S>'], [0, 2]),
+    ('S:\n  "a"\nB:', 2, 3, [], [0]),
+])
+def test_edits_match_a_fresh_parse(text, start, end, new_lines, block_starts):
+    doc = GgraDocument(text)
+    doc.diagnostics()
+    doc.replace_lines(start, end, new_lines)
+    assert doc.block_starts == block_starts
+    assert_like_fresh(doc)
+
+def test_random_edits_match_a_fresh_parse():
+    pieces = ["S:", '  "a"', "  <B>", "B:", '  "b" <S>', '  if x = "1"', "// c", "", "B(x):", '  "bad', "X", "  from:", '    "z"']
+    for seed in range(300):
+        rng = Random(seed)
+        doc = GgraDocument("\n".join(rng.choice(pieces) for _ in range(rng.randint(1, 6))))
+        for _ in range(rng.randint(1, 6)):
+            start = rng.randint(0, len(doc.lines))
+            end = rng.randint(start, min(len(doc.lines), start + 3))
+            doc.replace_lines(start, end, [rng.choice(pieces) for _ in range(rng.randint(0, 3))])
+            doc.diagnostics()
+        assert_like_fresh(doc)
@@ -0,0 +1,143 @@
+from random import Random
+
+import pytest
+
+from .. import structures
+from ..differential_testing import parse_text
+from ..environments import Environment, GrammarEnvironments
+from ..node_sharing import share_nodes
+from ..structures import as_grammar, resolve_nt
+
+GRAMMAR = """
+S:
+  <Subj> <Verb> <~Subj> <Obj>
+  with:
+    "1" | "3" => Subj.form
+    Subj.form => Verb.form
+    "x" => Obj.case
+    "pl" => Obj.number
+
+  <Subj> "and" <Subj> <Verb>
+  with:
+    "4" => Subj.form
+    Subj.form => Verb.form
+
+Subj(form):
+  "I"
+  if form = "1"
+  from:
+    "he"
+    "she"
+  if form = "3"
+  "we"
+  if form = "4"
+
+Verb(form):
+  "run"
+  if form = "1" | "4"
+  "runs"
+  if form = "3"
+  <Adv> "runs"
+  if form = "3"
+  with:
+    form => Adv.form
+
+Adv(form):
+  "fast"
+  "slowly"
+
+Obj(case, number):
+  "things"
+  if number = "pl"
+"""
+
+def test_environment_slots():
+    environments = GrammarEnvironments([])
+    environment = environments.environment({"number": "pl", "case": "x"})
+    assert environment.schema.names == ("case", "number")
+    assert environment.schema.slots == {"case": 0, "number": 1}
+    assert environment["number"] == "pl"
+    assert environment.get("case") == "x"
+    assert environment.get("form", "-") == "-"
+    assert "case" in environment and "form" not in environment
+    assert list(environment) == ["case", "number"]
+    assert dict(environment.items()) == {"case": "x", "number": "pl"}
+    assert environment == {"case": "x", "number": "pl"}
+    with pytest.raises(KeyError):
+        environment["form"]
+
+def test_environments_are_interned():
+    environments = GrammarEnvironments([])
+    first = environments.environment({"a": "1", "b": "2"})
+    second = environments.environment({"b": "2", "a": "1"})
+    assert first.schema is second.schema is environments.schema(["b", "a"])
+    assert first == second and hash(first) == hash(second)
+    assert first != environments.environment({"a": "1", "b": "3"})
+    assert environments.environment(first) is first
+    assert environments.environment({}) is environments.empty
+
+def test_definitions_by_schema():
+    grammar = as_grammar(parse_text(GRAMMAR))
+    environments = grammar.environments
+    assert [nt.name for nt in environments.definitions("Obj", environments.schema(["number", "case"]))] == ["Obj"]
+    assert environments.definitions("Obj", environments.schema(["case"])) == []
+    assert environments.definitions("S", environments.empty.schema)[0].name == "S"
+
+def test_as_grammar_reuses_grammar_of_list():
+    definitions = list(parse_text(GRAMMAR))
+    grammar = as_grammar(definitions)
+    assert as_grammar(definitions) is grammar
+    assert as_grammar(grammar) is grammar
+    definitions.pop()
+    assert as_grammar(definitions) is not grammar
+    assert len(as_grammar(definitions)) == len(definitions)
+
+def test_change_plans_give_configuration_of_dicts():
+    grammar = as_grammar(parse_text(GRAMMAR))
+    definition = grammar.environments.definitions("S", grammar.environments.empty.schema)[0]
+    first = definition.subpattern.subpatterns[0]
+    pattern, changes = first.resolve({})
+    # the same lists every time, so the plan is made once
+    assert first.resolve({}) == (pattern, changes) and first.resolve({})[0] is pattern
+
+    for seed in range(20):
+        _, with_plan = definition.configure_pattern(pattern, changes, grammar.environments.empty, Random(seed), grammar)
+        _, with_dicts = definition.configure_pattern(pattern, changes, {}, Random(seed))
+        assert all(isinstance(environment, Environment) for environment in with_plan.values())
+        assert {name: dict(environment.items()) for name, environment in with_plan.items()} == with_dicts
+    # the constant parameters of Obj are made into an Environment once
+    assert with_plan["Obj"] is definition.configure_pattern(pattern, changes, grammar.environments.empty, Random(0), grammar)[1]["Obj"]
+
+def test_same_output_as_configuration_of_dicts(monkeypatch):
+    grammar = as_grammar(parse_text(GRAMMAR))
+    with_plans = [resolve_nt(grammar, "S", {}, Random(seed)) for seed in range(200)]
+    monkeypatch.setattr(structures, "change_plan", lambda *args: None)
+    with_dicts = [resolve_nt(grammar, "S", {}, Random(seed)) for seed in range(200)]
+    assert with_plans == with_dicts
+    assert len(set(map(tuple, with_plans))) > 5
+
+def test_shared_pattern_in_definitions_with_other_schemas():
+    grammar = as_grammar(parse_text("""
+S(x):
+  "s" <B>
+  with:
+    x => B.p
+
+T(a, x):
+  "s" <B>
+  with:
+    x => B.p
+
+B(p):
+  "b1"
+  if p = "1"
+  "b2"
+  if p = "2"
+"""))
+    share_nodes(grammar)
+    s, t = grammar[0], grammar[1]
+    # the same pattern, where x is in another slot
+    assert s.subpattern is t.subpattern
+    for _ in range(3):
+        assert resolve_nt(grammar, "S", {"x": "1"}) == ["s", "b1"]
+        assert resolve_nt(grammar, "T", {"a": "1", "x": "2"}) == ["s", "b2"]
@@ -0,0 +1,74 @@
+import pytest
+
+from ..ggra_errors import GgraParserError
+from ..gram_parser import line_iterator, make_lines
+from ..lines import (
+    LineBNPattern,
+    LineChange,
+    LineCondition,
+    LineFileNt,
+    LineFullFrom,
+    LineFullNt,
+    LineFullWith,
+    LineOpenFrom,
+    LineOpenNt,
+    LineOpenWith
+)
+from ..structures import (
+    Change,
+    ConditionEq,
+    ElementNonterminal,
+    ElementString,
+    ExpressionIdentifier,
+    ExpressionString,
+    PatternBNForm,
+    SourceIdentifier,
+    SourceString,
+    With
+)
+
+def parse_line(text: str):
+    [line] = make_lines(line_iterator(text))
+    return line
+
+A_B = PatternBNForm([ElementString("a"), ElementNonterminal("B")])
+
+@pytest.mark.parametrize("text, expected", [
+    ('S:',                  LineOpenNt(0, "S", set())),
+    ('A(x, y):',            LineOpenNt(0, "A", {"x", "y"})),
+    ('S: "a" <B>',          LineFullNt(0, "S", set(), A_B)),
+    ('A(x): "a" <B>',       LineFullNt(0, "A", {"x"}, A_B)),
+    ('N -> "n.json"',       LineFileNt(0, "N", set(), "n.json")),
+    ('N(x) -> "n.json"',    LineFileNt(0, "N", {"x"}, "n.json")),
+    ('from -> "n.json"',    LineFileNt(0, "from", set(), "n.json")),
+    ('  "a" <B>',           LineBNPattern(2, A_B)),
+    ('<B> "a"',             LineBNPattern(0, PatternBNForm([ElementNonterminal("B"), ElementString("a")]))),
+    ('from:',               LineOpenFrom(0)),
+    ('from: "a" <B>',       LineFullFrom(0, A_B)),
+    ('with:',               LineOpenWith(0)),
+    ('with: "1" => B.p',    LineFullWith(0, With([Change(SourceString("1"), "B", "p")]))),
+    ('x => B.p',            LineChange(0, Change(SourceIdentifier("x"), "B", "p"))),
+    ('"1" => B.p',          LineChange(0, Change(SourceString("1"), "B", "p"))),
+    ('if x = "1"',          LineCondition(0, ConditionEq(ExpressionIdentifier("x"), ExpressionString("1")))),
+])
+def test_line_kinds(text, expected):
+    line = parse_line(text)
+    assert type(line) is type(expected)
+    assert line == expected
+
+@pytest.mark.parametrize("text, origin, message", [
+    ('if',              "Parser: Pre-Parsing lines",                        ["If expects condition", "However, none was given"]),
+    ('S',               "Parser: Pre-Parsing lines",                        ["Could not parse line consisting of tokens:", "[identifier[S]]"]),
+    ('A(x',             "Parser: Pre-Parsing lines",                        ["Could not parse line consisting of tokens:", "[identifier[A], open_paren[(], identifier[x]]"]),
+    ('from x',          "Parser: Pre-Parsing lines",                        ["Could not parse line consisting of tokens:", "[identifier[from], identifier[x]]"]),
+    ('with "a"',        "Parser: Pre-Parsing lines",                        ["Could not parse line consisting of tokens:", '[identifier[with], string["a"]]']),
+    ('= "a"',           "Parser: Pre-Parsing lines",                        ["Could not parse line consisting of tokens:", '[equals[=], string["a"]]']),
+    ('"a" =',           "Parser: Parsing pattern in Backus-Naur format",    ["wrong token in pattern:", "equals", "in line", '[string["a"], equals[=]]']),
+    ('S: "a" ,',        "Parser: Parsing pattern in Backus-Naur format",    ["wrong token in pattern:", "comma", "in line", '[string["a"], comma[,]]']),
+    ('"a" "b" => X.p',  "Parser: Parsing change (line in 'with:')",         ["Before change arrow", "Cannot understand pattern:", '[string["a"], string["b"]]']),
+])
+def test_line_errors(text, origin, message):
+    with pytest.raises(GgraParserError) as error:
+        parse_line(text)
+    assert error.value.origin_obj == origin
+    assert error.value.message_lines == message
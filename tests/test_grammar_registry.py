@@ -0,0 +1,60 @@
+import json
+import threading
+import time
+
+from ..grammar_registry import GrammarRegistry, node_size
+
+def write_grammars(tmp_path, count: int) -> dict[str, str]:
+    names_path = tmp_path / "names.json"
+    names_path.write_text(json.dumps({"order": ["..."], "content": ["Alice", "Bob"]}), encoding="utf-8")
+    paths = {}
+    for i in range(count):
+        path = tmp_path / f"g{i}.ggra"
+        path.write_text(f'S:\n  "hello{i}" <Name>\n\nName -> {json.dumps(str(names_path))}\n', encoding="utf-8")
+        paths[f"g{i}"] = str(path)
+    return paths
+
+def recomputed_memory(registry: GrammarRegistry) -> int:
+    return sum(node_size(entry.grammar, set()) for entry in registry.entries.values()) + sum(
+        vocabulary.size for vocabulary in registry.vocabularies.values()
+    )
+
+def test_memory_total_follows_loads_and_evictions(tmp_path):
+    paths = write_grammars(tmp_path, 6)
+    registry = GrammarRegistry(byte_budget=10**9, locate=paths.get)
+    for key in paths:
+        registry.get(key)
+    assert registry.memory() == recomputed_memory(registry)
+    registry.byte_budget = registry.memory() // 2
+    registry.shrink()
+    assert 0 < len(registry) < 6 and registry.metrics.evictions > 0
+    assert registry.memory() == recomputed_memory(registry) <= registry.byte_budget
+    for key in list(registry.entries):
+        registry.evict(key)
+    assert registry.memory() == 0 and not registry.vocabularies
+
+def test_hits_do_not_wait_for_loads(tmp_path):
+    paths = write_grammars(tmp_path, 2)
+    release = threading.Event()
+    located = []
+    def locate(key: str) -> str:
+        located.append(key)
+        if key == "g1":
+            release.wait(10)
+        return paths[key]
+    registry = GrammarRegistry(byte_budget=10**9, locate=locate)
+    registry.get("g0")
+
+    results = []
+    loaders = [threading.Thread(target=lambda: results.append(registry.get("g1"))) for _ in range(3)]
+    for loader in loaders:
+        loader.start()
+    while "g1" not in registry.loading:
+        time.sleep(0.001)
+    assert registry.get("g0") is registry.entries["g0"].grammar
+    assert not results
+    release.set()
+    for loader in loaders:
+        loader.join()
+    assert located.count("g1") == 1
+    assert len(results) == 3 and all(grammar is results[0] for grammar in results)
@@ -0,0 +1,63 @@
+from collections import Counter
+from random import Random
+
+from ..differential_testing import chi_square_homogeneity, parse_text
+from ..structures import PatternFrom, build_guard_index, pattern_guard, resolve_nt
+
+GRAMMAR = """
+Verb(form):
+  "am"
+  if form = "1"
+  "is"
+  if form = "3"
+  from:
+    "are"
+    "were"
+  if form = "2" | "4"
+  "be"
+  "ain't"
+  if form != "1"
+"""
+
+FORMS = ("1", "2", "3", "4", "5")
+
+def unindexed(grammar):
+    """The grammar with every PatternFrom trying all of its subpatterns"""
+    for nt in grammar:
+        if isinstance(nt.subpattern, PatternFrom):
+            nt.subpattern.__dict__["_guard_index"] = None
+    return grammar
+
+def test_candidates_are_the_fitting_alternatives():
+    [verb] = parse_text(GRAMMAR)
+    subpatterns = verb.subpattern.subpatterns
+    assert [pattern_guard(sub) for sub in subpatterns] == [
+        ("form", frozenset({"1"})), ("form", frozenset({"3"})), ("form", frozenset({"2", "4"})), None, None
+    ]
+    for form in FORMS:
+        fitting = [i for i, sub in enumerate(subpatterns) if sub.resolve({"form": form}, Random(0))[0] is not None]
+        candidates = verb.subpattern.candidates({"form": form})
+        # the != condition is not indexed, it is still evaluated when resolving
+        assert [i for i in candidates if i != 4] == [i for i in fitting if i != 4]
+        assert 3 in candidates and 4 in candidates
+    assert list(verb.subpattern.candidates({})) == list(range(len(subpatterns)))
+
+def test_no_index_without_two_guards_on_one_parameter():
+    assert build_guard_index([("a", frozenset({"1"})), ("b", frozenset({"1"})), None]) is None
+    index = build_guard_index([("a", frozenset({"1"})), ("a", frozenset({"1", "2"})), None])
+    assert index.candidates({"a": "1"}) == (0, 1, 2)
+    assert index.candidates({"a": "2"}) == (1, 2)
+    assert index.candidates({"a": "9"}) == (2,)
+    assert index.candidates({"b": "1"}) is None
+
+def test_same_output_as_unindexed_resolution():
+    indexed = parse_text(GRAMMAR)
+    plain = unindexed(parse_text(GRAMMAR))
+    for form in FORMS:
+        params = {"form": form}
+        rng, plain_rng = Random(1), Random(2)
+        with_index = Counter(tuple(resolve_nt(indexed, "Verb", params, rng)) for _ in range(3000))
+        without = Counter(tuple(resolve_nt(plain, "Verb", params, plain_rng)) for _ in range(3000))
+        assert set(with_index) == set(without)
+        assert chi_square_homogeneity(with_index, without)[2] > 1e-4
+    assert indexed[0].subpattern.__dict__["_guard_index"] is not None
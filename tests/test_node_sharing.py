@@ -0,0 +1,58 @@
+import io
+from random import Random
+
+from ..differential_testing import parse_text
+from ..node_sharing import share_nodes
+from ..gram_parser import parse_file
+from ..structures import resolve_nt
+
+GRAMMAR = """
+S:
+  <A> "and" <B>
+  <B> "or" <A>
+
+A:
+  from:
+    "x" <C>
+    with:
+      "1" => C.n
+    "y"
+
+  "z"
+
+B:
+  from:
+    "x" <C>
+    with:
+      "1" => C.n
+    "y"
+
+  "z"
+
+C(n):
+  "c"
+  <C> "c"
+  with:
+    n => C.n
+"""
+
+def test_equal_subpatterns_are_shared():
+    grammar = parse_text(GRAMMAR)
+    a, b = grammar[1].subpattern.subpatterns, grammar[2].subpattern.subpatterns
+    assert a[1] == b[1] and a[1] is not b[1]
+    report = share_nodes(grammar)
+    a, b = grammar[1].subpattern.subpatterns, grammar[2].subpattern.subpatterns
+    assert a[1] is b[1]
+    # 'from' blocks stay unique, the patterns and changes in them are shared
+    assert a[0] is not b[0]
+    assert a[0].subpatterns[0] is b[0].subpatterns[0]
+    assert a[0].subpatterns[1] is b[0].subpatterns[1]
+    assert report.shared_nodes > 0
+    assert grammar[1].subpattern is not grammar[2].subpattern
+
+def test_same_output_for_the_same_seed():
+    unshared = parse_file(io.StringIO(GRAMMAR), share=False)
+    shared = parse_file(io.StringIO(GRAMMAR))
+    assert shared.sharing_report.shared_nodes > 0
+    for seed in range(100):
+        assert resolve_nt(shared, "S", {}, Random(seed)) == resolve_nt(unshared, "S", {}, Random(seed))
@@ -0,0 +1,42 @@
+import json
+
+from ..code_generation import compile_grammar
+from ..grammar_registry import GrammarRegistry
+from ..nt_files import prefetch_nt_files, prune_nt_files
+from ..structures import NtFile, resolve_nt
+
+VERBS = {"order": ["form", "..."], "content": {"1": ["run", "go"], "3": ["runs", "goes"]}}
+
+def write_grammars(tmp_path) -> tuple[str, str]:
+    verbs_path = tmp_path / "verbs.json"
+    verbs_path.write_text(json.dumps(VERBS), encoding="utf-8")
+    paths = []
+    for name in ("first", "second"):
+        grammar_path = tmp_path / f"{name}.ggra"
+        grammar_path.write_text(f'S:\n  "I" <Verb>\n  with:\n    "1" => Verb.form\n\nVerb(form) -> {json.dumps(str(verbs_path))}\n', encoding="utf-8")
+        paths.append(str(grammar_path))
+    return paths[0], paths[1]
+
+def verb_content(grammar) -> dict:
+    return next(nt for nt in grammar if isinstance(nt, NtFile)).json_content["content"]
+
+def test_pruning_does_not_touch_shared_contents(tmp_path):
+    first_path, second_path = write_grammars(tmp_path)
+    registry = GrammarRegistry(byte_budget=10**9)
+    first, second = registry.get(first_path), registry.get(second_path)
+    assert verb_content(first) is verb_content(second)
+
+    report = prune_nt_files(first, [("S", {})])
+    assert sum(report.removed_entries.values()) == 1
+    assert verb_content(first) == {"1": ["run", "go"]}
+    assert verb_content(second) == VERBS["content"]
+    assert resolve_nt(second, "Verb", {"form": "3"})[0] in ("runs", "goes")
+
+def test_prefetch_keeps_pruned_contents(tmp_path):
+    first_path, _ = write_grammars(tmp_path)
+    registry = GrammarRegistry(byte_budget=10**9)
+    grammar = registry.get(first_path)
+    prune_nt_files(grammar, [("S", {})])
+    prefetch_nt_files(grammar)
+    compile_grammar(grammar)
+    assert verb_content(grammar) == {"1": ["run", "go"]}
@@ -0,0 +1,36 @@
+import io
+from random import Random
+
+from ..gram_parser import parse_file
+from ..optimizer import optimize_grammar
+from ..structures import resolve_nt
+
+GRAMMAR = """S:
+  "the" <Obj> <Tail>
+  <Pair> <Obj>
+
+Tail:
+  "and" <Name> <~Name> "."
+
+Pair:
+  <Obj> "x"
+
+Obj:
+  "cat"
+  "dog"
+
+Name:
+  "Al"
+  "Bo"
+"""
+
+def test_single_use_nonterminals_are_inlined():
+    grammar = parse_file(io.StringIO(GRAMMAR))
+    optimized, report = optimize_grammar(grammar, ["S"])
+    assert report.inlined_single_use == ["Tail"]
+    # inlining Pair would make its <Obj> share the resolution of the other <Obj>
+    assert {nt.name for nt in optimized} == {"S", "Pair", "Obj", "Name"}
+
+    sentences = {tuple(resolve_nt(grammar, "S", {}, Random(seed))) for seed in range(400)}
+    optimized_sentences = {tuple(resolve_nt(optimized, "S", {}, Random(seed))) for seed in range(400)}
+    assert sentences == optimized_sentences
@@ -0,0 +1,65 @@
+from random import Random
+
+from ..differential_testing import parse_text
+from ..recognizer import Recognizer
+from ..structures import resolve_nt
+
+GRAMMAR = """
+S:
+  <Subj> <Verb> <Obj> "."
+  with:
+    "1" | "3" => Subj.form
+    Subj.form => Verb.form
+
+Subj(form):
+  "I"
+  if form = "1"
+  from:
+    "he"
+    "she"
+  if form = "3"
+
+Verb(form):
+  "see"
+  if form = "1"
+  "sees"
+  if form = "3"
+
+Obj:
+  "it"
+  "them"
+  <Obj> "and" <Obj>
+"""
+
+def near_misses(sentence: list[str]):
+    """The sentence with one token dropped, or two neighbouring different tokens swapped"""
+    for i in range(len(sentence)):
+        yield sentence[:i] + sentence[i+1:]
+    for i in range(len(sentence) - 1):
+        if sentence[i] != sentence[i+1]:
+            yield sentence[:i] + [sentence[i+1], sentence[i]] + sentence[i+2:]
+
+def test_accepts_resolve_nt_output():
+    grammar = parse_text(GRAMMAR)
+    recognizer = Recognizer(grammar, "S", {})
+    rng = Random(5)
+    sentences = [resolve_nt(grammar, "S", {}, rng) for _ in range(200)]
+    assert all(recognizer.recognize_many(sentences))
+
+def test_rejects_near_misses():
+    grammar = parse_text(GRAMMAR)
+    recognizer = Recognizer(grammar, "S", {})
+    rng = Random(6)
+    for _ in range(100):
+        sentence = resolve_nt(grammar, "S", {}, rng)
+        for miss in near_misses(sentence):
+            assert not recognizer.recognize(miss), miss
+
+def test_rejects_broken_agreement_and_sharing():
+    recognizer = Recognizer(parse_text(GRAMMAR), "S", {})
+    assert recognizer.recognize(["I", "see", "it", "and", "it", "."])
+    assert not recognizer.recognize(["I", "sees", "it", "."])
+    assert not recognizer.recognize(["she", "see", "them", "."])
+    # both <Obj> of a pattern share one resolution
+    assert not recognizer.recognize(["he", "sees", "it", "and", "them", "."])
+    assert not recognizer.recognize([])
@@ -0,0 +1,30 @@
+import io
+from random import Random
+
+import pytest
+
+from ..gram_parser import parse_file
+from ..rendering import render_nt, render_range
+
+FAILING = 'S:\n  "hello" <B>\n\nB:\n  <C>\n'
+
+def test_failed_sentence_leaves_no_partial_line():
+    grammar = parse_file(io.StringIO(FAILING))
+    out = io.StringIO()
+    with pytest.raises(Exception):
+        render_range(grammar, "S", {}, out, seed=1, start=0, stop=3)
+    assert out.getvalue() == ""
+
+    buffer = bytearray()
+    with pytest.raises(Exception):
+        render_nt(grammar, "S", {}, buffer, rng=Random(0))
+    assert buffer == b""
+
+def test_sentences_before_a_failure_are_written():
+    grammar = parse_file(io.StringIO('S:\n  "hello" <B>\n\nB:\n  "world" "."\n  <C>\n'))
+    out = io.StringIO()
+    with pytest.raises(Exception):
+        render_range(grammar, "S", {}, out, seed=1, start=0, stop=50)
+    assert out.getvalue()
+    assert all(line == "Hello world." for line in out.getvalue().splitlines())
+    assert out.getvalue().endswith("\n")
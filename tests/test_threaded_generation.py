@@ -0,0 +1,62 @@
+import json
+import threading
+
+from ..differential_testing import parse_text
+from ..seeding import resolve_nt_range, thread_rng
+from ..structures import NtFile, resolve_nt
+from ..threaded_generation import generate_threaded
+
+GRAMMAR = """
+S:
+  <Name> <Verb> <~Name>
+  with:
+    "1" | "3" => Verb.form
+  "nobody"
+
+Name:
+  "Alice"
+  "Bob"
+  "Carol"
+
+Verb(form):
+  "see"
+  if form = "1"
+  "sees"
+  if form = "3"
+"""
+
+def test_thread_rng_is_per_thread():
+    rngs = []
+    threads = [threading.Thread(target=lambda: rngs.append((thread_rng(), thread_rng()))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(first is second for first, second in rngs)
+    assert len({id(first) for first, _ in rngs}) == 4
+    assert thread_rng() is thread_rng()
+
+def test_output_does_not_depend_on_thread_count():
+    grammar = parse_text(GRAMMAR)
+    expected = list(resolve_nt_range(grammar, "S", {}, "corpus", 0, 1000))
+    for threads in (1, 2, 3, 8):
+        assert generate_threaded(grammar, "S", {}, 1000, "corpus", threads=threads, chunk_size=64) == expected
+
+def test_fresh_grammar_is_shared_by_threads(tmp_path):
+    names_path = tmp_path / "names.json"
+    names_path.write_text(json.dumps({"order": ["..."], "content": ["Alice", "Bob"]}), encoding="utf-8")
+    grammar = parse_text(GRAMMAR.replace('Name:\n  "Alice"\n  "Bob"\n  "Carol"\n', f"Name -> {json.dumps(str(names_path))}\n"))
+    assert any(isinstance(nt, NtFile) for nt in grammar)
+    errors = []
+    def work():
+        try:
+            for _ in range(200):
+                resolve_nt(grammar, "S", {}, thread_rng())
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
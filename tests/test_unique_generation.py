@@ -0,0 +1,36 @@
+import io
+from random import Random
+
+from ..gram_parser import parse_file
+from ..unique_generation import SpillingHashSet, generate_unique
+
+GRAMMAR = 'S:\n  <~D> <~D> <~D>\n\nD:\n  "0"\n  "1"\n  "2"\n  "3"\n'
+
+def test_zero_sentences():
+    grammar = parse_file(io.StringIO(GRAMMAR))
+    assert list(generate_unique(grammar, "S", {}, 0, dedup="bloom")) == []
+    assert list(generate_unique(grammar, "S", {}, 0)) == []
+
+def test_seeded_generation_is_repeatable():
+    grammar = parse_file(io.StringIO(GRAMMAR))
+    first = list(generate_unique(grammar, "S", {}, 20, rng=Random(5)))
+    assert first == list(generate_unique(grammar, "S", {}, 20, rng=Random(5)))
+    assert len(set(map(tuple, first))) == 20
+
+def test_spilled_runs_are_merged(tmp_path):
+    seen = SpillingHashSet(memory_entries=4, directory=str(tmp_path), max_runs=3)
+    fingerprints = list(range(1, 100))
+    for fingerprint in fingerprints:
+        assert seen.add(fingerprint)
+    assert len(seen.runs) <= 3
+    assert all(fingerprint in seen for fingerprint in fingerprints)
+    assert not seen.add(50) and 1000 not in seen
+    assert len(seen) == len(fingerprints)
+    seen.close()
+
+def test_exhausted_generation_closes_spill_files(tmp_path):
+    grammar = parse_file(io.StringIO(GRAMMAR))
+    with generate_unique(grammar, "S", {}, 1000, memory_entries=8, spill_directory=str(tmp_path), exhaustion_window=200, rng=Random(2)) as sentences:
+        assert len(list(sentences)) == 64
+        assert sentences.report.exhausted
+    assert sentences.seen.runs == []
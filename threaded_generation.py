@@ -0,0 +1,76 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter
+
+from .seeding import resolve_nt_range
+from .structures import Nt, NtFile, as_grammar
+
+def gil_enabled() -> bool:
+    """False on a free-threaded interpreter with the GIL disabled"""
+    check = getattr(sys, "_is_gil_enabled", None)
+    return True if check is None else check()
+
+def generate_threaded(
+        nt_definitions: list[Nt],
+        nt_name: str,
+        params: dict[str, str],
+        count: int,
+        seed: int | str,
+        threads: int = 4,
+        chunk_size: int = 1000
+    ) -> list[list[str]]:
+    """Sentences 0 to count of the stream seed (see seeding), generated by a thread pool.\n
+    The grammar is shared by all threads: resolution only reads it, files are loaded once
+    and the environments are built once (see NtFile.load_once and Grammar.environments).
+    Every sentence gets its own generator from (seed, index), so the result does not
+    depend on the number of threads. Threads only run in parallel on a free-threaded Python."""
+    grammar = as_grammar(nt_definitions)
+    grammar.environments # built before the threads start, so they do not wait for each other
+    for nt in grammar:
+        if isinstance(nt, NtFile):
+            nt.load_once()
+    chunk = lambda start: list(resolve_nt_range(grammar, nt_name, params, seed, start, min(count, start + chunk_size)))
+    with ThreadPoolExecutor(threads) as pool:
+        chunks = pool.map(chunk, range(0, count, chunk_size))
+        return [sentence for sentences in chunks for sentence in sentences]
+
+#=================================
+@dataclass
+class ThreadScaling:
+    """Sentences per second for each number of threads"""
+    rates: dict[int, float] = field(default_factory=dict)
+    gil_enabled: bool = True
+
+    def lines(self) -> list[str]:
+        base = self.rates.get(1) or next(iter(self.rates.values()), 0.)
+        lines = [f"GIL enabled: {self.gil_enabled}"]
+        for threads, rate in self.rates.items():
+            lines.append(f"{threads:>3} threads: {rate:10.0f} sentences/s ({rate / base if base else 0:.2f}x)")
+        return lines
+
+    def __str__(self) -> str:
+        return "\n".join(self.lines())
+
+def benchmark_threads(
+        nt_definitions: list[Nt],
+        nt_name: str,
+        params: dict[str, str],
+        count: int,
+        thread_counts: list[int],
+        seed: int | str = 0
+    ) -> ThreadScaling:
+    """Throughput of generate_threaded for every number of threads.\n
+    Checks that every thread count produces the same sentences."""
+    scaling = ThreadScaling(gil_enabled=gil_enabled())
+    expected = None
+    for threads in thread_counts:
+        start = perf_counter()
+        sentences = generate_threaded(nt_definitions, nt_name, params, count, seed, threads)
+        elapsed = perf_counter() - start
+        if expected is None:
+            expected = sentences
+        elif sentences != expected:
+            raise AssertionError(f"benchmark_threads # {threads} threads generated different sentences")
+        scaling.rates[threads] = count / elapsed if elapsed > 0 else float("inf")
+    return scaling
@@ -0,0 +1,283 @@
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from hashlib import blake2b
+from heapq import merge
+from math import ceil, log
+import mmap
+import os
+import random
+from random import Random
+import tempfile
+from typing import Iterable, Iterator
+
+from .structures import Nt, as_grammar, resolve_nt
+
+#=================================
+# FINGERPRINTS
+def sentence_fingerprint(sentence: list[str]) -> int:
+    """64 bit hash of a sentence; never 0, which marks empty slots.\n
+    Terminals are separated by a unit separator, so ["a b"] and ["a", "b"] differ."""
+    digest = blake2b("\x1f".join(sentence).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+#=================================
+# DEDUPLICATION
+class CompactHashSet:
+    """Open addressing set of 64 bit fingerprints, 8 bytes per slot"""
+    def __init__(self, capacity: int = 1024):
+        size = 1
+        while size < 2 * capacity:
+            size *= 2
+        self.slots = array("Q", bytes(8 * size))
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _slot(self, fingerprint: int) -> int:
+        mask = len(self.slots) - 1
+        i = fingerprint & mask
+        while self.slots[i] != 0 and self.slots[i] != fingerprint:
+            i = (i + 1) & mask
+        return i
+
+    def __contains__(self, fingerprint: int) -> bool:
+        return self.slots[self._slot(fingerprint)] == fingerprint
+
+    def add(self, fingerprint: int) -> bool:
+        """Adds the fingerprint; returns whether it was new"""
+        i = self._slot(fingerprint)
+        if self.slots[i] == fingerprint:
+            return False
+        self.slots[i] = fingerprint
+        self.count += 1
+        if 2 * self.count > len(self.slots):
+            self._grow()
+        return True
+
+    def _grow(self):
+        old = self.slots
+        self.slots = array("Q", bytes(16 * len(old)))
+        for fingerprint in old:
+            if fingerprint:
+                self.slots[self._slot(fingerprint)] = fingerprint
+
+    def __iter__(self) -> Iterator[int]:
+        return (fingerprint for fingerprint in self.slots if fingerprint)
+
+    def nbytes(self) -> int:
+        return self.slots.itemsize * len(self.slots)
+
+class SpillingHashSet:
+    """CompactHashSet that writes its fingerprints as sorted runs to disk
+    once it holds memory_entries of them. Runs are searched through mmap;
+    when there are more than max_runs, they are merged into one."""
+    def __init__(self, memory_entries: int, directory: str | None = None, max_runs: int = 8):
+        self.memory_entries = memory_entries
+        self.directory  = directory
+        self.max_runs   = max_runs
+        self.memory     = CompactHashSet(memory_entries)
+        self.runs: list[tuple[mmap.mmap, memoryview]] = []
+        self.spilled    = 0
+
+    def __len__(self) -> int:
+        return len(self.memory) + self.spilled
+
+    def __contains__(self, fingerprint: int) -> bool:
+        if fingerprint in self.memory:
+            return True
+        for _, run in self.runs:
+            i = bisect_left(run, fingerprint)
+            if i < len(run) and run[i] == fingerprint:
+                return True
+        return False
+
+    def add(self, fingerprint: int) -> bool:
+        if fingerprint in self:
+            return False
+        self.memory.add(fingerprint)
+        if len(self.memory) >= self.memory_entries:
+            self.spill()
+        return True
+
+    def spill(self):
+        self.runs.append(self._write_run(sorted(self.memory)))
+        self.spilled += len(self.memory)
+        self.memory = CompactHashSet(self.memory_entries)
+        if len(self.runs) > self.max_runs:
+            # runs are disjoint, since only new fingerprints are added
+            merged = self._write_run(merge(*(run for _, run in self.runs)))
+            self.close()
+            self.runs = [merged]
+
+    def _write_run(self, fingerprints: Iterable[int]) -> tuple[mmap.mmap, memoryview]:
+        """Maps a sorted run, written memory_entries fingerprints at a time"""
+        with tempfile.TemporaryFile(dir=self.directory) as file:
+            chunk = array("Q")
+            for fingerprint in fingerprints:
+                chunk.append(fingerprint)
+                if len(chunk) == self.memory_entries:
+                    chunk.tofile(file)
+                    chunk = array("Q")
+            chunk.tofile(file)
+            file.flush()
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        # the mapping stays valid after the (unlinked) file is closed
+        return mapped, memoryview(mapped).cast("Q")
+
+    def close(self):
+        for mapped, run in self.runs:
+            run.release()
+            mapped.close()
+        self.runs = []
+
+    def nbytes(self) -> int:
+        return self.memory.nbytes()
+
+class BloomFilter:
+    """Fixed size filter; may take a new fingerprint for a known one
+    with probability error_rate once capacity fingerprints are added"""
+    def __init__(self, capacity: int, error_rate: float = 1e-6):
+        self.size   = max(8, ceil(-capacity * log(error_rate) / log(2) ** 2))
+        self.hashes = max(1, round(self.size / max(1, capacity) * log(2)))
+        self.bits   = bytearray(ceil(self.size / 8))
+        self.count  = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _positions(self, fingerprint: int) -> Iterator[int]:
+        # double hashing from the two halves of the fingerprint
+        low, high = fingerprint & 0xFFFFFFFF, (fingerprint >> 32) | 1
+        return ((low + i * high) % self.size for i in range(self.hashes))
+
+    def __contains__(self, fingerprint: int) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(fingerprint))
+
+    def add(self, fingerprint: int) -> bool:
+        new = False
+        for pos in self._positions(fingerprint):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+                new = True
+        self.count += new
+        return new
+
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+#=================================
+@dataclass
+class UniqueReport:
+    requested: int
+    generated: int = 0
+    attempts: int = 0
+    collisions: int = 0
+    exhausted: bool = False
+    dedup_bytes: int = 0
+
+    @property
+    def collision_rate(self) -> float:
+        if self.attempts == 0:
+            return 0.
+        return self.collisions / self.attempts
+
+class UniqueSentences:
+    """Iterator over distinct resolutions of one Nonterminal, see generate_unique.\n
+    `report` is updated while iterating. Spilled fingerprint files are closed when the
+    iteration ends, by close() or when used as a context manager."""
+    def __init__(
+            self,
+            nt_definitions: list[Nt],
+            nt_name: str,
+            params: dict[str, str],
+            n: int,
+            dedup: str,
+            memory_entries: int | None,
+            spill_directory: str | None,
+            bloom_error_rate: float,
+            exhaustion_window: int,
+            exhaustion_rate: float,
+            rng: Random = random
+        ):
+        self.nt_definitions = as_grammar(nt_definitions)
+        self.nt_name    = nt_name
+        self.params     = params
+        self.rng        = rng
+        self.report     = UniqueReport(n)
+        self.exhaustion_window  = exhaustion_window
+        self.exhaustion_rate    = exhaustion_rate
+        if dedup == "bloom":
+            self.seen = BloomFilter(n, bloom_error_rate)
+        elif dedup == "exact" and memory_entries is not None:
+            self.seen = SpillingHashSet(memory_entries, spill_directory)
+        elif dedup == "exact":
+            self.seen = CompactHashSet(min(n, 1 << 20))
+        else:
+            raise ValueError(f"generate_unique # unknown dedup method {dedup!r} (expected 'exact' or 'bloom')")
+
+    def __iter__(self) -> Iterator[list[str]]:
+        report = self.report
+        window_collisions = 0
+        window_attempts = 0
+        while report.generated < report.requested:
+            sentence = resolve_nt(self.nt_definitions, self.nt_name, self.params, self.rng)
+            report.attempts += 1
+            window_attempts += 1
+            if self.seen.add(sentence_fingerprint(sentence)):
+                report.generated += 1
+                yield sentence
+            else:
+                report.collisions += 1
+                window_collisions += 1
+            if window_attempts == self.exhaustion_window:
+                if window_collisions >= self.exhaustion_rate * window_attempts:
+                    # almost every sentence was seen before: the language is (nearly) used up
+                    report.exhausted = True
+                    break
+                window_collisions = 0
+                window_attempts = 0
+        report.dedup_bytes = self.seen.nbytes()
+        self.close()
+
+    def close(self):
+        if isinstance(self.seen, SpillingHashSet):
+            self.seen.close()
+
+    def __enter__(self) -> "UniqueSentences":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        if hasattr(self, "seen"):
+            self.close()
+
+def generate_unique(
+        nt_definitions: list[Nt],
+        nt_name: str,
+        params: dict[str, str],
+        n: int,
+        dedup: str = "exact",
+        memory_entries: int | None = None,
+        spill_directory: str | None = None,
+        bloom_error_rate: float = 1e-6,
+        exhaustion_window: int = 10_000,
+        exhaustion_rate: float = 0.99,
+        rng: Random = random
+    ) -> UniqueSentences:
+    """Yields up to n distinct resolutions of nt_name without keeping the sentences.\n
+    Sentences are deduplicated by 64 bit fingerprints:
+    - dedup="exact": compact hash set (8-16 bytes per sentence); with memory_entries set,
+      fingerprints beyond that are spilled to sorted files in spill_directory
+    - dedup="bloom": Bloom filter of fixed size for n sentences; with probability
+      bloom_error_rate per sentence a new sentence is dropped as duplicate\n
+    Stops early (report.exhausted) when a window of exhaustion_window attempts
+    has a collision rate of at least exhaustion_rate. All random choices are made with rng."""
+    return UniqueSentences(
+        nt_definitions, nt_name, params, n,
+        dedup, memory_entries, spill_directory, bloom_error_rate,
+        exhaustion_window, exhaustion_rate, rng
+    )